@@ -22,13 +22,16 @@ from src.helper import (
     evaluate_pair,
     plot_policy_models,
 )
-from src.data_loading import (
-    save_dataset,
-)
+from src.data_loading import save_dataset
 from src.data_generation import generate_all_algo_pairs
 from src.reward_learning import train_reward_model
 from src.policy_learning import train, change_reward_from_all_datasets
 
+# process-wide state lives in the modules the pipeline imports without "src."
+from data_loading import get_cache_stats
+from data_generation import get_segment_scoring_stats
+from utils import set_dry_run
+
 
 DEFAULT_ENV = "box-close-v2"
 DEFAULT_EXP_NAME = "exp00"
@@ -89,7 +92,7 @@ if __name__ == "__main__":
         "--reward_model_tag",
         type=str,
         default=DEFAULT_REWARD_MODEL_TAG,
-        help="Tag of reward model",
+        help="Tag of reward model, comma separated tags (00,01,02) train together",
     )
 
     parser.add_argument(
@@ -116,6 +119,19 @@ if __name__ == "__main__":
         ),
     )
 
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="List stages of functions 2-5 that would be recomputed, run nothing",
+    )
+    parser.add_argument(
+        "--score-ensemble-mode",
+        type=str,
+        default="sequential",
+        choices=["sequential", "vectorized", "process"],
+        help="How function 2 trains score model members (vectorized for CUDA)",
+    )
+
     # Parse arguments
     args = parser.parse_args()
     env_name = args.env
@@ -128,6 +144,11 @@ if __name__ == "__main__":
 
     print("main function started with args", args)
 
+    set_dry_run(args.dry_run)
+    if args.dry_run and function_number not in (2, 3, 4, 5):
+        print(f"Function {function_number} has no tracked artifacts, nothing to do")
+        function_number = 0
+
     # Execute function
     if function_number == 0:
         # Do nothing
@@ -211,7 +232,11 @@ if __name__ == "__main__":
         # Generate preference pairs
         print("Generating preference pairs", env_name, exp_name)
 
-        generate_all_algo_pairs(env_name=env_name, exp_name=exp_name)
+        generate_all_algo_pairs(
+            env_name=env_name,
+            exp_name=exp_name,
+            score_ensemble_mode=args.score_ensemble_mode,
+        )
     elif function_number == 3:
         # Train reward model
         print("Training reward model")
@@ -246,3 +271,6 @@ if __name__ == "__main__":
             pair_algo=pair_algo,
             reward_model_algo=reward_model_algo,
         )
+
+    print("file cache stats", get_cache_stats())
+    print("segment scoring stats", get_segment_scoring_stats())
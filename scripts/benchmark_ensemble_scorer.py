@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import torch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/")))
+
+from data_generation.score_ensemble import EnsembleScorer
+from data_generation.score_lstm import LSTMModel
+
+
+def sequential_scores(models, trajectory, lengths):
+    """
+    (E, B) scores of members evaluated one after another, as before EnsembleScorer
+    """
+    return torch.stack(
+        [model(trajectory, lengths).reshape(len(trajectory)) for model in models]
+    )
+
+
+def make_models(ensemble_size, obs_dim, act_dim, linear_loss, save_dir):
+    models = []
+    for i in range(ensemble_size):
+        model, _ = LSTMModel.initialize(
+            config={"obs_dim": obs_dim, "act_dim": act_dim},
+            path=os.path.join(save_dir, f"lstm_{i}.pth"),
+            linear_loss=linear_loss,
+        )
+        model.eval()
+        models.append(model)
+    return models
+
+
+def measure(function, repeat):
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start_time) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ensemble", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=1024)
+    parser.add_argument("--length", type=int, default=25)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    obs_dim, act_dim = 39, 4
+    trajectory = torch.randn(args.batch, args.length, obs_dim + act_dim)
+    lengths = torch.randint(1, args.length + 1, (args.batch,))
+
+    with tempfile.TemporaryDirectory() as save_dir, torch.no_grad():
+        for linear_loss in (False, True):
+            models = make_models(args.ensemble, obs_dim, act_dim, linear_loss, save_dir)
+            scorer = EnsembleScorer(models, stack=True)
+            assert scorer.stacked
+
+            for batch_lengths in (None, lengths):
+                expected = sequential_scores(models, trajectory, batch_lengths)
+                scores = scorer(trajectory, batch_lengths)
+                assert scores.shape == (args.ensemble, args.batch)
+                assert torch.allclose(scores, expected, rtol=1e-4, atol=1e-5), (
+                    (scores - expected).abs().max()
+                )
+
+        print("batched scores match sequential evaluation")
+
+        for batch_lengths, name in ((None, "fixed"), (lengths, "variable")):
+            sequential_time = measure(
+                lambda: sequential_scores(models, trajectory, batch_lengths),
+                args.repeat,
+            )
+            batched_time = measure(
+                lambda: scorer(trajectory, batch_lengths), args.repeat
+            )
+            print(
+                f"{name} length, ensemble: {args.ensemble}, batch: {args.batch}, "
+                f"sequential: {sequential_time * 1000:.1f}ms, "
+                f"batched: {batched_time * 1000:.1f}ms, "
+                f"speedup: {sequential_time / batched_time:.2f}x"
+            )
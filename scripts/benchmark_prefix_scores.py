@@ -0,0 +1,81 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import torch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/")))
+
+from data_generation.score_lstm import LSTMModel
+from data_generation.scored_pairs import get_unique_segments, score_segments
+from data_generation.sub_segments import get_window_pairs
+
+
+def make_models(ensemble_size, obs_dim, act_dim, linear_loss, save_dir):
+    models = []
+    for i in range(ensemble_size):
+        model, _ = LSTMModel.initialize(
+            config={"obs_dim": obs_dim, "act_dim": act_dim},
+            path=os.path.join(save_dir, f"lstm_{i}.pth"),
+            linear_loss=linear_loss,
+        )
+        models.append(model)
+    return models
+
+
+def measure(function, repeat):
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start_time) / repeat, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ensemble", type=int, default=3)
+    parser.add_argument("--pairs", type=int, default=1000)
+    parser.add_argument("--length", type=int, default=25)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+    obs_dim, act_dim = 39, 4
+    num_steps = args.pairs * args.length * 4
+
+    dataset = {
+        "observations": rng.standard_normal((num_steps, obs_dim), dtype=np.float32),
+        "actions": rng.standard_normal((num_steps, act_dim), dtype=np.float32),
+    }
+    starts = rng.integers(0, num_steps - args.length, (args.pairs, 2))
+    pairs = np.stack((starts, starts + args.length), axis=-1)
+
+    # 15 sub-windows per pair, as the cutting augmentation
+    segments, _ = get_unique_segments(get_window_pairs(pairs, num_splits=5))
+
+    with tempfile.TemporaryDirectory() as save_dir:
+        for linear_loss in (False, True):
+            models = make_models(args.ensemble, obs_dim, act_dim, linear_loss, save_dir)
+
+            window_time, expected = measure(
+                lambda: score_segments(dataset, segments, models, prefix=False),
+                args.repeat,
+            )
+            prefix_time, scores = measure(
+                lambda: score_segments(dataset, segments, models, prefix=True),
+                args.repeat,
+            )
+            assert torch.allclose(scores, expected, rtol=1e-4, atol=1e-5), (
+                (scores - expected).abs().max()
+            )
+
+            print(
+                f"linear_loss: {linear_loss}, segments: {len(segments)}, "
+                f"per window: {window_time * 1000:.1f}ms, "
+                f"prefix: {prefix_time * 1000:.1f}ms, "
+                f"speedup: {window_time / prefix_time:.2f}x"
+            )
+
+    print("prefix scores match per-window scores")
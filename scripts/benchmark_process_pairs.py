@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/")))
+
+from data_loading.load_data import process_pairs
+
+
+def legacy_process_pairs(dataset, pair):
+    """
+    per-pair structured array copy, as process_pairs did before vectorization
+    """
+    observations = dataset["observations"]
+    actions = dataset["actions"]
+
+    processed_data = []
+
+    for entry in pair:
+        s0_idx, s1_idx, mu = entry["s0"], entry["s1"], entry["mu"]
+
+        s0_obs = observations[s0_idx[0] : s0_idx[1]]
+        s0_act = actions[s0_idx[0] : s0_idx[1]]
+        s1_obs = observations[s1_idx[0] : s1_idx[1]]
+        s1_act = actions[s1_idx[0] : s1_idx[1]]
+
+        dtype_list = [
+            ("observations", "f4", (s0_obs.shape[1],)),
+            ("actions", "f4", (s0_act.shape[1],)),
+        ]
+        s0 = np.array(list(zip(s0_obs, s0_act)), dtype=dtype_list)
+        s1 = np.array(list(zip(s1_obs, s1_act)), dtype=dtype_list)
+
+        processed_data.append((s0, s1, mu))
+
+    return np.array(processed_data, dtype=[("s0", "O"), ("s1", "O"), ("mu", "f4")])
+
+
+def make_synthetic_data(num_steps, num_pairs, obs_dim, act_dim, length):
+    rng = np.random.default_rng(0)
+    dataset = {
+        "observations": rng.standard_normal((num_steps, obs_dim)).astype(np.float32),
+        "actions": rng.standard_normal((num_steps, act_dim)).astype(np.float32),
+    }
+
+    starts = rng.integers(0, num_steps - length, (num_pairs, 2))
+    pair = np.zeros(
+        num_pairs, dtype=[("s0", "i4", (2,)), ("s1", "i4", (2,)), ("mu", "f")]
+    )
+    pair["s0"] = np.stack([starts[:, 0], starts[:, 0] + length], axis=1)
+    pair["s1"] = np.stack([starts[:, 1], starts[:, 1] + length], axis=1)
+    pair["mu"] = rng.integers(0, 2, num_pairs)
+
+    return dataset, pair
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pairs", type=int, default=200000)
+    parser.add_argument("--steps", type=int, default=1000000)
+    parser.add_argument("--length", type=int, default=25)
+    args = parser.parse_args()
+
+    dataset, pair = make_synthetic_data(args.steps, args.pairs, 39, 4, args.length)
+
+    start_time = time.perf_counter()
+    legacy = legacy_process_pairs(dataset, pair)
+    legacy_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    processed = process_pairs(dataset, pair)
+    vectorized_time = time.perf_counter() - start_time
+
+    for i in np.random.default_rng(1).integers(0, args.pairs, 1000):
+        for key in ("s0", "s1"):
+            for field in ("observations", "actions"):
+                assert np.array_equal(legacy[i][key][field], processed[key][field][i])
+    assert np.array_equal(legacy["mu"], processed["mu"])
+
+    print(f"pairs: {args.pairs}, length: {args.length}")
+    print(f"legacy process_pairs: {legacy_time:.2f}s")
+    print(f"vectorized process_pairs: {vectorized_time:.2f}s")
+    print(f"speedup: {legacy_time / vectorized_time:.1f}x")
@@ -1,5 +1,15 @@
 from .generate_pairs import generate_all_algo_pairs
 from .score_rnn import RNNModel
 from .score_lstm import LSTMModel
+from .score_ensemble import EnsembleScorer
+from .scored_pairs import get_segment_scoring_stats
+from .utils import RewardPrefixIndex
 
-__all__ = ["generate_all_algo_pairs", "RNNModel", "LSTMModel"]
+__all__ = [
+    "generate_all_algo_pairs",
+    "get_segment_scoring_stats",
+    "RNNModel",
+    "LSTMModel",
+    "EnsembleScorer",
+    "RewardPrefixIndex",
+]
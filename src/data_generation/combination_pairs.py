@@ -0,0 +1,106 @@
+import numpy as np
+
+from data_generation.utils import make_feedback_pairs
+
+
+# upper bound of elements of one (rows, n) tile of score differences
+DEFAULT_TILE_ELEMENTS = 1 << 22
+
+
+def get_combination_count(n):
+    """
+    return number of (i, j), i < j, pairs of n items
+    """
+    return n * (n - 1) // 2
+
+
+def unrank_combinations(ranks, n):
+    """
+    return (i, j) arrays of ranks of itertools.combinations(range(n), 2) order
+    row i starts at rank i * (2n - i - 1) / 2
+    """
+    ranks = np.asarray(ranks, dtype=np.int64)
+
+    def row_start(i):
+        return i * (2 * n - i - 1) // 2
+
+    b = 2 * n - 1
+    i = np.floor((b - np.sqrt(np.maximum(b * b - 8 * ranks, 0))) / 2).astype(np.int64)
+    i = np.clip(i, 0, max(n - 2, 0))
+
+    # float rounding may leave i off by one
+    i -= row_start(i) > ranks
+    i += row_start(i + 1) <= ranks
+
+    j = ranks - row_start(i) + i + 1
+    return i, j
+
+
+def sample_combinations(n, sample_size, rng=None):
+    """
+    return (i, j) arrays of sample_size distinct i < j pairs drawn uniformly
+    from n items, combinations are never enumerated
+    """
+    rng = np.random.default_rng(rng)
+    ranks = rng.choice(get_combination_count(n), size=sample_size, replace=False)
+    return unrank_combinations(ranks, n)
+
+
+def sample_smoothed_pairs(segments, scores, sample_size, temperature=5, rng=None):
+    """
+    Sample pairs of scored segments, labeled by sigmoid of score difference.
+
+    Args:
+        segments: (n, 2) array of (start, end)
+        scores: (n,) array of segment scores
+        sample_size: int, number of distinct (i, j), i < j, combinations
+        temperature: float, mu = 1 / (1 + exp((score_i - score_j) / temperature))
+        rng: seed or np.random.Generator
+
+    Returns:
+        np array of ((int, int), (int, int), float): pairs of (segment_i, segment_j)
+    """
+    i, j = sample_combinations(len(scores), sample_size, rng=rng)
+    mu = 1 / (1 + np.exp((scores[i] - scores[j]) / temperature))
+    return make_feedback_pairs(np.stack((segments[i], segments[j]), axis=1), mu)
+
+
+def get_threshold_pairs(
+    segments, scores, threshold=5, tile_elements=DEFAULT_TILE_ELEMENTS
+):
+    """
+    All pairs of scored segments whose scores differ by more than threshold.
+
+    Args:
+        segments: (n, 2) array of (start, end)
+        scores: (n,) array of segment scores
+        threshold: float, minimum absolute score difference
+        tile_elements: int, number of score differences computed at once
+
+    Returns:
+        np array of ((int, int), (int, int), float): pairs of (segment_i, segment_j),
+        i < j in itertools.combinations order, mu is 1.0 if score_j > score_i
+    """
+    n = len(scores)
+    tile_rows = max(1, tile_elements // max(n, 1))
+
+    first_indices = []
+    second_indices = []
+
+    for row_start in range(0, n, tile_rows):
+        rows = np.arange(row_start, min(row_start + tile_rows, n))
+        columns = np.arange(row_start + 1, n)
+
+        # tile of score differences right of the diagonal, row-major like nC2
+        differences = np.abs(scores[None, columns] - scores[rows, None])
+        mask = (differences > threshold) & (columns[None, :] > rows[:, None])
+
+        tile_i, tile_j = np.nonzero(mask)
+        first_indices.append(rows[tile_i])
+        second_indices.append(columns[tile_j])
+
+    i = np.concatenate(first_indices) if first_indices else np.empty(0, np.int64)
+    j = np.concatenate(second_indices) if second_indices else np.empty(0, np.int64)
+
+    mu = np.where(scores[j] > scores[i], 1.0, 0.0)
+    return make_feedback_pairs(np.stack((segments[i], segments[j]), axis=1), mu)
@@ -1,6 +1,9 @@
 from typing import Literal
 import numpy as np
 
+from data_generation.sub_segments import as_pair_array, get_cut_ratios, split_pairs
+from data_generation.utils import RewardPrefixIndex, make_feedback_pairs
+from data_loading.pair_array import save_pair
 from utils import get_pair_path
 
 
@@ -23,102 +26,46 @@ def generate_and_save_cut_pairs(
         pairs: list of ((int, int), (int, int)),
     """
 
-    length = len(pairs)
-    cut_pairs = []
-    used_set = []
-    pair_index = 0
-
-    valid_feedback = 0
-
-    mu = mu_scale
-
-    while valid_feedback < length:
-        i0, i1 = pairs[pair_index]
-        used_set.append(i0)
-        used_set.append(i1)
-
-        s0, e0 = i0
-        s1, e1 = i1
-
-        if cut_type == "0.5":
-            ratio = 0.5
-        elif cut_type == "0.25":
-            ratio = 0.25
-        elif cut_type == "half-random":
-            ratio = np.random.uniform(0.25, 0.75)
-        elif cut_type == "random":
-            ratio = np.random.uniform(0.1, 0.9)
-        else:
-            raise ValueError(f"Invalid cut type: {cut_type}")
-
-        m0 = s0 + int((e0 - s0) * ratio)
-        m1 = s1 + int((e1 - s1) * ratio)
-
-        i0_head = (s0, m0)
-        i0_tail = (m0, e0)
-        i1_head = (s1, m1)
-        i1_tail = (m1, e1)
-
-        r0_head = np.sum(dataset["rewards"][s0:m0])
-        r0_tail = np.sum(dataset["rewards"][m0:e0])
-        r1_head = np.sum(dataset["rewards"][s1:m1])
-        r1_tail = np.sum(dataset["rewards"][m1:e1])
+    reward_index = RewardPrefixIndex.from_dataset(dataset)
 
-        r0 = r0_head + r0_tail
-        r1 = r1_head + r1_tail
-
-        is_total_better = r1 > r0
-        is_head_better = r1_head > r0_head
-        is_tail_better = r1_tail > r0_tail
-
-        # if total_better and head_better is different, valid feedback is 3
-        if is_head_better == is_tail_better:
-            valid_feedback += 2
-        else:
-            valid_feedback += 3
-
-        # append basic pairs
-        cut_pairs.append((i0, i1, 1.0 if is_total_better else 0.0))
-        cut_pairs.append((i0_head, i1_head, 1.0 if is_head_better else 0.0))
-        cut_pairs.append((i0_tail, i1_tail, 1.0 if is_tail_better else 0.0))
-
-        if (is_total_better == is_head_better) and (is_total_better == is_tail_better):
-            # 0, 0, 0 or 1, 1, 1
-            # cut_pairs.append((i0, i0_head, 1 - mu if is_total_better else mu))
-            # cut_pairs.append((i0, i0_tail, 1 - mu if is_total_better else mu))
-            # cut_pairs.append((i1, i1_head, mu if is_total_better else 1 - mu))
-            # cut_pairs.append((i1, i1_tail, mu if is_total_better else 1 - mu))
-            pass
-        else:
-            if is_total_better == is_head_better:
-                # 0, 0, 1 or 1, 1, 0
-                i0_same = i0_head
-                i0_diff = i0_tail
-                i1_same = i1_head
-                i1_diff = i1_tail
-            elif is_total_better == is_tail_better:
-                # 0, 1, 0 or 1, 0, 1
-                i0_same = i0_tail
-                i0_diff = i0_head
-                i1_same = i1_tail
-                i1_diff = i1_head
-            else:
-                # 0, 1, 1 or 1, 0, 0
-                print("Impossible case")
-                raise ValueError()
-
-            # same part is more powerful than total
-            # cut_pairs.append((i0, i0_same, 1 - mu if is_total_better else mu))
-            # cut_pairs.append((i0, i0_diff, 1.0 if is_total_better else 0.0))
-            # cut_pairs.append((i1, i1_same, mu if is_total_better else 1 - mu))
-            # cut_pairs.append((i1, i1_diff, 0.0 if is_total_better else 1.0))
-
-        pair_index += 1
+    length = len(pairs)
+    pairs = as_pair_array(pairs)
+
+    ratios = get_cut_ratios(cut_type, len(pairs))
+    heads, tails = split_pairs(pairs, ratios)
+
+    r0_head, r1_head = reward_index.pair_sums(heads[:, 0], heads[:, 1])
+    r0_tail, r1_tail = reward_index.pair_sums(tails[:, 0], tails[:, 1])
+
+    is_total_better = r1_head + r1_tail > r0_head + r0_tail
+    is_head_better = r1_head > r0_head
+    is_tail_better = r1_tail > r0_tail
+
+    # if total_better and head_better is different, valid feedback is 3
+    valid_feedbacks = np.cumsum(np.where(is_head_better == is_tail_better, 2, 3))
+
+    # pairs are used until valid feedback reaches length, 2 or more per pair
+    pair_index = int(np.searchsorted(valid_feedbacks, length)) + 1 if length else 0
+    valid_feedback = int(valid_feedbacks[pair_index - 1]) if pair_index else 0
+
+    used = slice(0, pair_index)
+    if np.any(
+        (is_head_better[used] == is_tail_better[used])
+        & (is_head_better[used] != is_total_better[used])
+    ):
+        # 0, 1, 1 or 1, 0, 0
+        print("Impossible case")
+        raise ValueError()
+
+    # basic pairs (total, head, tail) of each used pair
+    cut_pairs = np.stack((pairs[used], heads[used], tails[used]), axis=1)
+    mu = np.stack(
+        (is_total_better[used], is_head_better[used], is_tail_better[used]), axis=1
+    )
+    cut_pairs = cut_pairs.reshape(-1, 2, 2)
     print(length, valid_feedback, pair_index, len(cut_pairs))
 
-    pairs_np = np.array(
-        cut_pairs, dtype=[("s0", "i4", (2,)), ("s1", "i4", (2,)), ("mu", "f")]
-    )
+    pairs_np = make_feedback_pairs(cut_pairs, mu.reshape(-1))
 
     pair_path = get_pair_path(
         env_name=env_name,
@@ -126,6 +73,6 @@ def generate_and_save_cut_pairs(
         pair_type=pair_type,
         pair_algo=f"cut-{mu_scale}",
     )
-    np.savez(pair_path, data=pairs_np)
+    save_pair(pair_path, pairs_np)
     print(f"Preference pairs saved at {pair_path}")
-    return used_set
+    return pairs[used].reshape(-1, 2)
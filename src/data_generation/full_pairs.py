@@ -1,113 +1,77 @@
 import numpy as np
-import numpy.lib.recfunctions as rfn
 
+from data_generation.utils import RewardPrefixIndex
+from data_loading.pair_array import save_pair
 from utils import get_pair_path
 
 
-def get_pairs_by_mu_type(mu_type, pair_data, reward_info=(0, 1)):
+def get_mu_by_types(
+    mu_types, reward_sum_0, reward_sum_1, length_0, length_1, reward_info=(0, 1)
+):
     """
     Args:
-        mu_type: str, type of mu
-        pair_data: np.darray of,
-            ("s0", "i4", (2,)),
-            ("s1", "i4", (2,)),
-            ("rewards_0", "O"),
-            ("rewards_1", "O"),
+        mu_types: list of str, types of mu
+        reward_sum_0, reward_sum_1: np.darray of float, reward sum of each segment
+        length_0, length_1: np.darray of int, length of each segment
         reward_info: tuple, reward min and max
     Returns:
-        pair_data: np.darray of,
-            ("s0", "i4", (2,)),
-            ("s1", "i4", (2,)),
-            ("mu", "f"),
+        dict of mu_type -> np.darray of float, mu of each pair
+        terms shared by mu types are computed once
     """
     reward_min, reward_max = reward_info
-    rewards_0 = pair_data["rewards_0"]
-    rewards_1 = pair_data["rewards_1"]
-    reward_sum_0 = np.array([np.sum(rewards) for rewards in rewards_0])
-    reward_sum_1 = np.array([np.sum(rewards) for rewards in rewards_1])
-    normalized_rewards_0 = np.array(
-        [(rewards - reward_min) / (reward_max - reward_min) for rewards in rewards_0]
-    )
-    normalized_rewards_1 = np.array(
-        [(rewards - reward_min) / (reward_max - reward_min) for rewards in rewards_1]
-    )
-    normalized_reward_sum_0 = np.array(
-        [np.sum(rewards) + np.finfo(float).eps for rewards in normalized_rewards_0]
-    )
-    normalized_reward_sum_1 = np.array(
-        [np.sum(rewards) + np.finfo(float).eps for rewards in normalized_rewards_1]
-    )
+    reward_diff = reward_sum_1 - reward_sum_0
+
+    sigmoid_values = None
+    mu_by_type = {}
 
-    if mu_type == "binary":
-        mu_values = np.where(
-            reward_sum_0 > reward_sum_1,
-            0,
-            np.where(
-                reward_sum_0 < reward_sum_1,
-                1,
+    for mu_type in mu_types:
+        if mu_type == "binary":
+            mu_values = np.where(
+                reward_sum_0 > reward_sum_1,
+                0,
+                np.where(reward_sum_0 < reward_sum_1, 1, 0.5),
+            )
+        elif mu_type == "binary-with-0.5":
+            mu_values = np.where(
+                np.abs(reward_sum_0 - reward_sum_1) < 0.5 * length_0,
                 0.5,
-            ),
-        )
-        pair_data = rfn.append_fields(pair_data, "mu", mu_values, dtypes=float)
-    elif mu_type == "binary-with-0.5":
-        length_values = pair_data["s0"][:, 1] - pair_data["s0"][:, 0]
-        mu_values = np.where(
-            np.abs(reward_sum_0 - reward_sum_1) < 0.5 * length_values,
-            0.5,
-            np.where(reward_sum_0 > reward_sum_1, 0, 1),
-        )
-        pair_data = rfn.append_fields(pair_data, "mu", mu_values, dtypes=float)
-    elif mu_type == "minus-binary":
-        mu_values = np.where(reward_sum_0 < reward_sum_1, 0, 1)
-        pair_data = rfn.append_fields(pair_data, "mu", mu_values, dtypes=float)
-    elif mu_type == "random":
-        mu_values = np.random.uniform(0, 1, len(reward_sum_0))
-        pair_data = rfn.append_fields(pair_data, "mu", mu_values, dtypes=float)
-    elif mu_type == "continuous":
-        length_values = pair_data["s0"][:, 1] - pair_data["s0"][:, 0]
-        diff = (reward_sum_1 - reward_sum_0) / length_values
-        max_diff = np.max(np.abs(diff))
-        normalized_diff = diff / max_diff
-        mu_values = 0.5 + 0.5 * normalized_diff
-        pair_data = rfn.append_fields(pair_data, "mu", mu_values, dtypes=float)
-    elif mu_type == "sigmoid":
-        diff_values = reward_sum_1 - reward_sum_0
-        sigmoid_values = 1 / (1 + np.exp(-diff_values))
-        pair_data = rfn.append_fields(pair_data, "mu", sigmoid_values, dtypes=float)
-    elif mu_type == "sigmoid-0.1":
-        diff_values = reward_sum_1 - reward_sum_0
-        sigmoid_values = 1 / (1 + np.exp(-diff_values))
-        round_unit = 0.1
-        rounded_sigmoid_values = np.round(sigmoid_values / round_unit) * round_unit
-        pair_data = rfn.append_fields(
-            pair_data, "mu", rounded_sigmoid_values, dtypes=float
-        )
-    elif mu_type == "sigmoid-0.25":
-        diff_values = reward_sum_1 - reward_sum_0
-        sigmoid_values = 1 / (1 + np.exp(-diff_values))
-        round_unit = 0.25
-        rounded_sigmoid_values = np.round(sigmoid_values / round_unit) * round_unit
-        pair_data = rfn.append_fields(
-            pair_data, "mu", rounded_sigmoid_values, dtypes=float
-        )
-    elif mu_type == "sigmoid-0.5":
-        diff_values = reward_sum_1 - reward_sum_0
-        sigmoid_values = 1 / (1 + np.exp(-diff_values))
-        round_unit = 0.5
-        rounded_sigmoid_values = np.round(sigmoid_values / round_unit) * round_unit
-        pair_data = rfn.append_fields(
-            pair_data, "mu", rounded_sigmoid_values, dtypes=float
-        )
-    elif mu_type == "linear":
-        mu_values = normalized_reward_sum_1 / (
-            normalized_reward_sum_0 + normalized_reward_sum_1
-        )
-        pair_data = rfn.append_fields(pair_data, "mu", mu_values, dtypes=float)
+                np.where(reward_sum_0 > reward_sum_1, 0, 1),
+            )
+        elif mu_type == "minus-binary":
+            mu_values = np.where(reward_sum_0 < reward_sum_1, 0, 1)
+        elif mu_type == "random":
+            mu_values = np.random.uniform(0, 1, len(reward_sum_0))
+        elif mu_type == "continuous":
+            diff = reward_diff / length_0
+            mu_values = 0.5 + 0.5 * (diff / np.max(np.abs(diff)))
+        elif mu_type.startswith("sigmoid"):
+            if sigmoid_values is None:
+                sigmoid_values = 1 / (1 + np.exp(-reward_diff))
+
+            if mu_type == "sigmoid":
+                mu_values = sigmoid_values
+            elif mu_type in ("sigmoid-0.1", "sigmoid-0.25", "sigmoid-0.5"):
+                round_unit = float(mu_type.split("-")[1])
+                mu_values = np.round(sigmoid_values / round_unit) * round_unit
+            else:
+                raise ValueError(f"Invalid mu type: {mu_type}")
+        elif mu_type == "linear":
+            # sum of (reward - reward_min) / (reward_max - reward_min) over each segment
+            normalized_reward_sum_0 = (reward_sum_0 - length_0 * reward_min) / (
+                reward_max - reward_min
+            ) + np.finfo(float).eps
+            normalized_reward_sum_1 = (reward_sum_1 - length_1 * reward_min) / (
+                reward_max - reward_min
+            ) + np.finfo(float).eps
+            mu_values = normalized_reward_sum_1 / (
+                normalized_reward_sum_0 + normalized_reward_sum_1
+            )
+        else:
+            raise ValueError(f"Invalid mu type: {mu_type}")
 
-    pair_data = rfn.drop_fields(pair_data, "rewards_0")
-    pair_data = rfn.drop_fields(pair_data, "rewards_1")
+        mu_by_type[mu_type] = mu_values
 
-    return pair_data
+    return mu_by_type
 
 
 def generate_and_save_full_pairs(
@@ -126,44 +90,33 @@ def generate_and_save_full_pairs(
     reward_max = np.max(dataset["rewards"])
     reward_info = (reward_min, reward_max)
 
-    preference_pairs = []
-
-    for i0, i1 in pairs:
-        s0, e0 = i0
-        s1, e1 = i1
-        len0 = e0 - s0
-        len1 = e1 - s1
-        if len0 > len1:
-            e0 = s0 + len1
-        elif len0 < len1:
-            e1 = s1 + len0
-
-        rewards_0 = dataset["rewards"][s0:e0]
-        rewards_1 = dataset["rewards"][s1:e1]
-        preference_pairs.append(((s0, e0), (s1, e1), rewards_0, rewards_1))
-
-    preference_pairs_np = np.array(
-        preference_pairs,
-        dtype=[
-            ("s0", "i4", (2,)),
-            ("s1", "i4", (2,)),
-            ("rewards_0", "O"),
-            ("rewards_1", "O"),
-        ],
-    )
+    reward_index = RewardPrefixIndex.from_dataset(dataset)
 
-    for mu_type in mu_types:
-        pair_data = get_pairs_by_mu_type(
-            mu_type=mu_type,
-            pair_data=preference_pairs_np,
-            reward_info=reward_info,
-        )
+    s0 = np.array([i0 for i0, _ in pairs], dtype=np.int64).reshape(-1, 2)
+    s1 = np.array([i1 for _, i1 in pairs], dtype=np.int64).reshape(-1, 2)
+
+    # cut longer segment to have same length
+    min_length = np.minimum(s0[:, 1] - s0[:, 0], s1[:, 1] - s1[:, 0])
+    s0[:, 1] = s0[:, 0] + min_length
+    s1[:, 1] = s1[:, 0] + min_length
+
+    reward_sum_0, reward_sum_1 = reward_index.pair_sums(s0, s1)
+
+    mu_by_type = get_mu_by_types(
+        mu_types=mu_types,
+        reward_sum_0=reward_sum_0,
+        reward_sum_1=reward_sum_1,
+        length_0=min_length,
+        length_1=min_length,
+        reward_info=reward_info,
+    )
 
+    for mu_type, mu_values in mu_by_type.items():
         save_path = get_pair_path(
             env_name=env_name,
             exp_name=exp_name,
             pair_type=pair_type,
             pair_algo=f"full-{mu_type}",
         )
-        np.savez(save_path, data=pair_data)
+        save_pair(save_path, {"s0": s0, "s1": s1, "mu": mu_values})
         print(f"Preference pairs saved at {save_path}")
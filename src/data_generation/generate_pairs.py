@@ -8,19 +8,108 @@ from data_generation.utils import (
     generate_pairs_from_indices,
     generate_pairs_from_using_all,
 )
-from data_loading.load_data import load_dataset, load_pair
+from data_loading.load_data import get_dataset_paths, load_dataset, load_pair
+from utils import Stage, get_pair_path, get_score_model_path, report_dry_run
 
 
-def generate_all_algo_pairs(env_name, exp_name):
+def generate_all_algo_pairs(env_name, exp_name, score_ensemble_mode="sequential"):
     """
     generate all algo pairs with hard-coded values
+    raw, full and score pairs are stages, each recomputed only if its inputs changed
+    score_ensemble_mode is the ensemble_mode of train_ensemble, an execution choice
+    that is not part of the score stage params
     """
+    trajectory_length = 25
+    train_pairs_cnt = 500
+    val_pairs_cnt = 500
+    test_pairs_cnt = 500
+
+    full_mu_types = ["binary", "linear", "binary-with-0.5"]
+    score_pair_algo = "full-binary"
+    score_model = "lstm.exp"
+    score_aug_list = ["10000", "50000"]
+    score_ensemble_size = 5
+    score_num_epochs = 100
+
+    def pair_path(pair_type, pair_algo):
+        return get_pair_path(
+            env_name=env_name,
+            exp_name=exp_name,
+            pair_type=pair_type,
+            pair_algo=pair_algo,
+        )
+
+    dataset_path, _ = get_dataset_paths(env_name)
+    raw_paths = [
+        pair_path(pair_type, "raw")
+        for pair_type in ["train", "val", "test", "train_all"]
+    ]
+
+    # raw pairs are sampled, files made before manifests existed are kept
+    raw_stage = Stage(
+        "raw pairs",
+        outputs=raw_paths,
+        files=[dataset_path],
+        params={
+            "trajectory_length": trajectory_length,
+            "pairs_cnt": [train_pairs_cnt, val_pairs_cnt, test_pairs_cnt],
+        },
+        code=["data_generation/utils.py", "data_generation/raw_pairs.py"],
+        adopt_existing=True,
+    )
+    full_stage = Stage(
+        "full pairs",
+        outputs=[
+            pair_path(pair_type, f"full-{mu_type}")
+            for pair_type in ["train", "val"]
+            for mu_type in full_mu_types
+        ]
+        + [pair_path("test", "full-binary")],
+        files=[dataset_path] + raw_paths[:3],
+        params={"mu_types": full_mu_types},
+        code=["data_generation/full_pairs.py", "data_generation/utils.py"],
+    )
+    score_stage = Stage(
+        "score pairs",
+        outputs=[
+            pair_path(pair_type, f"{score_model}-{score_pair_algo}")
+            for pair_type in ["train", "val"]
+        ]
+        + [
+            pair_path(pair_type, f"{score_model}-aug-{aug}-{score_pair_algo}")
+            for aug in score_aug_list
+            for pair_type in ["train", "val"]
+        ]
+        + [
+            get_score_model_path(
+                env_name, exp_name, score_pair_algo, score_model, ensemble_num
+            )
+            for ensemble_num in range(score_ensemble_size)
+        ],
+        files=[
+            dataset_path,
+            raw_paths[3],
+            pair_path("train", score_pair_algo),
+            pair_path("val", score_pair_algo),
+        ],
+        params={
+            "pair_algo": score_pair_algo,
+            "score_model": score_model,
+            "aug_list": score_aug_list,
+            "ensemble_size": score_ensemble_size,
+            "num_epochs": score_num_epochs,
+        },
+        code=["data_generation", "data_loading"],
+        adopt_existing=True,
+    )
+
+    if report_dry_run([raw_stage, full_stage, score_stage]):
+        return
+
     dataset = load_dataset(env_name=env_name)
     indices = extract_trajectory_indices(dataset)
     np.random.shuffle(indices)
 
-    trajectory_length = 25
-
     # hard coded values
     if len(indices) >= 1800:
         train_trajectories_cnt = 1000
@@ -43,22 +132,7 @@ def generate_all_algo_pairs(env_name, exp_name):
         f"train_trajectories_cnt: {train_trajectories_cnt}, val_trajectories_cnt: {val_trajectories_cnt}, test_trajectories_cnt: {test_trajectories_cnt}"
     )
 
-    train_pairs_cnt = 500
-    val_pairs_cnt = 500
-    test_pairs_cnt = 500
-
-    try:
-        _ = load_pair(
-            env_name=env_name,
-            exp_name=exp_name,
-            pair_type="train",
-            pair_algo="raw",
-        )
-        is_already_exist = True
-    except FileNotFoundError:
-        is_already_exist = False
-
-    if is_already_exist:
+    if not raw_stage.needs_run():
         print("Raw Pair already exists, use it for generating")
 
         train_pairs_with_mu = load_pair(
@@ -86,23 +160,18 @@ def generate_all_algo_pairs(env_name, exp_name):
             pair_algo="raw",
         )
 
-        train_pairs = [
-            ((p["s0"][0], p["s0"][1]), (p["s1"][0], p["s1"][1]))
-            for p in train_pairs_with_mu
-        ]
-        val_pairs = [
-            ((p["s0"][0], p["s0"][1]), (p["s1"][0], p["s1"][1]))
-            for p in val_pairs_with_mu
-        ]
-        test_pairs = [
-            ((p["s0"][0], p["s0"][1]), (p["s1"][0], p["s1"][1]))
-            for p in test_pairs_with_mu
-        ]
+        train_pairs = np.stack(
+            (train_pairs_with_mu["s0"], train_pairs_with_mu["s1"]), axis=1
+        )
+        val_pairs = np.stack((val_pairs_with_mu["s0"], val_pairs_with_mu["s1"]), axis=1)
+        test_pairs = np.stack(
+            (test_pairs_with_mu["s0"], test_pairs_with_mu["s1"]), axis=1
+        )
 
-        all_traj_set = []
-        for p in train_all_pairs_with_mu:
-            all_traj_set.append(p[0])
-            all_traj_set.append(p[1])
+        # (s0, s1) of each pair in order
+        all_traj_set = np.stack(
+            (train_all_pairs_with_mu["s0"], train_all_pairs_with_mu["s1"]), axis=1
+        ).reshape(-1, 2)
 
     else:
         if (
@@ -170,51 +239,44 @@ def generate_all_algo_pairs(env_name, exp_name):
             pairs=train_all_pairs,
             raw_name="raw",
         )
+        raw_stage.record()
 
     # full
-    generate_and_save_full_pairs(
-        dataset=dataset,
-        env_name=env_name,
-        exp_name=exp_name,
-        pair_type="train",
-        pairs=train_pairs,
-        mu_types=[
-            "binary",
-            "linear",
-            "binary-with-0.5",
-        ],
-    )
-    generate_and_save_full_pairs(
-        dataset=dataset,
-        env_name=env_name,
-        exp_name=exp_name,
-        pair_type="val",
-        pairs=val_pairs,
-        mu_types=[
-            "binary",
-            "linear",
-            "binary-with-0.5",
-        ],
-    )
+    if full_stage.needs_run():
+        for pair_type, pairs in (("train", train_pairs), ("val", val_pairs)):
+            generate_and_save_full_pairs(
+                dataset=dataset,
+                env_name=env_name,
+                exp_name=exp_name,
+                pair_type=pair_type,
+                pairs=pairs,
+                mu_types=full_mu_types,
+            )
 
-    # test
-    generate_and_save_full_pairs(
-        dataset=dataset,
-        env_name=env_name,
-        exp_name=exp_name,
-        pair_type="test",
-        pairs=test_pairs,
-        mu_types=["binary"],
-    )
+        # test
+        generate_and_save_full_pairs(
+            dataset=dataset,
+            env_name=env_name,
+            exp_name=exp_name,
+            pair_type="test",
+            pairs=test_pairs,
+            mu_types=["binary"],
+        )
+        full_stage.record()
 
-    generate_score_pairs(
-        dataset=dataset,
-        env_name=env_name,
-        exp_name=exp_name,
-        num_epochs=100,
-        pair_algo="full-binary",
-        score_model="lstm.exp",
-        aug_list=["10000", "50000"],
-        traj_set=all_traj_set,
-        ensemble_size=5,
-    )
+    if score_stage.needs_run():
+        # score models of older inputs would be reused by train_ensemble
+        score_stage.remove_outputs()
+        generate_score_pairs(
+            dataset=dataset,
+            env_name=env_name,
+            exp_name=exp_name,
+            num_epochs=score_num_epochs,
+            pair_algo=score_pair_algo,
+            score_model=score_model,
+            aug_list=score_aug_list,
+            traj_set=all_traj_set,
+            ensemble_size=score_ensemble_size,
+            ensemble_mode=score_ensemble_mode,
+        )
+        score_stage.record()
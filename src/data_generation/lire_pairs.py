@@ -1,6 +1,8 @@
 from typing import Literal
 import numpy as np
 
+from data_generation.utils import RewardPrefixIndex
+from data_loading.pair_array import save_pair
 from utils import get_pair_path
 
 
@@ -24,26 +26,28 @@ def generate_and_save_lire_pairs(
         pairs: list of ((int, int), (int, int)),
     """
 
-    lire_pairs = []
+    reward_index = RewardPrefixIndex.from_dataset(dataset)
 
-    for i0, i1 in pairs:
-        sum_of_rewards_0 = np.sum(dataset["rewards"][i0[0] : i0[1]])
-        sum_of_rewards_1 = np.sum(dataset["rewards"][i1[0] : i1[1]])
-        if np.abs(sum_of_rewards_0 - sum_of_rewards_1) < threshold:
-            mu = 0.5
-        elif sum_of_rewards_0 < sum_of_rewards_1:
-            mu = 1.0
-        else:
-            mu = 0.0
+    s0 = np.array([i0 for i0, _ in pairs], dtype=np.int64).reshape(-1, 2)
+    s1 = np.array([i1 for _, i1 in pairs], dtype=np.int64).reshape(-1, 2)
+    sum_of_rewards_0, sum_of_rewards_1 = reward_index.pair_sums(s0, s1)
 
-        if mu == 0.5 and pair_algo == "without-0.5":
-            continue
+    mu = np.where(
+        np.abs(sum_of_rewards_0 - sum_of_rewards_1) < threshold,
+        0.5,
+        np.where(sum_of_rewards_0 < sum_of_rewards_1, 1.0, 0.0),
+    )
 
-        lire_pairs.append(((i0[0], i0[1]), (i1[0], i1[1]), mu))
+    if pair_algo == "without-0.5":
+        is_valid = mu != 0.5
+        s0, s1, mu = s0[is_valid], s1[is_valid], mu[is_valid]
 
-    pairs_np = np.array(
-        lire_pairs, dtype=[("s0", "i4", (2,)), ("s1", "i4", (2,)), ("mu", "f")]
+    pairs_np = np.zeros(
+        len(mu), dtype=[("s0", "i4", (2,)), ("s1", "i4", (2,)), ("mu", "f")]
     )
+    pairs_np["s0"] = s0
+    pairs_np["s1"] = s1
+    pairs_np["mu"] = mu
 
     pair_path = get_pair_path(
         env_name=env_name,
@@ -51,4 +55,4 @@ def generate_and_save_lire_pairs(
         pair_type=pair_type,
         pair_algo=f"lire-{pair_algo}",
     )
-    np.savez(pair_path, data=pairs_np)
+    save_pair(pair_path, pairs_np)
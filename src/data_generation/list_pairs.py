@@ -1,5 +1,7 @@
 import numpy as np
 
+from data_generation.utils import RewardPrefixIndex
+from data_loading.pair_array import save_pair
 from utils import get_pair_path
 
 
@@ -10,24 +12,20 @@ def divide_into_groups(trajectories, num_group):
         ("end", "i4"),
         ("sum_of_rewards", "f"),
         ("group_index", "i4"),
+    sorted by sum_of_rewards, ties broken by start and end
     """
-    sorted_trajectories = np.sort(trajectories, order="sum_of_rewards")
+    order = np.lexsort(
+        (trajectories["end"], trajectories["start"], trajectories["sum_of_rewards"])
+    )
+    sorted_trajectories = trajectories[order]
 
+    # group i holds sorted ranks [floor(i * group_size), floor((i + 1) * group_size))
     group_size = len(sorted_trajectories) / num_group
-    result = []
-
-    for i in range(num_group):
-        start_idx = int(np.floor(i * group_size))
-        end_idx = (
-            int(np.floor((i + 1) * group_size))
-            if i < num_group - 1
-            else len(sorted_trajectories)
-        )
-        for traj in sorted_trajectories[start_idx:end_idx]:
-            result.append((*traj, i))
+    group_starts = np.floor(np.arange(num_group) * group_size)
+    ranks = np.arange(len(sorted_trajectories))
 
-    return np.array(
-        result,
+    result = np.zeros(
+        len(sorted_trajectories),
         dtype=[
             ("start", int),
             ("end", int),
@@ -35,6 +33,19 @@ def divide_into_groups(trajectories, num_group):
             ("group_index", int),
         ],
     )
+    result["start"] = sorted_trajectories["start"]
+    result["end"] = sorted_trajectories["end"]
+    result["sum_of_rewards"] = sorted_trajectories["sum_of_rewards"]
+    result["group_index"] = np.searchsorted(group_starts, ranks, side="right") - 1
+
+    return result
+
+
+def get_segment_keys(starts, ends):
+    """
+    return int64 key of each (start, end), starts and ends are below 2**31
+    """
+    return (np.asarray(starts, dtype=np.int64) << 32) | np.asarray(ends, dtype=np.int64)
 
 
 def generate_pairs(trajectory_pairs, trajectories_with_groups, num_group):
@@ -54,29 +65,40 @@ def generate_pairs(trajectory_pairs, trajectories_with_groups, num_group):
             ("s1", "i4", (2,)),
             ("mu", "f"),
     """
-    pairs = []
-
-    for i0, i1 in trajectory_pairs:
-        # search trajectory_with_groups with start=s0, end=e0
-        s0, e0 = i0
-        traj0 = trajectories_with_groups[
-            (trajectories_with_groups["start"] == s0)
-            & (trajectories_with_groups["end"] == e0)
-        ][0]
-        traj1 = trajectories_with_groups[
-            (trajectories_with_groups["start"] == i1[0])
-            & (trajectories_with_groups["end"] == i1[1])
-        ][0]
-
-        group_diff = (traj1["group_index"] - traj0["group_index"]) / (num_group - 1)
-        mu = group_diff * 0.5 + 0.5
-
-        pairs.append(
-            ((traj0["start"], traj0["end"]), (traj1["start"], traj1["end"]), mu)
+    trajectory_pairs = np.asarray(trajectory_pairs, dtype=np.int64).reshape(-1, 2, 2)
+
+    # sorted keys of trajectories, a trajectory listed more than once
+    # takes the group of its first entry
+    keys, first_index = np.unique(
+        get_segment_keys(
+            trajectories_with_groups["start"], trajectories_with_groups["end"]
+        ),
+        return_index=True,
+    )
+    group_indices = trajectories_with_groups["group_index"][first_index]
+
+    group_0 = group_indices[
+        np.searchsorted(
+            keys, get_segment_keys(trajectory_pairs[:, 0, 0], trajectory_pairs[:, 0, 1])
         )
+    ]
+    group_1 = group_indices[
+        np.searchsorted(
+            keys, get_segment_keys(trajectory_pairs[:, 1, 0], trajectory_pairs[:, 1, 1])
+        )
+    ]
+
+    group_diff = (group_1 - group_0) / (num_group - 1)
 
-    # Typed numpy array로 반환
-    return np.array(pairs, dtype=[("s0", "i4", (2,)), ("s1", "i4", (2,)), ("mu", "f")])
+    pairs = np.zeros(
+        len(trajectory_pairs),
+        dtype=[("s0", "i4", (2,)), ("s1", "i4", (2,)), ("mu", "f")],
+    )
+    pairs["s0"] = trajectory_pairs[:, 0]
+    pairs["s1"] = trajectory_pairs[:, 1]
+    pairs["mu"] = group_diff * 0.5 + 0.5
+
+    return pairs
 
 
 def generate_and_save_list_pairs(
@@ -97,34 +119,22 @@ def generate_and_save_list_pairs(
         group_nums: list of int,
     """
     # make same length of all trajectories
-    all_trajectories = []
-    for t0, t1 in pairs:
-        all_trajectories.append(t0)
-        all_trajectories.append(t1)
-
-    min_length = np.min([e - s for s, e in all_trajectories])
-
-    new_pairs = []
-    new_trajectories = []
-
-    for i0, i1 in pairs:
-        s0, e0 = i0
-        s1, e1 = i1
-
-        e0 = s0 + min_length
-        e1 = s1 + min_length
-
-        new_pairs.append(((s0, e0), (s1, e1)))
+    new_pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2, 2).copy()
+    min_length = np.min(new_pairs[:, :, 1] - new_pairs[:, :, 0])
+    new_pairs[:, :, 1] = new_pairs[:, :, 0] + min_length
 
-    for s, e in all_trajectories:
-        e = s + min_length
-        sum_of_rewards = np.sum(dataset["rewards"][s:e])
-        new_trajectories.append((s, e, sum_of_rewards))
+    starts = new_pairs[:, :, 0].reshape(-1)
+    ends = starts + min_length
 
-    new_trajectories = np.array(
-        new_trajectories,
+    new_trajectories = np.zeros(
+        len(starts),
         dtype=[("start", int), ("end", int), ("sum_of_rewards", float)],
     )
+    new_trajectories["start"] = starts
+    new_trajectories["end"] = ends
+    new_trajectories["sum_of_rewards"] = RewardPrefixIndex.from_dataset(
+        dataset
+    ).segment_sums(starts, ends)
 
     # group num_pairs into M groups, with is defined by pair_algos
     for num_group in num_groups:
@@ -143,5 +153,5 @@ def generate_and_save_list_pairs(
             pair_algo=f"list-{num_group}",
         )
 
-        np.savez(save_path, data=pairs)
+        save_pair(save_path, pairs)
         print("finish saving preference pair", save_path)
@@ -1,5 +1,6 @@
 import numpy as np
 
+from data_loading.pair_array import save_pair
 from utils import get_pair_path
 
 
@@ -36,5 +37,5 @@ def save_raw_pairs(
         pair_type=pair_type,
         pair_algo=raw_name,
     )
-    np.savez(pair_path, data=pairs_np)
+    save_pair(pair_path, pairs_np)
     print(f"Preference pairs saved at {pair_path}")
@@ -5,6 +5,8 @@ import torch.nn as nn
 import torch.optim as optim
 from tqdm import tqdm
 
+from data_loading import batch_to_device
+
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 
@@ -87,7 +89,7 @@ class EncoderModel(torch.nn.Module):
                     mu_batch,
                     _,
                     _,
-                ) = [x.to(device) for x in batch]
+                ) = batch_to_device(batch, device)
 
                 s0_batch = torch.cat((s0_obs_batch, s0_act_batch), dim=-1)
                 s1_batch = torch.cat((s1_obs_batch, s1_act_batch), dim=-1)
@@ -130,7 +132,7 @@ class EncoderModel(torch.nn.Module):
                     mu_batch,
                     _,
                     _,
-                ) = [x.to(device) for x in batch]
+                ) = batch_to_device(batch, device)
 
                 s0_batch = torch.cat((s0_obs_batch, s0_act_batch), dim=-1)
                 s1_batch = torch.cat((s1_obs_batch, s1_act_batch), dim=-1)
@@ -0,0 +1,414 @@
+import csv
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.optim as optim
+from tqdm import tqdm
+
+from data_generation.score_lstm import LSTMModel
+from data_loading import batch_to_device, mask_to_lengths
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def to_stacked_layout(weight_ih, weight_hh, bias_ih, bias_hh):
+    """
+    Convert stacked nn.LSTM parameters of shape (E, 4H, D), (E, 4H, H), (E, 4H)
+    to (D, E * 4H) input weight, (E * 4H) bias and (E, H, 4H) hidden weight
+    gates (input, forget, cell, output) are reordered to (input, forget, output, cell)
+    so one sigmoid covers the first 3H
+    """
+    hidden_dim = weight_hh.shape[-1]
+    gate_order = torch.cat(
+        (
+            torch.arange(0, 2 * hidden_dim),
+            torch.arange(3 * hidden_dim, 4 * hidden_dim),
+            torch.arange(2 * hidden_dim, 3 * hidden_dim),
+        )
+    ).to(weight_ih.device)
+
+    weight_ih = weight_ih[:, gate_order].transpose(1, 2)
+    weight_ih = weight_ih.permute(1, 0, 2).reshape(weight_ih.shape[1], -1)
+    bias = (bias_ih + bias_hh)[:, gate_order].reshape(-1)
+    weight_hh = weight_hh[:, gate_order].transpose(1, 2)
+
+    return weight_ih, bias, weight_hh
+
+
+def stacked_lstm(
+    trajectory, lengths, weight_ih, bias, weight_hh, return_sequences=False
+):
+    """
+    Run E single-layer LSTMs in parameters of to_stacked_layout over the same batch
+    return (E, B, H) hidden state of the last valid step of each segment
+    or (E, B, T, H) hidden states of every step if return_sequences, 0 past lengths
+    """
+    ensemble_size, hidden_dim, _ = weight_hh.shape
+    batch_size, max_len, _ = trajectory.shape
+
+    if lengths is not None:
+        # sorted by length, only the first batch_sizes[t] segments run at step t
+        lengths = lengths.to(trajectory.device)
+        order = torch.argsort(lengths, descending=True)
+        trajectory = trajectory[order]
+        steps = torch.arange(max_len, device=trajectory.device)
+        batch_sizes = (lengths[order][None, :] > steps[:, None]).sum(dim=1)
+        batch_sizes = batch_sizes.tolist()
+    else:
+        batch_sizes = [batch_size] * max_len
+
+    h = trajectory.new_zeros(ensemble_size, batch_size, hidden_dim)
+    c = trajectory.new_zeros(ensemble_size, batch_size, hidden_dim)
+    if return_sequences:
+        h_steps = trajectory.new_zeros(ensemble_size, batch_size, max_len, hidden_dim)
+
+    for t, n in enumerate(batch_sizes):
+        if n == 0:
+            break
+
+        input_gates = torch.addmm(bias, trajectory[:n, t], weight_ih)
+        gates = torch.bmm(h[:, :n], weight_hh)
+        gates = gates + input_gates.view(n, ensemble_size, -1).transpose(0, 1)
+
+        ifo = torch.sigmoid(gates[..., : 3 * hidden_dim])
+        g = torch.tanh(gates[..., 3 * hidden_dim :])
+        i = ifo[..., :hidden_dim]
+        f = ifo[..., hidden_dim : 2 * hidden_dim]
+        o = ifo[..., 2 * hidden_dim :]
+
+        c_t = f * c[:, :n] + i * g
+        h_t = o * torch.tanh(c_t)
+        if return_sequences:
+            h_steps[:, :n, t] = h_t
+
+        # finished segments keep the hidden state of their last step
+        if n == batch_size:
+            h, c = h_t, c_t
+        else:
+            h = torch.cat((h_t, h[:, n:]), dim=1)
+            c = torch.cat((c_t, c[:, n:]), dim=1)
+
+    if return_sequences:
+        h = h_steps
+
+    if lengths is not None:
+        h = h[:, torch.argsort(order)]
+
+    return h
+
+
+def stacked_fc(h, fc_weight, fc_bias, linear_loss):
+    """
+    return (E, B) scores of (E, B, H) hidden states with (E, H) weight, (E,) bias
+    """
+    score = torch.baddbmm(fc_bias.view(-1, 1, 1), h, fc_weight.unsqueeze(-1))
+    score = score.squeeze(-1)
+    if linear_loss:
+        score = 1 + torch.tanh(score)
+    return score
+
+
+class EnsembleScorer(nn.Module):
+    """
+    Scores a batch of segments with every member of an ensemble at once
+    LSTMModel members run as one LSTM with parameters stacked on the ensemble dim,
+    other models are evaluated one after another
+    returns (E, B) scores on the device of the members
+
+    prefix_scores needs every member to be an LSTMModel, see supports_prefix
+
+    stack=None stacks CUDA members only, on CPU the fused nn.LSTM kernel of each
+    member is as fast as the stacked one
+    """
+
+    def __init__(self, models, stack=None):
+        super(EnsembleScorer, self).__init__()
+        self.models = models
+
+        if stack is None:
+            stack = all(
+                next(model.parameters()).device.type == "cuda" for model in models
+            )
+
+        self.stacked = stack and len(models) > 0 and all(
+            isinstance(model, LSTMModel)
+            and model.lstm.num_layers == 1
+            and model.linear_loss == models[0].linear_loss
+            and model.hidden_dim == models[0].hidden_dim
+            for model in models
+        )
+
+        self.supports_prefix = len(models) > 0 and all(
+            isinstance(model, LSTMModel) for model in models
+        )
+
+        if not self.stacked:
+            return
+
+        self.linear_loss = models[0].linear_loss
+
+        with torch.no_grad():
+            weight_ih, bias, weight_hh = to_stacked_layout(
+                torch.stack([model.lstm.weight_ih_l0 for model in models]),
+                torch.stack([model.lstm.weight_hh_l0 for model in models]),
+                torch.stack([model.lstm.bias_ih_l0 for model in models]),
+                torch.stack([model.lstm.bias_hh_l0 for model in models]),
+            )
+            self.register_buffer("weight_ih", weight_ih)
+            self.register_buffer("bias", bias)
+            self.register_buffer("weight_hh", weight_hh)
+            self.register_buffer(
+                "fc_weight", torch.stack([model.fc.weight[0] for model in models])
+            )
+            self.register_buffer(
+                "fc_bias", torch.stack([model.fc.bias[0] for model in models])
+            )
+
+    def forward(self, trajectory, lengths=None):
+        if not self.stacked:
+            return torch.stack(
+                [
+                    model(trajectory, lengths).reshape(len(trajectory))
+                    for model in self.models
+                ]
+            )
+
+        h = stacked_lstm(trajectory, lengths, self.weight_ih, self.bias, self.weight_hh)
+        return stacked_fc(h, self.fc_weight, self.fc_bias, self.linear_loss)
+
+    def prefix_scores(self, trajectory, lengths=None):
+        """
+        return (E, B, T) scores of every prefix trajectory[:, : t + 1]
+        each segment costs one recurrent pass, scores past lengths are 0
+        """
+        if not self.stacked:
+            return torch.stack(
+                [model.prefix_scores(trajectory, lengths) for model in self.models]
+            )
+
+        batch_size, max_len, _ = trajectory.shape
+        h = stacked_lstm(
+            trajectory,
+            lengths,
+            self.weight_ih,
+            self.bias,
+            self.weight_hh,
+            return_sequences=True,
+        )
+        score = stacked_fc(
+            h.flatten(1, 2), self.fc_weight, self.fc_bias, self.linear_loss
+        ).view(-1, batch_size, max_len)
+
+        if lengths is not None:
+            steps = torch.arange(max_len, device=score.device)
+            score = score * (steps[None, :] < lengths.to(score.device)[:, None])
+
+        return score
+
+
+class EnsembleLSTMModel(nn.Module):
+    """
+    LSTMModel members with parameters stacked on the ensemble dim, trained together
+    member i is trained on pairs outside fold folds[i] and validated on that fold
+    """
+
+    @staticmethod
+    def initialize(config, paths, folds, linear_loss=False):
+        lr = config.get("lr", 0.001)
+
+        members = [
+            LSTMModel(
+                config={
+                    "obs_dim": config.get("obs_dim"),
+                    "act_dim": config.get("act_dim"),
+                    "hidden_size": config.get("hidden_size", 256),
+                },
+                path=path,
+                linear_loss=linear_loss,
+            )
+            for path in paths
+        ]
+
+        model = EnsembleLSTMModel(members, folds).to(device)
+        optimizer = optim.Adam(model.parameters(), lr=lr)
+        return model, optimizer
+
+    def __init__(self, members, folds):
+        super(EnsembleLSTMModel, self).__init__()
+
+        self.linear_loss = members[0].linear_loss
+        self.paths = [member.path for member in members]
+        self.log_paths = [member.log_path for member in members]
+        self.register_buffer("folds", torch.as_tensor(folds, dtype=torch.long))
+
+        # parameters of every member stacked, initialized as LSTMModel does
+        with torch.no_grad():
+            self.weight_ih = nn.Parameter(
+                torch.stack([member.lstm.weight_ih_l0 for member in members])
+            )
+            self.weight_hh = nn.Parameter(
+                torch.stack([member.lstm.weight_hh_l0 for member in members])
+            )
+            self.bias_ih = nn.Parameter(
+                torch.stack([member.lstm.bias_ih_l0 for member in members])
+            )
+            self.bias_hh = nn.Parameter(
+                torch.stack([member.lstm.bias_hh_l0 for member in members])
+            )
+            self.fc_weight = nn.Parameter(
+                torch.stack([member.fc.weight[0] for member in members])
+            )
+            self.fc_bias = nn.Parameter(
+                torch.stack([member.fc.bias[0] for member in members])
+            )
+
+    def forward(self, trajectory, lengths=None):
+        weight_ih, bias, weight_hh = to_stacked_layout(
+            self.weight_ih, self.weight_hh, self.bias_ih, self.bias_hh
+        )
+        h = stacked_lstm(trajectory, lengths, weight_ih, bias, weight_hh)
+        return stacked_fc(h, self.fc_weight, self.fc_bias, self.linear_loss)
+
+    def member_state_dict(self, member_num):
+        """
+        return state dict of one member, loadable by LSTMModel
+        """
+        return {
+            "lstm.weight_ih_l0": self.weight_ih[member_num].detach().clone(),
+            "lstm.weight_hh_l0": self.weight_hh[member_num].detach().clone(),
+            "lstm.bias_ih_l0": self.bias_ih[member_num].detach().clone(),
+            "lstm.bias_hh_l0": self.bias_hh[member_num].detach().clone(),
+            "fc.weight": self.fc_weight[member_num].detach().clone().unsqueeze(0),
+            "fc.bias": self.fc_bias[member_num].detach().clone().unsqueeze(0),
+        }
+
+    def pair_losses(self, batch):
+        """
+        return (E, B) loss of every member on every pair of batch
+        """
+        (
+            s0_obs_batch,
+            s0_act_batch,
+            s1_obs_batch,
+            s1_act_batch,
+            mu_batch,
+            mask0_batch,
+            mask1_batch,
+        ) = batch_to_device(batch, device)
+
+        # s0 and s1 segments run through one forward
+        segment_batch = torch.cat(
+            (
+                torch.cat((s0_obs_batch, s0_act_batch), dim=-1),
+                torch.cat((s1_obs_batch, s1_act_batch), dim=-1),
+            )
+        )
+        if mask0_batch is None:
+            lengths = None
+        else:
+            lengths = mask_to_lengths(torch.cat((mask0_batch, mask1_batch)))
+
+        score_s0, score_s1 = self.forward(segment_batch, lengths).chunk(2, dim=1)
+
+        if self.linear_loss:
+            prob_s1_wins = score_s1 / (score_s0 + score_s1 + 1e-6)
+        else:
+            prob_s1_wins = torch.sigmoid(score_s1 - score_s0)
+
+        return F.binary_cross_entropy(
+            prob_s1_wins, mu_batch.expand_as(prob_s1_wins), reduction="none"
+        )
+
+    def evaluate(self, pair_dataset, pair_folds, batch_size=1024):
+        """
+        return (E,) mean loss of each member on the pairs of its fold
+        """
+        self.eval()
+        loss_sum = torch.zeros(len(self.folds), device=device)
+        count = torch.zeros(len(self.folds), device=device)
+
+        with torch.no_grad():
+            for start in range(0, len(pair_dataset), batch_size):
+                end = min(start + batch_size, len(pair_dataset))
+                indices = torch.arange(start, end)
+                val_mask = self.get_fold_mask(pair_folds[indices])
+
+                losses = self.pair_losses(pair_dataset.get_batch(indices))
+                loss_sum += (losses * val_mask).sum(dim=1)
+                count += val_mask.sum(dim=1)
+
+        return loss_sum / count.clamp(min=1)
+
+    def get_fold_mask(self, batch_folds):
+        """
+        return (E, B) float mask, 1 where the pair is in the fold of the member
+        """
+        return (batch_folds.to(device)[None, :] == self.folds[:, None]).float()
+
+    def train_model(
+        self,
+        optimizer,
+        pair_dataset,
+        pair_folds,
+        num_epochs=10,
+        batch_size=32,
+    ):
+        """
+        Train every member on shared shuffled batches of pair_dataset
+        each member only learns from pairs outside its fold, pair_folds[i] is
+        the fold of pair i, and the best member checkpoints are saved
+        as LSTMModel state dicts
+        """
+        for log_path in self.log_paths:
+            with open(log_path, mode="w", newline="", encoding="utf-8") as file:
+                writer = csv.writer(file)
+                writer.writerow(["Epoch", "Train Loss", "Validation Loss"])
+
+        ensemble_size = len(self.folds)
+        min_val_loss = [float("inf")] * ensemble_size
+
+        # members skip pairs of their own fold, shared batches are enlarged so
+        # each member still sees about batch_size pairs per step
+        num_folds = int(pair_folds.max()) + 1
+        if num_folds > 1:
+            batch_size = batch_size * num_folds // (num_folds - 1)
+        num_batches = len(pair_dataset) // batch_size
+
+        for epoch in tqdm(range(num_epochs), desc="learning score ensemble"):
+            self.train()
+            epoch_loss = torch.zeros(ensemble_size, device=device)
+            order = torch.randperm(len(pair_dataset))
+
+            for batch_num in range(num_batches):
+                indices = order[batch_num * batch_size : (batch_num + 1) * batch_size]
+                train_mask = 1 - self.get_fold_mask(pair_folds[indices])
+
+                losses = self.pair_losses(pair_dataset.get_batch(indices))
+                member_loss = (losses * train_mask).sum(dim=1) / train_mask.sum(
+                    dim=1
+                ).clamp(min=1)
+
+                optimizer.zero_grad()
+                # members share no parameters, the sum trains each on its own loss
+                member_loss.sum().backward()
+                optimizer.step()
+
+                epoch_loss += member_loss.detach()
+
+            avg_epoch_loss = (epoch_loss / max(num_batches, 1)).tolist()
+            val_loss = self.evaluate(pair_dataset, pair_folds).tolist()
+
+            for member_num in range(ensemble_size):
+                if val_loss[member_num] < min_val_loss[member_num]:
+                    min_val_loss[member_num] = val_loss[member_num]
+                    torch.save(
+                        self.member_state_dict(member_num), self.paths[member_num]
+                    )
+
+                with open(
+                    self.log_paths[member_num], mode="a", newline="", encoding="utf-8"
+                ) as file:
+                    writer = csv.writer(file)
+                    writer.writerow(
+                        [epoch + 1, avg_epoch_loss[member_num], val_loss[member_num]]
+                    )
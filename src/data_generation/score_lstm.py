@@ -5,6 +5,8 @@ import torch.nn as nn
 import torch.optim as optim
 from tqdm import tqdm
 
+from data_loading import batch_to_device, mask_to_lengths
+
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 
@@ -84,6 +86,32 @@ class LSTMModel(nn.Module):
 
         return score
 
+    def prefix_scores(self, trajectory, lengths=None):
+        """
+        return (B, T) scores of every prefix trajectory[:, : t + 1] from one pass
+        scores at steps past lengths are 0
+        """
+        max_len = trajectory.shape[1]
+        if lengths is not None:
+            packed_trajectory = nn.utils.rnn.pack_padded_sequence(
+                trajectory, lengths.cpu(), batch_first=True, enforce_sorted=False
+            )
+            packed_output, _ = self.lstm(packed_trajectory)
+            output, _ = nn.utils.rnn.pad_packed_sequence(
+                packed_output, batch_first=True, total_length=max_len
+            )
+        else:
+            output, _ = self.lstm(trajectory)
+
+        score = self.fc(output).squeeze(-1)
+        if self.linear_loss:
+            score = 1 + torch.tanh(score)
+        if lengths is not None:
+            steps = torch.arange(max_len, device=score.device)
+            score = score * (steps[None, :] < lengths.to(score.device)[:, None])
+
+        return score
+
     def evaluate(self, data_loader):
         self.eval()
         epoch_loss = 0.0
@@ -99,13 +127,13 @@ class LSTMModel(nn.Module):
                     mu_batch,
                     mask0_batch,
                     mask1_batch,
-                ) = [x.to(device) for x in batch]
+                ) = batch_to_device(batch, device)
 
                 s0_batch = torch.cat((s0_obs_batch, s0_act_batch), dim=-1)
                 s1_batch = torch.cat((s1_obs_batch, s1_act_batch), dim=-1)
 
-                lengths_s0 = (1 - mask0_batch.squeeze()).sum(dim=1)
-                lengths_s1 = (1 - mask1_batch.squeeze()).sum(dim=1)
+                lengths_s0 = mask_to_lengths(mask0_batch)
+                lengths_s1 = mask_to_lengths(mask1_batch)
 
                 score_s0 = self.forward(s0_batch, lengths_s0)
                 score_s1 = self.forward(s1_batch, lengths_s1)
@@ -144,13 +172,13 @@ class LSTMModel(nn.Module):
                     mu_batch,
                     mask0_batch,
                     mask1_batch,
-                ) = [x.to(device) for x in batch]
+                ) = batch_to_device(batch, device)
 
                 s0_batch = torch.cat((s0_obs_batch, s0_act_batch), dim=-1)
                 s1_batch = torch.cat((s1_obs_batch, s1_act_batch), dim=-1)
 
-                lengths_s0 = (1 - mask0_batch.squeeze()).sum(dim=1)
-                lengths_s1 = (1 - mask1_batch.squeeze()).sum(dim=1)
+                lengths_s0 = mask_to_lengths(mask0_batch)
+                lengths_s1 = mask_to_lengths(mask1_batch)
 
                 score_s0 = self.forward(s0_batch, lengths_s0)
                 score_s1 = self.forward(s1_batch, lengths_s1)
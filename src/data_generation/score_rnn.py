@@ -5,6 +5,8 @@ import torch.nn as nn
 import torch.optim as optim
 from tqdm import tqdm
 
+from data_loading import batch_to_device, mask_to_lengths
+
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 
@@ -90,14 +92,14 @@ class RNNModel(nn.Module):
                     mu_batch,
                     mask0_batch,
                     mask1_batch,
-                ) = [x.to(device) for x in batch]
+                ) = batch_to_device(batch, device)
 
                 s0_batch = torch.cat((s0_obs_batch, s0_act_batch), dim=-1)
                 s1_batch = torch.cat((s1_obs_batch, s1_act_batch), dim=-1)
 
                 # Compute lengths for s0 and s1 separately using mask0_batch and mask1_batch
-                lengths_s0 = (1 - mask0_batch.squeeze()).sum(dim=1)
-                lengths_s1 = (1 - mask1_batch.squeeze()).sum(dim=1)
+                lengths_s0 = mask_to_lengths(mask0_batch)
+                lengths_s1 = mask_to_lengths(mask1_batch)
 
                 # Forward pass for s0 and s1
                 score_s0 = self.forward(s0_batch, lengths_s0)
@@ -140,14 +142,14 @@ class RNNModel(nn.Module):
                     mu_batch,
                     mask0_batch,
                     mask1_batch,
-                ) = [x.to(device) for x in batch]
+                ) = batch_to_device(batch, device)
 
                 s0_batch = torch.cat((s0_obs_batch, s0_act_batch), dim=-1)
                 s1_batch = torch.cat((s1_obs_batch, s1_act_batch), dim=-1)
 
                 # Compute lengths for s0 and s1 separately using mask0_batch and mask1_batch
-                lengths_s0 = (1 - mask0_batch.squeeze()).sum(dim=1)
-                lengths_s1 = (1 - mask1_batch.squeeze()).sum(dim=1)
+                lengths_s0 = mask_to_lengths(mask0_batch)
+                lengths_s1 = mask_to_lengths(mask1_batch)
 
                 # Forward pass for s0 and s1
                 score_s0 = self.forward(s0_batch, lengths_s0)
@@ -1,191 +1,470 @@
-from itertools import combinations
-from random import sample
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
 import numpy as np
 import torch
 
+from data_generation.combination_pairs import get_threshold_pairs, sample_smoothed_pairs
 from data_generation.raw_pairs import save_raw_pairs
 from data_generation.score_encoder import EncoderModel
+from data_generation.score_ensemble import EnsembleLSTMModel, EnsembleScorer
 from data_generation.score_rnn import RNNModel
 from data_generation.score_lstm import LSTMModel
-from data_generation.utils import generate_pairs_from_indices
+from data_generation.selection import TopKSelector
+from data_generation.sub_segments import get_window_pairs
+from data_generation.utils import generate_pairs_from_indices, make_feedback_pairs
 from data_loading import (
+    batch_to_device,
+    mask_to_lengths,
     get_dataloader,
     load_pair,
     load_dataset,
-    process_pairs,
-    get_dataloader_from_processed_data,
+    get_dataloader_from_pairs,
+    save_pair,
+    IndexedPreferenceDataset,
+    IndexedSegmentDataset,
+    PreferenceBatchLoader,
 )
 from utils import get_score_model_path
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-def fill_score_from_pairs(dataset, pairs, models):
+# pairs scored at once by fill_feedback_from_pairs, bounds its working memory
+DEFAULT_CHUNK_SIZE = 65536
+# segment scores kept across chunks, so segments shared by chunks are scored once
+DEFAULT_SEGMENT_CACHE_SIZE = 4 * DEFAULT_CHUNK_SIZE
+
+segment_scoring_stats = {"segments": 0, "unique_segments": 0}
+
+
+def get_segment_scoring_stats():
+    """
+    return number of pair segments and unique segments scored so far
+    dedup_ratio is segments per model forward of one segment
+    """
+    segments = segment_scoring_stats["segments"]
+    unique_segments = segment_scoring_stats["unique_segments"]
+    return {
+        "segments": segments,
+        "unique_segments": unique_segments,
+        "dedup_ratio": segments / unique_segments if unique_segments > 0 else 1.0,
+    }
+
+
+def get_segment_keys(segments):
+    """
+    return (N,) int64 keys of (start, end) segments, ordered as the segments
     """
-    Fill scores in dataset using multiple models and average their mu values.
+    segments = np.asarray(segments, dtype=np.int64).reshape(-1, 2)
+
+    # (start, end) are step indices below 2**31, packed into one int64 key
+    return (segments[:, 0] << 32) | segments[:, 1]
+
+
+def get_unique_segments(pairs):
+    """
+    return unique (start, end) segments of pairs, sorted by start
+    and (N, 2) index of s0, s1 of each pair into them
+    """
+    keys = get_segment_keys(pairs)
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+
+    unique_segments = np.stack((unique_keys >> 32, unique_keys & 0xFFFFFFFF), axis=1)
+    return unique_segments, inverse.reshape(-1, 2)
+
+
+class SegmentScoreCache:
+    """
+    (E, C) scores of the last scored segments, at most max_segments
+    the oldest segments are evicted first
+    """
+
+    def __init__(self, max_segments=DEFAULT_SEGMENT_CACHE_SIZE):
+        self.max_segments = max_segments
+        self.keys = np.empty(0, dtype=np.int64)
+        self.scores = None
+
+    def lookup(self, keys):
+        """
+        return (U,) bool mask of cached keys and their index into scores
+        """
+        if len(self.keys) == 0:
+            return np.zeros(len(keys), dtype=bool), np.zeros(len(keys), dtype=np.int64)
+
+        order = np.argsort(self.keys)
+        positions = np.searchsorted(self.keys[order], keys).clip(max=len(order) - 1)
+        index = order[positions]
+        return self.keys[index] == keys, index
+
+    def add(self, keys, scores):
+        if self.max_segments <= 0 or len(keys) == 0:
+            return
+
+        if self.scores is None:
+            self.keys, self.scores = keys, scores
+        else:
+            self.keys = np.concatenate((self.keys, keys))
+            self.scores = torch.cat((self.scores, scores), dim=1)
+
+        self.keys = self.keys[-self.max_segments :]
+        self.scores = self.scores[:, -self.max_segments :]
+
+
+def get_prefix_runs(segments):
+    """
+    group consecutive segments sharing a start into runs
+    return (R, 2) runs from each start to its largest end
+    and (R + 1,) offsets, run r holds segments[offsets[r] : offsets[r + 1]]
+    """
+    segments = np.asarray(segments, dtype=np.int64).reshape(-1, 2)
+    first = np.flatnonzero(np.diff(segments[:, 0], prepend=-1))
+    offsets = np.append(first, len(segments))
+
+    if len(segments) == 0:
+        return np.empty((0, 2), dtype=np.int64), offsets
+
+    run_ends = np.maximum.reduceat(segments[:, 1], first)
+    return np.stack((segments[first, 0], run_ends), axis=1), offsets
+
+
+def score_segments(dataset, segments, models, batch_size=1024, prefix=None):
+    """
+    Score each segment once with every model.
 
     Args:
         dataset: dict
-        pairs: list of tuples ((int, int), (int, int))
+        segments: array of (start, end)
         models: list of torch.nn.Module
-        linear_loss: bool, optional
-            If True, use linear loss for mu calculation. Default is False.
+        batch_size: int, number of segments scored per batch
+        prefix: bool, read scores of consecutive segments sharing a start from
+            prefix scores of one pass over their run, segments sorted by start
+            share the most. None uses it if every model supports it and runs
+            have fewer steps than segments
 
     Returns:
-        np array of ((int, int), float): scores.
+        tensor with shape (len(models), len(segments)) on device: scores.
     """
+    for model in models:
+        model.eval()
+
+    scorer = EnsembleScorer(models)
+
+    if prefix is None:
+        prefix = scorer.supports_prefix
+        if prefix:
+            runs, _ = get_prefix_runs(segments)
+            segment_steps = np.sum(np.diff(np.reshape(segments, (-1, 2)), axis=1))
+            prefix = np.sum(np.diff(runs, axis=1)) < segment_steps
+
+    if prefix:
+        return score_segments_by_prefix(dataset, segments, scorer, batch_size)
 
-    pairs_with_zero_mu = np.array(
-        [(s0, s1, 0.0) for s0, s1 in pairs],
-        dtype=[
-            ("s0", "i4", (2,)),
-            ("s1", "i4", (2,)),
-            ("mu", "f"),
-        ],
+    segment_dataset = IndexedSegmentDataset(dataset, segments)
+    segment_loader = PreferenceBatchLoader(
+        segment_dataset, batch_size=batch_size, shuffle=False, drop_last=False
     )
 
-    # Evaluate model with result data
-    processed_data = process_pairs(dataset, pairs_with_zero_mu)
-    dataloader = get_dataloader_from_processed_data(
-        processed_data, shuffle=False, drop_last=False
+    scores = torch.empty((len(models), len(segment_dataset)), device=device)
+
+    offset = 0
+
+    with torch.no_grad():
+        for batch in segment_loader:
+            obs_batch, act_batch, mask_batch = batch_to_device(batch, device)
+
+            segment_batch = torch.cat((obs_batch, act_batch), dim=-1)
+            lengths = mask_to_lengths(mask_batch)
+            batch_len = len(segment_batch)
+
+            scores[:, offset : offset + batch_len] = scorer(segment_batch, lengths)
+            offset += batch_len
+
+    return scores
+
+
+def score_segments_by_prefix(dataset, segments, scorer, batch_size=1024):
+    """
+    Score segments with one recurrent pass per run of get_prefix_runs,
+    batch_size runs are scored per batch.
+
+    Returns:
+        tensor with shape (len(models), len(segments)) on device: scores.
+    """
+    segments = np.asarray(segments, dtype=np.int64).reshape(-1, 2)
+    runs, offsets = get_prefix_runs(segments)
+
+    # run of each segment and the step of its last transition in that run
+    run_index = np.repeat(np.arange(len(runs)), np.diff(offsets))
+    last_steps = torch.from_numpy(segments[:, 1] - runs[run_index, 0] - 1)
+    run_index = torch.from_numpy(run_index)
+
+    run_dataset = IndexedSegmentDataset(dataset, runs)
+    run_loader = PreferenceBatchLoader(
+        run_dataset, batch_size=batch_size, shuffle=False, drop_last=False
     )
 
-    score_results = []
+    scores = torch.empty((len(scorer.models), len(segments)), device=device)
+
+    run_offset = 0
 
     with torch.no_grad():
-        for batch in dataloader:
-            (
-                s0_obs_batch,
-                s0_act_batch,
-                s1_obs_batch,
-                s1_act_batch,
-                _,
-                mask0_batch,
-                mask1_batch,
-            ) = [x.to(device) for x in batch]
+        for batch in run_loader:
+            obs_batch, act_batch, mask_batch = batch_to_device(batch, device)
+
+            run_batch = torch.cat((obs_batch, act_batch), dim=-1)
+            lengths = mask_to_lengths(mask_batch)
+            batch_len = len(run_batch)
+
+            prefix_scores = scorer.prefix_scores(run_batch, lengths)
+
+            first = offsets[run_offset]
+            last = offsets[run_offset + batch_len]
+            scores[:, first:last] = prefix_scores[
+                :,
+                (run_index[first:last] - run_offset).to(device),
+                last_steps[first:last].to(device),
+            ]
+            run_offset += batch_len
+
+    return scores
+
 
-            s0_batch = torch.cat((s0_obs_batch, s0_act_batch), dim=-1)
-            s1_batch = torch.cat((s1_obs_batch, s1_act_batch), dim=-1)
+def score_pair_segments(dataset, pairs, models, batch_size=1024, cache=None):
+    """
+    return unique segments of pairs, their (len(models), U) scores on device
+    and (N, 2) index of pairs into them, shared segments are scored once per model
+    segments found in cache, a SegmentScoreCache, are not scored again
+    """
+    segments, inverse = get_unique_segments(pairs)
+    segment_scoring_stats["segments"] += inverse.size
 
-            lengths_s0 = (1 - mask0_batch.squeeze(dim=-1)).sum(dim=1)
-            lengths_s1 = (1 - mask1_batch.squeeze(dim=-1)).sum(dim=1)
+    if cache is None:
+        segment_scoring_stats["unique_segments"] += len(segments)
+        scores = score_segments(dataset, segments, models, batch_size=batch_size)
+        return segments, scores, inverse
 
-            scores_0_batch = []
-            scores_1_batch = []
+    keys = get_segment_keys(segments)
+    found, cache_index = cache.lookup(keys)
+    missing = np.flatnonzero(~found)
+    segment_scoring_stats["unique_segments"] += len(missing)
 
-            for model in models:
-                model.eval()
+    if len(missing) == 0:
+        cached = torch.from_numpy(cache_index).to(cache.scores.device)
+        return segments, cache.scores[:, cached], inverse
 
-                # Calculate scores
-                scores_0 = model(s0_batch, lengths_s0).cpu().numpy()
-                scores_1 = model(s1_batch, lengths_s1).cpu().numpy()
+    new_scores = score_segments(
+        dataset, segments[missing], models, batch_size=batch_size
+    )
+    scores = new_scores.new_empty((len(new_scores), len(segments)))
+    scores[:, torch.from_numpy(missing).to(scores.device)] = new_scores
+    if found.any():
+        scores[:, torch.from_numpy(np.flatnonzero(found)).to(scores.device)] = (
+            cache.scores[:, torch.from_numpy(cache_index[found]).to(scores.device)]
+        )
 
-                scores_0_batch.append(scores_0)
-                scores_1_batch.append(scores_1)
-            
-            scores_0_batch = np.array(scores_0_batch)
-            scores_1_batch = np.array(scores_1_batch)
-            
-            scores_0_batch = np.mean(scores_0_batch, axis=0)
-            scores_1_batch = np.mean(scores_1_batch, axis=0)
+    cache.add(keys[missing], new_scores)
+    return segments, scores, inverse
 
-            score_results.extend([score for pair in zip(scores_0_batch, scores_1_batch) for score in pair])
-    
-    all_trajs = [traj for pair in pairs for traj in pair]
 
-    return zip(all_trajs, score_results)
-    
+def fill_score_from_pairs(dataset, pairs, models, batch_size=1024):
+    """
+    Fill scores of segments of pairs using multiple models and average them.
 
+    Args:
+        dataset: dict
+        pairs: list of tuples ((int, int), (int, int))
+        models: list of torch.nn.Module
+        batch_size: int, number of segments scored per batch
 
-def fill_feedback_from_pairs(dataset, pairs, models, linear_loss=False):
+    Returns:
+        tuple:
+            - np array of (int, int) with shape (2N, 2): s0, s1 of every pair.
+            - np array of float with shape (2N,): mean score of each segment.
+    """
+    segments, scores, inverse = score_pair_segments(
+        dataset, pairs, models, batch_size=batch_size
+    )
+
+    mean_scores = scores.mean(dim=0).cpu().numpy()
+    segment_index = inverse.reshape(-1)
+
+    return segments[segment_index], mean_scores[segment_index]
+
+
+def iter_feedback_from_pairs(
+    dataset,
+    pairs,
+    models,
+    linear_loss=False,
+    batch_size=1024,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    cache_size=DEFAULT_SEGMENT_CACHE_SIZE,
+):
+    """
+    Score pairs in chunks of chunk_size pairs, working memory does not grow
+    with the number of pairs. Segments are deduplicated within each chunk and
+    against the last cache_size segments scored by earlier chunks, so a segment
+    shared by chunks is scored again only after it was evicted.
+
+    Args:
+        dataset: dict
+        pairs: (N, 2, 2) array or list of tuples ((int, int), (int, int))
+        models: list of torch.nn.Module
+        linear_loss: bool, optional
+            If True, use linear loss for mu calculation. Default is False.
+        batch_size: int, number of segments scored per batch
+        chunk_size: int, number of pairs scored per chunk
+        cache_size: int, number of segment scores kept across chunks
+
+    Yields:
+        tuple:
+            - int, int: start and end index of the chunk in pairs.
+            - np array of float: mean of mu values of the chunk.
+            - np array of float: standard deviation of mu values of the chunk.
+    """
+    if not isinstance(pairs, np.ndarray):
+        pairs = np.asarray(pairs, dtype=np.int64)
+
+    cache = SegmentScoreCache(cache_size)
+
+    for start in range(0, len(pairs), chunk_size):
+        chunk = np.asarray(pairs[start : start + chunk_size]).reshape(-1, 2, 2)
+
+        _, scores, inverse = score_pair_segments(
+            dataset, chunk, models, batch_size=batch_size, cache=cache
+        )
+
+        # scores of s0, s1 of every pair, shape of (len(models), len(chunk))
+        pair_index = torch.from_numpy(inverse).to(device)
+        scores_0 = scores[:, pair_index[:, 0]]
+        scores_1 = scores[:, pair_index[:, 1]]
+
+        if linear_loss:
+            mu = scores_1 / (scores_0 + scores_1 + 1e-6)
+        else:
+            mu = 1 / (1 + torch.exp(scores_0 - scores_1))
+
+        yield (
+            start,
+            start + len(chunk),
+            mu.mean(dim=0).cpu().numpy().astype(np.float64),
+            mu.std(dim=0).cpu().numpy().astype(np.float64),
+        )
+
+
+def fill_feedback_from_pairs(
+    dataset,
+    pairs,
+    models,
+    linear_loss=False,
+    batch_size=1024,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+):
     """
     Fill feedback in dataset using multiple models and average their mu values.
     Also return the standard deviation of mu values.
 
     Args:
         dataset: dict
-        pairs: list of tuples ((int, int), (int, int))
+        pairs: (N, 2, 2) array or list of tuples ((int, int), (int, int))
         models: list of torch.nn.Module
         linear_loss: bool, optional
             If True, use linear loss for mu calculation. Default is False.
+        batch_size: int, number of segments scored per batch
+        chunk_size: int, number of pairs scored per chunk
 
     Returns:
         tuple:
             - np array of ((int, int), (int, int), float): mu values.
             - np array of float: standard deviation of mu values.
     """
+    if not isinstance(pairs, np.ndarray):
+        pairs = np.asarray(pairs, dtype=np.int64)
+    pairs = pairs.reshape(-1, 2, 2)
+
+    mu_array = make_feedback_pairs(pairs, np.zeros(len(pairs)))
+    std_dev_results = np.empty(len(pairs), dtype=np.float64)
+
+    for start, end, mu, std_dev in iter_feedback_from_pairs(
+        dataset,
+        pairs,
+        models,
+        linear_loss=linear_loss,
+        batch_size=batch_size,
+        chunk_size=chunk_size,
+    ):
+        mu_array["mu"][start:end] = mu
+        std_dev_results[start:end] = std_dev
 
-    pairs_with_zero_mu = np.array(
-        [(s0, s1, 0.0) for s0, s1 in pairs],
-        dtype=[
-            ("s0", "i4", (2,)),
-            ("s1", "i4", (2,)),
-            ("mu", "f"),
-        ],
-    )
+    return mu_array, std_dev_results
 
-    # Evaluate model with result data
-    processed_data = process_pairs(dataset, pairs_with_zero_mu)
-    dataloader = get_dataloader_from_processed_data(
-        processed_data, shuffle=False, drop_last=False
-    )
 
-    mu_results = []
-    std_dev_results = []
+def select_top_feedback_pairs(
+    dataset,
+    pairs,
+    models,
+    k,
+    linear_loss=False,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+):
+    """
+    return k feedback pairs with mu farthest from 0.5, sorted by the distance
+    only the current top-k is kept while chunks of pairs are scored
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2, 2)
+    selector = TopKSelector(k)
+
+    for start, end, mu, _ in iter_feedback_from_pairs(
+        dataset, pairs, models, linear_loss=linear_loss, chunk_size=chunk_size
+    ):
+        mu = mu.astype(np.float32)
+        selector.update(np.abs(mu - 0.5), np.arange(start, end), mu)
 
-    with torch.no_grad():
-        for batch in dataloader:
-            (
-                s0_obs_batch,
-                s0_act_batch,
-                s1_obs_batch,
-                s1_act_batch,
-                _,
-                mask0_batch,
-                mask1_batch,
-            ) = [x.to(device) for x in batch]
-
-            s0_batch = torch.cat((s0_obs_batch, s0_act_batch), dim=-1)
-            s1_batch = torch.cat((s1_obs_batch, s1_act_batch), dim=-1)
-
-            lengths_s0 = (1 - mask0_batch.squeeze(dim=-1)).sum(dim=1)
-            lengths_s1 = (1 - mask1_batch.squeeze(dim=-1)).sum(dim=1)
-
-            batch_mu_results = []  # Collect mu values for the batch from all models
-
-            for model in models:
-                model.eval()
-
-                # Calculate scores
-                scores_0 = model(s0_batch, lengths_s0).cpu().numpy()
-                scores_1 = model(s1_batch, lengths_s1).cpu().numpy()
-
-                # Calculate mu for this model
-                if linear_loss:
-                    mu_batch = scores_1 / (scores_0 + scores_1 + 1e-6)
-                else:
-                    mu_batch = 1 / (1 + np.exp(scores_0 - scores_1))
-
-                mu_batch = np.squeeze(mu_batch, axis=-1)
-                batch_mu_results.append(mu_batch)
-
-            batch_mu_results = np.array(batch_mu_results)
-
-            avg_mu_batch = np.mean(batch_mu_results, axis=0)
-            std_mu_batch = np.std(batch_mu_results, axis=0, ddof=1)
-
-            mu_results = np.concatenate((mu_results, avg_mu_batch))
-            std_dev_results = np.concatenate((std_dev_results, std_mu_batch))
-
-    mu_array = np.array(
-        [(s0, s1, mu) for (s0, s1), mu in zip(pairs, mu_results)],
-        dtype=[
-            ("s0", "i4", (2,)),
-            ("s1", "i4", (2,)),
-            ("mu", "f"),
-        ],
-    )
+    indices, mu = selector.result()
+    return make_feedback_pairs(pairs[indices], mu)
 
-    return mu_array, std_dev_results
+
+def select_feedback_pairs(
+    dataset,
+    pairs,
+    models,
+    condition,
+    linear_loss=False,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+):
+    """
+    return feedback pairs whose mu and std of mu satisfy condition
+    condition(mu, std) returns boolean mask of a chunk
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2, 2)
+    selected_indices = []
+    selected_mu = []
+
+    for start, end, mu, std in iter_feedback_from_pairs(
+        dataset, pairs, models, linear_loss=linear_loss, chunk_size=chunk_size
+    ):
+        mu = mu.astype(np.float32)
+        mask = condition(mu, std)
+        selected_indices.append(np.arange(start, end)[mask])
+        selected_mu.append(mu[mask])
+
+    indices = np.concatenate(selected_indices) if selected_indices else []
+    mu = np.concatenate(selected_mu) if selected_mu else []
+    return make_feedback_pairs(pairs[indices], mu)
+
+
+def get_fold_range(num_pairs, ensemble_num, max_ensemble_num):
+    """
+    return (start, end) of validation fold of ensemble member
+    pairs are split into max_ensemble_num contiguous chunks, first ones are longer
+    """
+    chunk_size = num_pairs // max_ensemble_num
+    remainder = num_pairs % max_ensemble_num
+
+    start_idx = ensemble_num * chunk_size + min(ensemble_num, remainder)
+    end_idx = start_idx + chunk_size + (1 if ensemble_num < remainder else 0)
+
+    return start_idx, end_idx
 
 
 def train_model(
@@ -204,24 +483,14 @@ def train_model(
             env_name=env_name, exp_name=exp_name, pair_type="train", pair_algo=pair_algo
         )
 
-        chunk_size = len(pairs) // max_ensemble_num
-        remainder = len(pairs) % max_ensemble_num
-
-        start_idx = sum(
-            chunk_size + (1 if i < remainder else 0) for i in range(ensemble_num)
-        )
-        end_idx = start_idx + chunk_size + (1 if ensemble_num < remainder else 0)
+        start_idx, end_idx = get_fold_range(len(pairs), ensemble_num, max_ensemble_num)
 
         train_pairs = np.concatenate((pairs[:start_idx], pairs[end_idx:]), axis=0)
         val_pairs = pairs[start_idx:end_idx]
 
-        train_data_loader = get_dataloader_from_processed_data(
-            process_pairs(dataset=dataset, pair=train_pairs)
-        )
+        train_data_loader = get_dataloader_from_pairs(dataset, train_pairs)
 
-        val_data_loader = get_dataloader_from_processed_data(
-            process_pairs(dataset=dataset, pair=val_pairs)
-        )
+        val_data_loader = get_dataloader_from_pairs(dataset, val_pairs)
 
     else:
         train_data_loader = get_dataloader(
@@ -274,31 +543,187 @@ def train_model(
     )
 
 
-def generate_score_pairs(
+def train_ensemble_vectorized(
     dataset,
     env_name,
     exp_name,
     num_epochs,
     pair_algo,
     score_model,
-    aug_list,
-    traj_set,
-    ensemble_size=1,
+    ensemble_size,
 ):
     """
-    learn score model and save score pairs
+    train K-fold lstm members as one stacked model over shared batches
+    members whose model file exists are skipped, as in train_model
     """
+    paths = [
+        get_score_model_path(env_name, exp_name, pair_algo, score_model, ensemble_num)
+        for ensemble_num in range(ensemble_size)
+    ]
+    folds = [
+        ensemble_num
+        for ensemble_num, path in enumerate(paths)
+        if not os.path.isfile(path)
+    ]
+
+    if len(folds) == 0:
+        print("Skipping model initialization")
+        return
+
+    pairs = load_pair(
+        env_name=env_name, exp_name=exp_name, pair_type="train", pair_algo=pair_algo
+    )
 
+    # fold of every pair, same split as train_model
+    pair_folds = torch.empty(len(pairs), dtype=torch.long)
     for ensemble_num in range(ensemble_size):
-        train_model(
+        start_idx, end_idx = get_fold_range(len(pairs), ensemble_num, ensemble_size)
+        pair_folds[start_idx:end_idx] = ensemble_num
+
+    pair_dataset = IndexedPreferenceDataset(dataset, pairs)
+    obs_dim, act_dim = pair_dataset.get_dimensions()
+
+    model, optimizer = EnsembleLSTMModel.initialize(
+        config={"obs_dim": obs_dim, "act_dim": act_dim},
+        paths=[paths[fold] for fold in folds],
+        folds=folds,
+        linear_loss=score_model == "lstm.linear",
+    )
+
+    model.train_model(
+        optimizer=optimizer,
+        pair_dataset=pair_dataset,
+        pair_folds=pair_folds,
+        num_epochs=num_epochs,
+    )
+
+
+def train_ensemble_in_processes(
+    env_name,
+    exp_name,
+    num_epochs,
+    pair_algo,
+    score_model,
+    ensemble_size,
+    num_workers=None,
+):
+    """
+    train ensemble members with train_model in a pool of spawned processes
+    cpu threads are divided among workers
+    """
+    if num_workers is None:
+        num_workers = min(ensemble_size, os.cpu_count() or 1)
+    num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=torch.set_num_threads,
+        initargs=(num_threads,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                train_model,
+                env_name=env_name,
+                exp_name=exp_name,
+                num_epochs=num_epochs,
+                pair_algo=pair_algo,
+                score_model=score_model,
+                ensemble_num=ensemble_num,
+                max_ensemble_num=ensemble_size,
+            )
+            for ensemble_num in range(ensemble_size)
+        ]
+
+        for future in futures:
+            future.result()
+
+
+def train_ensemble(
+    dataset,
+    env_name,
+    exp_name,
+    num_epochs,
+    pair_algo,
+    score_model,
+    ensemble_size,
+    ensemble_mode="sequential",
+    num_workers=None,
+):
+    """
+    train score model ensemble members
+    ensemble_mode is one of
+        - sequential: train_model for each member one after another
+        - vectorized: K-fold lstm members as one stacked model over shared batches
+        - process: train_model for each member in a process pool
+    sequential and process train exactly as train_model does. vectorized differs:
+    a shared batch of 32 * K // (K - 1) pairs gives each member a varying number
+    of about 32 pairs per step, and members are validated on their whole fold
+    instead of the drop_last val loader
+    """
+    if (
+        ensemble_mode == "vectorized"
+        and ensemble_size > 1
+        and score_model in ("lstm.exp", "lstm.linear")
+    ):
+        train_ensemble_vectorized(
+            dataset=dataset,
+            env_name=env_name,
+            exp_name=exp_name,
+            num_epochs=num_epochs,
+            pair_algo=pair_algo,
+            score_model=score_model,
+            ensemble_size=ensemble_size,
+        )
+    elif ensemble_mode == "process" and ensemble_size > 1:
+        train_ensemble_in_processes(
             env_name=env_name,
             exp_name=exp_name,
             num_epochs=num_epochs,
             pair_algo=pair_algo,
             score_model=score_model,
-            ensemble_num=ensemble_num,
-            max_ensemble_num=ensemble_size,
+            ensemble_size=ensemble_size,
+            num_workers=num_workers,
         )
+    else:
+        for ensemble_num in range(ensemble_size):
+            train_model(
+                env_name=env_name,
+                exp_name=exp_name,
+                num_epochs=num_epochs,
+                pair_algo=pair_algo,
+                score_model=score_model,
+                ensemble_num=ensemble_num,
+                max_ensemble_num=ensemble_size,
+            )
+
+
+def generate_score_pairs(
+    dataset,
+    env_name,
+    exp_name,
+    num_epochs,
+    pair_algo,
+    score_model,
+    aug_list,
+    traj_set,
+    ensemble_size=1,
+    ensemble_mode="sequential",
+):
+    """
+    learn score model and save score pairs
+    """
+
+    train_ensemble(
+        dataset=dataset,
+        env_name=env_name,
+        exp_name=exp_name,
+        num_epochs=num_epochs,
+        pair_algo=pair_algo,
+        score_model=score_model,
+        ensemble_size=ensemble_size,
+        ensemble_mode=ensemble_mode,
+    )
 
     obs_dim, act_dim = dataset["observations"].shape[1], dataset["actions"].shape[1]
 
@@ -350,8 +775,10 @@ def generate_score_pairs(
         env_name=env_name, exp_name=exp_name, pair_type="val", pair_algo=pair_algo
     )
 
-    train_pairs = [(s0, s1) for s0, s1, _ in train_pairs_with_mu]
-    val_pairs = [(s0, s1) for s0, s1, _ in val_pairs_with_mu]
+    train_pairs = np.stack(
+        (train_pairs_with_mu["s0"], train_pairs_with_mu["s1"]), axis=1
+    )
+    val_pairs = np.stack((val_pairs_with_mu["s0"], val_pairs_with_mu["s1"]), axis=1)
 
     # fill feedback in pairs
     train_feedback_pairs, _ = fill_feedback_from_pairs(
@@ -360,13 +787,13 @@ def generate_score_pairs(
     val_feedback_pairs, _ = fill_feedback_from_pairs(
         dataset, val_pairs, best_models, linear_loss
     )
-    np.savez(
+    save_pair(
         f"pair/{env_name}/{exp_name}/train/{score_model}-{pair_algo}.npz",
-        data=train_feedback_pairs,
+        train_feedback_pairs,
     )
-    np.savez(
+    save_pair(
         f"pair/{env_name}/{exp_name}/val/{score_model}-{pair_algo}.npz",
-        data=val_feedback_pairs,
+        val_feedback_pairs,
     )
 
     for aug in aug_list:
@@ -378,7 +805,9 @@ def generate_score_pairs(
                     pair_type="train",
                     pair_algo="raw_10000",
                 )
-                aug_train_pairs = [(pair["s0"], pair["s1"]) for pair in loaded_pairs]
+                aug_train_pairs = np.stack(
+                    (loaded_pairs["s0"], loaded_pairs["s1"]), axis=1
+                )
             except FileNotFoundError:
                 aug_train_pairs = generate_pairs_from_indices(
                     dataset, traj_set, 10000, 25
@@ -407,7 +836,9 @@ def generate_score_pairs(
                     pair_type="train",
                     pair_algo="raw_50000",
                 )
-                aug_train_pairs = [(pair["s0"], pair["s1"]) for pair in loaded_pairs]
+                aug_train_pairs = np.stack(
+                    (loaded_pairs["s0"], loaded_pairs["s1"]), axis=1
+                )
             except FileNotFoundError:
                 aug_train_pairs = generate_pairs_from_indices(
                     dataset, traj_set, 50000, 25
@@ -436,7 +867,9 @@ def generate_score_pairs(
                     pair_type="train",
                     pair_algo="raw_200000",
                 )
-                aug_train_pairs = [(pair["s0"], pair["s1"]) for pair in loaded_pairs]
+                aug_train_pairs = np.stack(
+                    (loaded_pairs["s0"], loaded_pairs["s1"]), axis=1
+                )
             except FileNotFoundError:
                 aug_train_pairs = generate_pairs_from_indices(
                     dataset, traj_set, 200000, 25
@@ -450,16 +883,14 @@ def generate_score_pairs(
                     raw_name="raw_200000",
                 )
 
-            aug_train_feedback_pairs, _ = fill_feedback_from_pairs(
-                dataset, aug_train_pairs, best_models, linear_loss
+            top_feedback_pairs = select_top_feedback_pairs(
+                dataset, aug_train_pairs, best_models, 5000, linear_loss
             )
 
-            distances = np.abs(aug_train_feedback_pairs["mu"] - 0.5)
-            sorted_indices = np.argsort(-distances)
-            top_feedback_pairs = aug_train_feedback_pairs[sorted_indices[:5000]]
-
             # save pairs for other experiments
-            top_pairs = [(s0, s1) for s0, s1, _ in top_feedback_pairs]
+            top_pairs = np.stack(
+                (top_feedback_pairs["s0"], top_feedback_pairs["s1"]), axis=1
+            )
             save_raw_pairs(
                 env_name=env_name,
                 exp_name=exp_name,
@@ -473,54 +904,21 @@ def generate_score_pairs(
                 axis=0,
             )
         elif aug == "nC2.smoothing":
-            train_pairs_with_score = fill_score_from_pairs(
-                dataset, train_pairs, best_models
-            )
-            aug_feedback_pairs = []
-
-            sample_size = 50000
-            all_combinations = list(combinations(train_pairs_with_score, 2))
-            random_combinations = sample(all_combinations, sample_size)
-
-            for s0, s1 in random_combinations:
-                mu = 1 / (1 + np.exp((s0[1] - s1[1]) / 5))
-                aug_feedback_pairs.append((s0[0], s1[0], mu))
-
-            
-            aug_feedback_pairs = np.array(
-                aug_feedback_pairs,
-                dtype=[
-                    ("s0", "i4", (2,)),
-                    ("s1", "i4", (2,)),
-                    ("mu", "f"),
-                ],
+            segments, scores = fill_score_from_pairs(dataset, train_pairs, best_models)
+
+            aug_feedback_pairs = sample_smoothed_pairs(
+                segments, scores, sample_size=50000, temperature=5
             )
-            
+
             new_train_feedback_pairs = np.concatenate(
                 [train_feedback_pairs, aug_feedback_pairs],
                 axis=0,
             )
         elif aug == "nC2":
-            train_pairs_with_score = fill_score_from_pairs(
-                dataset, train_pairs, best_models
-            )
-            aug_feedback_pairs = []
-
-            for s0, s1 in combinations(train_pairs_with_score, 2):
-                if np.abs(s0[1] - s1[1]) > 5:
-                    aug_feedback_pairs.append(
-                        (s0[0], s1[0], 1.0 if s1[1] > s0[1] else 0.0)
-                    )
-            
-            aug_feedback_pairs = np.array(
-                aug_feedback_pairs,
-                dtype=[
-                    ("s0", "i4", (2,)),
-                    ("s1", "i4", (2,)),
-                    ("mu", "f"),
-                ],
-            )
-            
+            segments, scores = fill_score_from_pairs(dataset, train_pairs, best_models)
+
+            aug_feedback_pairs = get_threshold_pairs(segments, scores, threshold=5)
+
             new_train_feedback_pairs = np.concatenate(
                 [train_feedback_pairs, aug_feedback_pairs],
                 axis=0,
@@ -533,7 +931,9 @@ def generate_score_pairs(
                     pair_type="train",
                     pair_algo="raw_200000",
                 )
-                aug_train_pairs = [(pair["s0"], pair["s1"]) for pair in loaded_pairs]
+                aug_train_pairs = np.stack(
+                    (loaded_pairs["s0"], loaded_pairs["s1"]), axis=1
+                )
             except FileNotFoundError:
                 aug_train_pairs = generate_pairs_from_indices(
                     dataset, traj_set, 200000, 25
@@ -553,59 +953,22 @@ def generate_score_pairs(
 
             std_dev_criteria = np.mean(std_dev)
 
-            aug_train_feedback_pairs, aug_std_dev = fill_feedback_from_pairs(
-                dataset, aug_train_pairs, best_models, linear_loss
+            aug_train_feedback_pairs = select_feedback_pairs(
+                dataset,
+                aug_train_pairs,
+                best_models,
+                lambda mu, std: std < std_dev_criteria * 0.5,
+                linear_loss,
             )
 
-            filtered_pairs = [
-                pair
-                for pair, mu, std in zip(
-                    aug_train_feedback_pairs,
-                    aug_train_feedback_pairs["mu"],
-                    aug_std_dev,
-                )
-                if std < std_dev_criteria * 0.5
-            ]
-
-            print(std_dev_criteria, len(filtered_pairs))
-
-            aug_train_feedback_pairs = np.array(
-                filtered_pairs, dtype=aug_train_feedback_pairs.dtype
-            )
+            print(std_dev_criteria, len(aug_train_feedback_pairs))
 
             new_train_feedback_pairs = np.concatenate(
                 [train_feedback_pairs, aug_train_feedback_pairs],
                 axis=0,
             )
         elif aug == "cutting":
-            aug_train_pairs = []
-
-            for s0, s1 in train_pairs:
-                split_points_0 = []
-                split_points_1 = []
-
-                for i in range(0, 5 + 1):
-                    # 내분점
-                    split_points_0.append((s0[0] * (5 - i) + s0[1] * i) // 5)
-                    split_points_1.append((s1[0] * (5 - i) + s1[1] * i) // 5)
-
-                for i in range(5):
-                    for j in range(5 - i):
-                        start_index = j
-                        end_index = j + i + 1
-
-                        aug_train_pairs.append(
-                            (
-                                (
-                                    split_points_0[start_index],
-                                    split_points_0[end_index],
-                                ),
-                                (
-                                    split_points_1[start_index],
-                                    split_points_1[end_index],
-                                ),
-                            )
-                        )
+            aug_train_pairs = get_window_pairs(train_pairs, num_splits=5)
 
             new_train_feedback_pairs, _ = fill_feedback_from_pairs(
                 dataset, aug_train_pairs, best_models, linear_loss
@@ -618,7 +981,9 @@ def generate_score_pairs(
                     pair_type="train",
                     pair_algo="raw_200000",
                 )
-                aug_train_pairs = [(pair["s0"], pair["s1"]) for pair in loaded_pairs]
+                aug_train_pairs = np.stack(
+                    (loaded_pairs["s0"], loaded_pairs["s1"]), axis=1
+                )
             except FileNotFoundError:
                 aug_train_pairs = generate_pairs_from_indices(
                     dataset, traj_set, 200000, 25
@@ -638,25 +1003,15 @@ def generate_score_pairs(
 
             std_dev_criteria = np.mean(std_dev)
 
-            aug_train_feedback_pairs, aug_std_dev = fill_feedback_from_pairs(
-                dataset, aug_train_pairs, best_models, linear_loss
+            aug_train_feedback_pairs = select_feedback_pairs(
+                dataset,
+                aug_train_pairs,
+                best_models,
+                lambda mu, std: (std > std_dev_criteria) & ((mu < 0.1) | (mu > 0.9)),
+                linear_loss,
             )
 
-            filtered_pairs = [
-                pair
-                for pair, mu, std in zip(
-                    aug_train_feedback_pairs,
-                    aug_train_feedback_pairs["mu"],
-                    aug_std_dev,
-                )
-                if std > std_dev_criteria and (mu < 0.1 or mu > 0.9)
-            ]
-
-            print(std_dev_criteria, len(filtered_pairs))
-
-            aug_train_feedback_pairs = np.array(
-                filtered_pairs, dtype=aug_train_feedback_pairs.dtype
-            )
+            print(std_dev_criteria, len(aug_train_feedback_pairs))
 
             new_train_feedback_pairs = np.concatenate(
                 [train_feedback_pairs, aug_train_feedback_pairs],
@@ -671,15 +1026,15 @@ def generate_score_pairs(
         else:
             new_train_feedback_pairs = train_feedback_pairs
 
-        np.savez(
+        save_pair(
             f"pair/{env_name}/{exp_name}/train/{score_model}-aug-{aug}-{pair_algo}.npz",
-            data=new_train_feedback_pairs,
+            new_train_feedback_pairs,
         )
 
         # val feedback pairs are same as before
-        np.savez(
+        save_pair(
             f"pair/{env_name}/{exp_name}/val/{score_model}-aug-{aug}-{pair_algo}.npz",
-            data=val_feedback_pairs,
+            val_feedback_pairs,
         )
 
     return
@@ -0,0 +1,39 @@
+import numpy as np
+
+
+class TopKSelector:
+    """
+    Keeps the k entries with the largest keys among chunks added so far
+    memory is O(k + chunk), the full candidate set is never held or sorted
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.keys = np.empty(0, dtype=np.float64)
+        self.indices = np.empty(0, dtype=np.int64)
+        self.values = None
+
+    def update(self, keys, indices, values):
+        """
+        add a chunk of entries, values are carried along with their keys
+        """
+        keys = np.concatenate((self.keys, keys))
+        indices = np.concatenate((self.indices, indices))
+        if self.values is not None:
+            values = np.concatenate((self.values, values))
+
+        if len(keys) > self.k:
+            top = np.argpartition(-keys, self.k - 1)[: self.k] if self.k > 0 else []
+            keys, indices, values = keys[top], indices[top], values[top]
+
+        self.keys, self.indices, self.values = keys, indices, values
+
+    def result(self):
+        """
+        return (indices, values) of top-k entries, by key descending then index
+        """
+        if self.values is None:
+            return self.indices, np.empty(0)
+
+        order = np.lexsort((self.indices, -self.keys))
+        return self.indices[order], self.values[order]
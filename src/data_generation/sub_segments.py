@@ -0,0 +1,96 @@
+from typing import Literal
+import numpy as np
+
+
+def as_pair_array(pairs):
+    """
+    return (N, 2, 2) int64 array of ((s0, e0), (s1, e1)) pairs
+    """
+    return np.asarray(pairs, dtype=np.int64).reshape(-1, 2, 2)
+
+
+def get_cut_ratios(
+    cut_type: Literal["0.5", "0.25", "half-random", "random"], size, rng=None
+):
+    """
+    return (size,) split ratios of cut_type
+
+    Args:
+        rng: np.random.Generator or RandomState, global np.random if None
+    """
+    if rng is None:
+        rng = np.random
+
+    if cut_type == "0.5":
+        return np.full(size, 0.5)
+    elif cut_type == "0.25":
+        return np.full(size, 0.25)
+    elif cut_type == "half-random":
+        return rng.uniform(0.25, 0.75, size)
+    elif cut_type == "random":
+        return rng.uniform(0.1, 0.9, size)
+    else:
+        raise ValueError(f"Invalid cut type: {cut_type}")
+
+
+def split_pairs(pairs, ratios):
+    """
+    Split both segments of every pair at the same ratio of their length.
+
+    Args:
+        pairs: (N, 2, 2) array or list of ((int, int), (int, int))
+        ratios: float or (N,) array, split point is start + int((end - start) * ratio)
+
+    Returns:
+        tuple of (N, 2, 2) arrays: head pairs and tail pairs
+    """
+    pairs = as_pair_array(pairs)
+    starts, ends = pairs[..., 0], pairs[..., 1]
+
+    ratios = np.broadcast_to(np.asarray(ratios, dtype=np.float64), len(pairs))
+    middles = starts + ((ends - starts) * ratios[:, None]).astype(np.int64)
+
+    heads = np.stack((starts, middles), axis=-1)
+    tails = np.stack((middles, ends), axis=-1)
+    return heads, tails
+
+
+def get_window_bounds(num_splits):
+    """
+    return (W,) start and end split indices of all contiguous k-of-num_splits
+    windows, ordered by window length then start
+    """
+    lengths, starts = np.nonzero(
+        np.arange(num_splits)[:, None] + np.arange(num_splits)[None, :] < num_splits
+    )
+    return starts, starts + lengths + 1
+
+
+def get_window_pairs(pairs, num_splits=5):
+    """
+    Divide both segments of every pair into num_splits parts and pair up the
+    same contiguous windows of parts, num_splits * (num_splits + 1) / 2 sub-pairs
+    per pair.
+
+    Args:
+        pairs: (N, 2, 2) array or list of ((int, int), (int, int))
+        num_splits: int
+
+    Returns:
+        (N * W, 2, 2) array, W sub-pairs of each pair are contiguous
+    """
+    pairs = as_pair_array(pairs)
+    starts, ends = pairs[..., 0, None], pairs[..., 1, None]
+
+    # internally dividing points, (N, 2, num_splits + 1)
+    weights = np.arange(num_splits + 1)
+    split_points = (starts * (num_splits - weights) + ends * weights) // num_splits
+
+    window_starts, window_ends = get_window_bounds(num_splits)
+    windows = np.stack(
+        (split_points[..., window_starts], split_points[..., window_ends]), axis=-1
+    )
+
+    # (N, 2, W, 2) -> (N, W, 2, 2)
+    return windows.transpose(0, 2, 1, 3).reshape(-1, 2, 2)
+
@@ -1,6 +1,57 @@
+import weakref
 import numpy as np
 
 
+class RewardPrefixIndex:
+    """
+    float64 prefix sums of rewards
+    sum of rewards[start:end] is prefix_sums[end] - prefix_sums[start]
+    """
+
+    _dataset_indices = weakref.WeakKeyDictionary()
+
+    def __init__(self, rewards):
+        self.prefix_sums = np.zeros(len(rewards) + 1, dtype=np.float64)
+        np.cumsum(rewards, dtype=np.float64, out=self.prefix_sums[1:])
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        """
+        return index of dataset["rewards"], built once per dataset object
+        """
+        try:
+            return cls._dataset_indices[dataset]
+        except KeyError:
+            index = cls(dataset["rewards"])
+            cls._dataset_indices[dataset] = index
+            return index
+        except TypeError:
+            # dataset is not weak-referenceable (e.g. dict)
+            return cls(dataset["rewards"])
+
+    def segment_sums(self, starts, ends):
+        """
+        return sum of rewards[start:end] for every (start, end)
+        """
+        starts = np.asarray(starts)
+        ends = np.asarray(ends)
+        return self.prefix_sums[ends] - self.prefix_sums[starts]
+
+    def pair_sums(self, s0, s1):
+        """
+        Args:
+            s0, s1: array of shape (N, 2) with (start, end) of each segment
+        Returns:
+            reward sums of s0 and s1 segments
+        """
+        s0 = np.asarray(s0).reshape(-1, 2)
+        s1 = np.asarray(s1).reshape(-1, 2)
+        return (
+            self.segment_sums(s0[:, 0], s0[:, 1]),
+            self.segment_sums(s1[:, 0], s1[:, 1]),
+        )
+
+
 def extract_trajectory_indices(dataset):
     terminals, timeouts = dataset["terminals"], dataset["timeouts"]
     indices = []
@@ -30,64 +81,94 @@ def generate_pairs_from_using_all(trajectories):
 
 
 def generate_pairs_from_indices(
-    dataset, trajectories, pair_count, trajectory_length, except_same=False
+    dataset,
+    trajectories,
+    pair_count,
+    trajectory_length,
+    except_same=False,
+    rng=None,
+    block_size=65536,
 ):
     """
     choose pairs from indices and cut them to have a fixed length with same starting point
     To utilize as many pairs as possible, start by using pairs from the beginning.
+    After that, candidate pairs are drawn in blocks of block_size until pair_count is reached.
+
+    Args:
+        rng: seed or np.random.Generator
+    Returns:
+        np.array of shape (pair_count, 2, 2), ((s0, e0), (s1, e1)) for each pair
     """
+    rng = np.random.default_rng(rng)
+    reward_index = RewardPrefixIndex.from_dataset(dataset) if except_same else None
 
-    pairs = []
-    valid_trajectories = [t for t in trajectories if (t[1] - t[0]) >= trajectory_length]
+    trajectories = np.asarray(trajectories, dtype=np.int64).reshape(-1, 2)
+    valid_trajectories = trajectories[
+        trajectories[:, 1] - trajectories[:, 0] >= trajectory_length
+    ]
     total_trajectory_count = len(valid_trajectories)
 
-    i = 0
-
-    while len(pairs) < pair_count:
-        if i * 2 < total_trajectory_count:
-            if i * 2 + 1 < total_trajectory_count:
-                first_pair_index = i * 2
-                second_pair_index = i * 2 + 1
-            else:
-                first_pair_index = i * 2
-                second_pair_index = np.random.randint(0, total_trajectory_count - 1)
-            i += 1
-        else:
-            first_pair_index, second_pair_index = np.random.randint(
-                0, total_trajectory_count - 1, 2
-            )
-
+    def cut_pairs(first_pair_index, second_pair_index):
         first_trajectory = valid_trajectories[first_pair_index]
         second_trajectory = valid_trajectories[second_pair_index]
-        min_length = min(
-            (
-                first_trajectory[1] - first_trajectory[0],
-                second_trajectory[1] - second_trajectory[0],
-            )
+        min_length = np.minimum(
+            first_trajectory[:, 1] - first_trajectory[:, 0],
+            second_trajectory[:, 1] - second_trajectory[:, 0],
         )
 
-        if min_length == trajectory_length:
-            first_start_point = 0
-            second_start_point = 0
-        else:
-            first_start_point = np.random.randint(0, min_length - trajectory_length)
-            second_start_point = np.random.randint(0, min_length - trajectory_length)
+        # start point is 0 if min_length == trajectory_length
+        max_start_point = np.maximum(min_length - trajectory_length, 1)
+        first_start = first_trajectory[:, 0] + rng.integers(0, max_start_point)
+        second_start = second_trajectory[:, 0] + rng.integers(0, max_start_point)
 
-        first_pair = (
-            first_trajectory[0] + first_start_point,
-            first_trajectory[0] + first_start_point + trajectory_length,
-        )
-        second_pair = (
-            second_trajectory[0] + second_start_point,
-            second_trajectory[0] + second_start_point + trajectory_length,
+        pairs = np.stack(
+            (
+                np.stack((first_start, first_start + trajectory_length), axis=1),
+                np.stack((second_start, second_start + trajectory_length), axis=1),
+            ),
+            axis=1,
         )
 
         if except_same:
-            first_rewards = dataset["rewards"][first_pair[0] : first_pair[1]]
-            second_rewards = dataset["rewards"][second_pair[0] : second_pair[1]]
-            if np.sum(first_rewards) == np.sum(second_rewards):
-                continue
+            first_sum, second_sum = reward_index.pair_sums(pairs[:, 0], pairs[:, 1])
+            pairs = pairs[first_sum != second_sum]
 
-        pairs.append((first_pair, second_pair))
+        return pairs
 
-    return pairs
+    # sequential pairs first
+    first_pair_index = np.arange(0, total_trajectory_count, 2)
+    second_pair_index = first_pair_index + 1
+    is_last_odd = second_pair_index >= total_trajectory_count
+    second_pair_index[is_last_odd] = rng.integers(
+        0, total_trajectory_count - 1, np.count_nonzero(is_last_odd)
+    )
+
+    pair_blocks = [cut_pairs(first_pair_index, second_pair_index)[:pair_count]]
+    remaining = pair_count - len(pair_blocks[0])
+
+    while remaining > 0:
+        size = max(remaining, block_size)
+        pair_index = rng.integers(0, total_trajectory_count - 1, (size, 2))
+        pairs = cut_pairs(pair_index[:, 0], pair_index[:, 1])[:remaining]
+        pair_blocks.append(pairs)
+        remaining -= len(pairs)
+
+    return np.concatenate(pair_blocks, axis=0)
+
+
+def make_feedback_pairs(pairs, mu):
+    """
+    return structured array of (s0, s1, mu) from (N, 2, 2) pairs and (N,) mu
+    """
+    feedback_pairs = np.zeros(
+        len(mu),
+        dtype=[
+            ("s0", "i4", (2,)),
+            ("s1", "i4", (2,)),
+            ("mu", "f"),
+        ],
+    )
+    feedback_pairs["s0"] = pairs[:, 0]
+    feedback_pairs["s1"] = pairs[:, 1]
+    feedback_pairs["mu"] = mu
+    return feedback_pairs
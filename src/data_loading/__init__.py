@@ -1,6 +1,22 @@
-from .preference_dataloader import get_dataloader, get_dataloader_from_processed_data
+from .cache import get_cache_stats, invalidate_cache, set_cache_max_bytes
+from .pair_array import PairArray, save_pair
+from .preference_dataloader import (
+    IndexedPreferenceDataset,
+    IndexedSegmentDataset,
+    PreferenceBatchLoader,
+    apply_mask,
+    batch_to_device,
+    mask_to_lengths,
+    get_dataloader,
+    get_dataloader_from_pairs,
+    get_dataloader_from_processed_data,
+)
 from .load_data import (
+    DatasetHandle,
+    RelabeledDataset,
     load_dataset,
+    load_relabeled_dataset,
+    save_reward_sidecar,
     load_pair,
     save_dataset,
     get_processed_data,
@@ -9,9 +25,25 @@ from .load_data import (
 )
 
 __all__ = [
+    "get_cache_stats",
+    "invalidate_cache",
+    "set_cache_max_bytes",
+    "PairArray",
+    "save_pair",
+    "IndexedPreferenceDataset",
+    "IndexedSegmentDataset",
+    "PreferenceBatchLoader",
+    "apply_mask",
+    "batch_to_device",
+    "mask_to_lengths",
     "get_dataloader",
+    "get_dataloader_from_pairs",
     "get_dataloader_from_processed_data",
+    "DatasetHandle",
+    "RelabeledDataset",
     "load_dataset",
+    "load_relabeled_dataset",
+    "save_reward_sidecar",
     "load_pair",
     "save_dataset",
     "get_processed_data",
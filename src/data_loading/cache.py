@@ -0,0 +1,132 @@
+import os
+from collections import OrderedDict
+import numpy as np
+
+from utils.manifest import get_file_signature
+
+
+DEFAULT_CACHE_MAX_BYTES = 4 * 1024**3
+
+
+def get_paths_signature(paths):
+    """
+    return hashable (mtime, size) signature of every path, None for missing paths
+    """
+    signatures = (get_file_signature(path) for path in paths)
+    return tuple(
+        tuple(signature) if signature is not None else None
+        for signature in signatures
+    )
+
+
+def get_resident_bytes(value):
+    """
+    bytes held in memory by value, memory-mapped arrays are not counted
+    """
+    if isinstance(value, np.memmap):
+        return 0
+    return getattr(value, "nbytes", 0)
+
+
+class FileCache:
+    """
+    Process-wide LRU cache of values loaded from files
+    entries are keyed by (name, paths) and reloaded when mtime or size of a path changes
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, paths, loader):
+        """
+        return cached value for (name, paths), call loader() on miss
+        """
+        key = (name, tuple(os.path.abspath(path) for path in paths))
+        signature = get_paths_signature(paths)
+
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == signature:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        if entry is not None:
+            self._remove(key)
+
+        value = loader()
+        nbytes = get_resident_bytes(value)
+
+        if nbytes <= self.max_bytes:
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            # signature is read again, loader may have created the file
+            signature = get_paths_signature(paths)
+            self.entries[key] = (signature, value, nbytes)
+            self.resident_bytes += nbytes
+            self.evict()
+
+        return value
+
+    def invalidate(self, path=None):
+        """
+        drop every entry that depends on path, or all entries if path is None
+        """
+        if path is None:
+            keys = list(self.entries)
+        else:
+            path = os.path.abspath(path)
+            keys = [key for key in self.entries if path in key[1]]
+
+        for key in keys:
+            self._remove(key)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+            "entries": len(self.entries),
+            "resident_bytes": self.resident_bytes,
+        }
+
+    def _remove(self, key):
+        _, _, nbytes = self.entries.pop(key)
+        self.resident_bytes -= nbytes
+
+    def evict(self):
+        """
+        drop least recently used entries until resident bytes fit max_bytes
+        """
+        while self.resident_bytes > self.max_bytes and self.entries:
+            self._remove(next(iter(self.entries)))
+
+
+file_cache = FileCache()
+
+
+def invalidate_cache(path=None):
+    """
+    Invalidate cached datasets and pairs loaded from path, or everything if path is None
+    """
+    file_cache.invalidate(path)
+
+
+def get_cache_stats():
+    """
+    return hit/miss statistics of the process-wide file cache
+    """
+    return file_cache.stats()
+
+
+def set_cache_max_bytes(max_bytes):
+    """
+    Change LRU bound of resident bytes, evicting entries if needed
+    """
+    file_cache.max_bytes = max_bytes
+    file_cache.evict()
@@ -1,9 +1,14 @@
+import json
 import os
 import random
+import shutil
 from types import SimpleNamespace
 import numpy as np
 
-from utils import get_pair_path
+from data_loading.cache import file_cache
+from data_loading.pair_array import PairArray, load_npz_mmap
+from utils import get_new_dataset_path, get_pair_path
+from utils.manifest import get_file_signature, hash_file
 
 
 metaworld_ids = {
@@ -330,17 +335,195 @@ def save_dataset(env_name):
         save_d4rl_dataset(env_name=env_name, save_dir=save_dir)
 
 
-def load_dataset(env_name):
+class DatasetHandle:
+    """
+    Read-only dataset backed by a directory of .npy files
+    each key is opened lazily with mmap_mode="r", so processes share the page cache
+    """
+
+    def __init__(self, dir_path):
+        self.dir_path = dir_path
+        self._keys = sorted(
+            file[: -len(".npy")]
+            for file in os.listdir(dir_path)
+            if file.endswith(".npy")
+        )
+        self._arrays = {}
+
+    def __getitem__(self, key):
+        if key not in self._arrays:
+            if key not in self._keys:
+                raise KeyError(f"{key} is not a file in {self.dir_path}")
+            self._arrays[key] = np.load(
+                os.path.join(self.dir_path, f"{key}.npy"), mmap_mode="r"
+            )
+        return self._arrays[key]
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def keys(self):
+        return list(self._keys)
+
+
+def convert_npz_to_npy_dir(npz_path, dir_path):
+    """
+    Write every array of npz_path as a raw .npy file in dir_path
+    skip if dir_path is already newer than npz_path
+    """
+    if os.path.isdir(dir_path) and os.path.getmtime(dir_path) >= os.path.getmtime(
+        npz_path
+    ):
+        return
+
+    temp_dir = f"{dir_path}.tmp-{os.getpid()}"
+    os.makedirs(temp_dir, exist_ok=True)
+
+    with np.load(npz_path) as npz:
+        for key in npz.files:
+            np.save(os.path.join(temp_dir, f"{key}.npy"), npz[key])
+
+    if os.path.isdir(dir_path):
+        shutil.rmtree(dir_path)
+
+    try:
+        os.replace(temp_dir, dir_path)
+    except OSError:
+        # another process finished the conversion first
+        shutil.rmtree(temp_dir)
+
+    print(f"Dataset converted to {dir_path}")
+
+
+def get_dataset_paths(env_name):
+    """
+    return (npz path, .npy directory path) of the qualified dataset
+    """
     dir_path = f"dataset/{env_name}"
-    dataset_name = "qualified_dataset.npz"
-    dataset = np.load(os.path.join(dir_path, dataset_name))
+    return (
+        os.path.join(dir_path, "qualified_dataset.npz"),
+        os.path.join(dir_path, "qualified_dataset"),
+    )
+
+
+def load_dataset(env_name):
+    """
+    return DatasetHandle of the qualified dataset
+    qualified_dataset.npz is converted to memory-mapped .npy files on first use
+    """
+    npz_path, npy_dir_path = get_dataset_paths(env_name)
+
+    def load():
+        if os.path.exists(npz_path):
+            convert_npz_to_npy_dir(npz_path, npy_dir_path)
+        return DatasetHandle(npy_dir_path)
+
+    return file_cache.get("dataset", [npz_path, npy_dir_path], load)
+
+
+class RelabeledDataset:
+    """
+    Read-only dataset of a base dataset with rewards of a reward sidecar
+    observations and actions are the memory-mapped base arrays, nothing is copied
+    terminals include timeouts, as in datasets relabeled by change_reward
+    """
+
+    def __init__(self, base, rewards):
+        self.base = base
+        self.rewards = rewards
+        self._keys = ["observations", "actions", "rewards", "terminals"]
+        self._terminals = None
 
-    return dataset
+    def __getitem__(self, key):
+        if key == "rewards":
+            return self.rewards
+        if key == "terminals":
+            if self._terminals is None:
+                self._terminals = self.base["terminals"] | self.base["timeouts"]
+            return self._terminals
+        if key in self._keys:
+            return self.base[key]
+        raise KeyError(f"{key} is not a key of relabeled dataset")
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def keys(self):
+        return list(self._keys)
+
+
+def save_reward_sidecar(sidecar_path, env_name, rewards_path):
+    """
+    Save sidecar of relabeled rewards, pointing to the base dataset by content hash
+    """
+    npz_path, _ = get_dataset_paths(env_name)
+    base_signature = get_file_signature(npz_path)
+
+    sidecar = {
+        "env_name": env_name,
+        "base_dataset": npz_path,
+        "base_hash": hash_file(npz_path, base_signature),
+        "base_signature": base_signature,
+        "rewards": os.path.relpath(rewards_path, os.path.dirname(sidecar_path)),
+    }
+    with open(sidecar_path, "w", encoding="utf-8") as file:
+        json.dump(sidecar, file, indent=2)
+
+
+def load_relabeled_dataset(env_name, exp_name, pair_algo, reward_model_algo):
+    """
+    return RelabeledDataset of the base dataset and rewards of its sidecar
+    raise ValueError if the base dataset changed after relabeling
+    """
+    sidecar_path = get_new_dataset_path(
+        env_name, exp_name, pair_algo, reward_model_algo
+    )
+    if not os.path.exists(sidecar_path):
+        raise FileNotFoundError(f"Reward sidecar not found at {sidecar_path}")
+
+    with open(sidecar_path, "r", encoding="utf-8") as file:
+        sidecar = json.load(file)
+
+    base_path = sidecar["base_dataset"]
+    rewards_path = os.path.join(os.path.dirname(sidecar_path), sidecar["rewards"])
+
+    base_signature = get_file_signature(base_path)
+    if base_signature != sidecar["base_signature"] and (
+        hash_file(base_path, base_signature) != sidecar["base_hash"]
+    ):
+        raise ValueError(
+            f"Base dataset {base_path} changed after relabeling {sidecar_path}"
+        )
+
+    def load():
+        base = load_dataset(sidecar["env_name"])
+        rewards = np.load(rewards_path, mmap_mode="r")
+        if len(rewards) != len(base["observations"]):
+            raise ValueError(
+                f"{rewards_path} has {len(rewards)} rewards, "
+                f"base dataset has {len(base['observations'])} steps"
+            )
+        return RelabeledDataset(base, rewards)
+
+    return file_cache.get("relabeled", [sidecar_path, rewards_path, base_path], load)
 
 
 def load_pair(env_name, exp_name, pair_type, pair_algo):
     """
-    {data: [(s0, s1, mu)]}
+    return PairArray of (s0, s1, mu)
+    columnar files are memory-mapped, legacy {data: [(s0, s1, mu)]} files are read
     """
     path = get_pair_path(
         env_name=env_name, exp_name=exp_name, pair_type=pair_type, pair_algo=pair_algo
@@ -349,54 +532,77 @@ def load_pair(env_name, exp_name, pair_type, pair_algo):
     if not os.path.exists(path):
         raise FileNotFoundError(f"Pair file not found at {path}")
 
-    pair = np.load(path, allow_pickle=True)
+    def load():
+        with np.load(path) as pair:
+            if "data" in pair.files:
+                return PairArray.from_structured(pair["data"])
+        columns = load_npz_mmap(path)
+        return PairArray(columns["s0"], columns["s1"], columns["mu"])
+
+    return file_cache.get("pair", [path], load)
+
+
+def gather_segments(array, starts, lengths, max_len):
+    """
+    batched gather of array[start : start + length] for every segment,
+    zero padded to max_len
+
+    Returns:
+        np.array of shape (len(starts), max_len, *array.shape[1:])
+    """
+    offsets = np.arange(max_len)
+    valid = offsets[None, :] < lengths[:, None]
+    index = np.where(valid, starts[:, None] + offsets[None, :], 0)
+
+    segments = np.asarray(array[index], dtype=np.float32)
+    segments[~valid] = 0
 
-    return pair["data"]
+    return segments
 
 
 def process_pairs(dataset, pair):
     """
-    return structured array of (s0, s1, mu) pairs
-    s0, s1 is fully concatenated structured array of (observations, actions)
+    return structured array of (s0, s1, mu, length0, length1) pairs
+    s0, s1 is a zero padded structured array of (observations, actions)
+    length0, length1 is the number of valid steps in s0, s1
     """
     observations = dataset["observations"]
     actions = dataset["actions"]
 
-    processed_data = []
+    s0_idx = np.asarray(pair["s0"], dtype=np.int64).reshape(-1, 2)
+    s1_idx = np.asarray(pair["s1"], dtype=np.int64).reshape(-1, 2)
+    length0 = s0_idx[:, 1] - s0_idx[:, 0]
+    length1 = s1_idx[:, 1] - s1_idx[:, 0]
+    max_len = int(max(length0.max(initial=0), length1.max(initial=0)))
+
+    segment_dtype = [
+        ("observations", "f4", (observations.shape[1],)),
+        ("actions", "f4", (actions.shape[1],)),
+    ]
+    processed_data = np.zeros(
+        len(s0_idx),
+        dtype=[
+            ("s0", segment_dtype, (max_len,)),
+            ("s1", segment_dtype, (max_len,)),
+            ("mu", "f4"),
+            ("length0", "i4"),
+            ("length1", "i4"),
+        ],
+    )
 
-    for entry in pair:
-        s0_idx, s1_idx, mu = (
-            entry["s0"],
-            entry["s1"],
-            entry["mu"],
+    for key, idx, length in (("s0", s0_idx, length0), ("s1", s1_idx, length1)):
+        processed_data[key]["observations"] = gather_segments(
+            observations, idx[:, 0], length, max_len
         )
-
-        s0_obs = observations[s0_idx[0] : s0_idx[1]]
-        s0_act = actions[s0_idx[0] : s0_idx[1]]
-        s1_obs = observations[s1_idx[0] : s1_idx[1]]
-        s1_act = actions[s1_idx[0] : s1_idx[1]]
-
-        dtype_list_s0 = [
-            ("observations", "f4", (s0_obs.shape[1],)),
-            ("actions", "f4", (s0_act.shape[1],)),
-        ]
-        s0 = np.array(list(zip(s0_obs, s0_act)), dtype=dtype_list_s0)
-
-        dtype_list_s1 = [
-            ("observations", "f4", (s1_obs.shape[1],)),
-            ("actions", "f4", (s1_act.shape[1],)),
-        ]
-        s1 = np.array(list(zip(s1_obs, s1_act)), dtype=dtype_list_s1)
-
-        processed_data.append(
-            (
-                s0,
-                s1,
-                mu,
-            )
+        processed_data[key]["actions"] = gather_segments(
+            actions, idx[:, 0], length, max_len
         )
 
-    return np.array(processed_data, dtype=[("s0", "O"), ("s1", "O"), ("mu", "f4")])
+    processed_data["mu"] = pair["mu"]
+    processed_data["length0"] = length0
+    processed_data["length1"] = length1
+
+    return processed_data
 
 
 def get_processed_data(env_name, exp_name, pair_type, pair_algo):
@@ -405,7 +611,15 @@ def get_processed_data(env_name, exp_name, pair_type, pair_algo):
     s0, s1 is a structured array of (observations, actions)
     mu is a float
     """
-    dataset = load_dataset(env_name)
-    pair = load_pair(env_name, exp_name, pair_type, pair_algo)
+    pair_path = get_pair_path(
+        env_name=env_name, exp_name=exp_name, pair_type=pair_type, pair_algo=pair_algo
+    )
 
-    return process_pairs(dataset, pair)
+    def load():
+        dataset = load_dataset(env_name)
+        pair = load_pair(env_name, exp_name, pair_type, pair_algo)
+        return process_pairs(dataset, pair)
+
+    return file_cache.get(
+        "processed_data", [*get_dataset_paths(env_name), pair_path], load
+    )
@@ -0,0 +1,122 @@
+import struct
+import zipfile
+import numpy as np
+
+
+PAIR_DTYPE = np.dtype([("s0", "i4", (2,)), ("s1", "i4", (2,)), ("mu", "f")])
+
+
+class PairArray:
+    """
+    Columnar (s0, s1, mu) pairs
+    s0, s1 is (N, 2) int32 array of (start, end), mu is (N,) float32 array
+    supports the field, index and iteration access of structured pair arrays
+    """
+
+    dtype = PAIR_DTYPE
+
+    def __init__(self, s0, s1, mu):
+        self.s0 = s0
+        self.s1 = s1
+        self.mu = mu
+
+    @staticmethod
+    def from_structured(pairs):
+        """
+        return PairArray from structured array with s0, s1, mu fields
+        """
+        return PairArray(
+            np.asarray(pairs["s0"], dtype=np.int32).reshape(-1, 2),
+            np.asarray(pairs["s1"], dtype=np.int32).reshape(-1, 2),
+            np.asarray(pairs["mu"], dtype=np.float32).reshape(-1),
+        )
+
+    @property
+    def nbytes(self):
+        return sum(
+            column.nbytes
+            for column in (self.s0, self.s1, self.mu)
+            if not isinstance(column, np.memmap)
+        )
+
+    def to_structured(self):
+        pairs = np.empty(len(self), dtype=PAIR_DTYPE)
+        pairs["s0"] = self.s0
+        pairs["s1"] = self.s1
+        pairs["mu"] = self.mu
+        return pairs
+
+    def __array__(self, dtype=None, copy=None):
+        pairs = self.to_structured()
+        return pairs if dtype is None else pairs.astype(dtype)
+
+    def __len__(self):
+        return len(self.mu)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in PAIR_DTYPE.names:
+                raise KeyError(key)
+            return getattr(self, key)
+        if isinstance(key, (int, np.integer)):
+            return np.array((self.s0[key], self.s1[key], self.mu[key]), PAIR_DTYPE)[()]
+        return PairArray(self.s0[key], self.s1[key], self.mu[key])
+
+    def __iter__(self):
+        return iter(self.to_structured())
+
+
+def save_pair(path, pairs):
+    """
+    Save pairs with s0, s1, mu fields as uncompressed, pickle-free columns
+    """
+    np.savez(
+        path,
+        s0=np.asarray(pairs["s0"], dtype=np.int32).reshape(-1, 2),
+        s1=np.asarray(pairs["s1"], dtype=np.int32).reshape(-1, 2),
+        mu=np.asarray(pairs["mu"], dtype=np.float32).reshape(-1),
+    )
+
+
+def load_npz_mmap(path):
+    """
+    return dict of read-only memmaps of the arrays stored in an uncompressed npz file
+    """
+    arrays = {}
+
+    with zipfile.ZipFile(path) as zip_file, open(path, "rb") as file:
+        for info in zip_file.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{info.filename} in {path} is compressed")
+
+            # local file header is 30 bytes + file name + extra field
+            file.seek(info.header_offset)
+            name_length, extra_length = struct.unpack("<HH", file.read(30)[26:30])
+            file.seek(info.header_offset + 30 + name_length + extra_length)
+
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(file)
+            elif version == (2, 0):
+                header = np.lib.format.read_array_header_2_0(file)
+            else:
+                raise ValueError(f"Unsupported npy version {version} in {path}")
+            shape, fortran_order, dtype = header
+
+            if dtype.hasobject:
+                raise ValueError(f"{info.filename} in {path} needs pickle")
+
+            key = info.filename[: -len(".npy")]
+            if int(np.prod(shape)) == 0:
+                arrays[key] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[key] = np.memmap(
+                    path,
+                    dtype=dtype,
+                    mode="r",
+                    offset=file.tell(),
+                    shape=shape,
+                    order="F" if fortran_order else "C",
+                )
+
+    return arrays
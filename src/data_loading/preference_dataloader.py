@@ -1,107 +1,289 @@
+import weakref
+import numpy as np
 import torch
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import Dataset
 
-from data_loading.load_data import get_processed_data
+from data_loading.load_data import load_dataset, load_pair
 from utils import get_pair_path
 
 
+segment_features_by_dataset = weakref.WeakKeyDictionary()
+
+
+def batch_to_device(batch, device):
+    """
+    move every tensor of batch to device, masks of fixed-length batches stay None
+    """
+    return [x.to(device) if x is not None else None for x in batch]
+
+
+def mask_to_lengths(mask):
+    """
+    return number of valid steps of each segment, None if mask is None
+    """
+    if mask is None:
+        return None
+    return (1 - mask.squeeze(dim=-1)).sum(dim=1)
+
+
+def apply_mask(values, mask):
+    """
+    zero out padded steps of values, values are returned as is if mask is None
+    """
+    if mask is None:
+        return values
+    return values * (1 - mask)
+
+
+def get_segment_features(dataset):
+    """
+    return float32 tensor of concatenated (observations, actions) for every step
+    built once per dataset object and shared by every IndexedPreferenceDataset
+    """
+    try:
+        return segment_features_by_dataset[dataset]
+    except (KeyError, TypeError):
+        pass
+
+    features = torch.from_numpy(
+        np.concatenate(
+            (
+                np.asarray(dataset["observations"], dtype=np.float32),
+                np.asarray(dataset["actions"], dtype=np.float32),
+            ),
+            axis=1,
+        )
+    )
+
+    try:
+        segment_features_by_dataset[dataset] = features
+    except TypeError:
+        # dataset is not weak-referenceable (e.g. dict)
+        pass
+
+    return features
+
+
+class IndexedSegmentDataset(Dataset):
+    """
+    Dataset of (start, end) segments backed by the shared segment features
+    only segment indices are stored, steps are gathered per batch
+    """
+
+    def __init__(self, dataset, segments):
+        self.features = get_segment_features(dataset)
+        self.obs_dim = dataset["observations"].shape[1]
+        self.act_dim = dataset["actions"].shape[1]
+
+        segments = torch.from_numpy(
+            np.asarray(segments, dtype=np.int64).reshape(-1, 2)
+        )
+        self.starts = segments[:, 0]
+        self.lengths = segments[:, 1] - segments[:, 0]
+
+        max_len = int(self.lengths.max()) if len(self.lengths) > 0 else 0
+        self.steps = torch.arange(max_len)
+
+        # every segment has max_len steps, batches are built without masks
+        self.fixed_length = bool(torch.all(self.lengths == max_len))
+
+    def get_batch(self, indices):
+        """
+        return zero padded (observations, actions, mask) of segments at indices
+        mask is 1 for padded steps, None if segments have fixed length
+        """
+        starts = self.starts[indices]
+
+        if self.fixed_length:
+            segments = self.features[starts[:, None] + self.steps[None, :]]
+            return segments[..., : self.obs_dim], segments[..., self.obs_dim :], None
+
+        valid = self.steps[None, :] < self.lengths[indices][:, None]
+        index = torch.where(valid, starts[:, None] + self.steps[None, :], 0)
+
+        segments = self.features[index]
+        segments[~valid] = 0
+        mask = (~valid).float().unsqueeze(-1)
+
+        return segments[..., : self.obs_dim], segments[..., self.obs_dim :], mask
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, idx):
+        return tuple(
+            x[0] if x is not None else None
+            for x in self.get_batch(torch.tensor([idx]))
+        )
+
+    def get_dimensions(self):
+        return self.obs_dim, self.act_dim
+
+
+class IndexedPreferenceDataset(Dataset):
+    """
+    Dataset of (s0, s1, mu) pairs backed by the shared segment features
+    s0 segments are followed by s1 segments in one IndexedSegmentDataset
+    """
+
+    def __init__(self, dataset, pairs):
+        s0 = np.asarray(pairs["s0"], dtype=np.int64).reshape(-1, 2)
+        s1 = np.asarray(pairs["s1"], dtype=np.int64).reshape(-1, 2)
+        self.segments = IndexedSegmentDataset(dataset, np.concatenate((s0, s1)))
+        self.mu = torch.from_numpy(np.asarray(pairs["mu"], dtype=np.float32).copy())
+        self.fixed_length = self.segments.fixed_length
+
+    def get_batch(self, indices):
+        """
+        return (s0_obs, s0_act, s1_obs, s1_act, mu, mask0, mask1) for indices
+        """
+        s0_obs, s0_act, mask0 = self.segments.get_batch(indices)
+        s1_obs, s1_act, mask1 = self.segments.get_batch(indices + len(self))
+        return (s0_obs, s0_act, s1_obs, s1_act, self.mu[indices], mask0, mask1)
+
+    def __len__(self):
+        return len(self.mu)
+
+    def __getitem__(self, idx):
+        return tuple(
+            x[0] if x is not None else None
+            for x in self.get_batch(torch.tensor([idx]))
+        )
+
+    def get_dimensions(self):
+        return self.segments.get_dimensions()
+
+
 class PreferenceDataset(Dataset):
     """
     Custom Dataset for handling structured (s0, s1, mu) pairs
     """
 
     def __init__(self, processed_data):
-        max_len = max(len(item["s0"]["observations"]) for item in processed_data)
-
-        self.processed_data = []
-        for item in processed_data:
-            item_len_s0 = len(item["s0"]["observations"])
-            item_len_s1 = len(item["s1"]["observations"])
-
-            new_item = {
-                "s0": {
-                    "observations": None,
-                    "actions": None,
-                },
-                "s1": {
-                    "observations": None,
-                    "actions": None,
-                },
-                "mu": torch.tensor(item["mu"], dtype=torch.float32),
-                "mask0": None,
-                "mask1": None,
-            }
-
-            s0_obs = torch.tensor(item["s0"]["observations"], dtype=torch.float32)
-            s0_act = torch.tensor(item["s0"]["actions"], dtype=torch.float32)
-            s1_obs = torch.tensor(item["s1"]["observations"], dtype=torch.float32)
-            s1_act = torch.tensor(item["s1"]["actions"], dtype=torch.float32)
-
-            mask0 = torch.zeros(max_len, dtype=torch.float32)
-            mask0[item_len_s0:] = 1
-
-            mask1 = torch.zeros(max_len, dtype=torch.float32)
-            mask1[item_len_s1:] = 1
-
-            new_item["s0"]["observations"] = self.pad_sequence(s0_obs, max_len)
-            new_item["s0"]["actions"] = self.pad_sequence(s0_act, max_len)
-            new_item["s1"]["observations"] = self.pad_sequence(s1_obs, max_len)
-            new_item["s1"]["actions"] = self.pad_sequence(s1_act, max_len)
-            new_item["mask0"] = mask0.unsqueeze(1)
-            new_item["mask1"] = mask1.unsqueeze(1)
-
-            self.processed_data.append(new_item)
-
-    def pad_sequence(self, seq, max_len):
-        pad_size = max_len - seq.size(0)
-        if pad_size > 0:
-            padding = torch.zeros(pad_size, seq.size(1), dtype=torch.float32)
-            seq = torch.cat([seq, padding], dim=0)
-        return seq
+        max_len = processed_data["s0"].shape[1]
+        steps = torch.arange(max_len)
+
+        self.s0_observations = torch.from_numpy(
+            np.ascontiguousarray(processed_data["s0"]["observations"])
+        )
+        self.s0_actions = torch.from_numpy(
+            np.ascontiguousarray(processed_data["s0"]["actions"])
+        )
+        self.s1_observations = torch.from_numpy(
+            np.ascontiguousarray(processed_data["s1"]["observations"])
+        )
+        self.s1_actions = torch.from_numpy(
+            np.ascontiguousarray(processed_data["s1"]["actions"])
+        )
+        self.mu = torch.tensor(processed_data["mu"], dtype=torch.float32)
+
+        length0 = torch.from_numpy(processed_data["length0"].astype(np.int64))
+        length1 = torch.from_numpy(processed_data["length1"].astype(np.int64))
+
+        # every segment has max_len steps, batches are built without masks
+        self.fixed_length = bool(
+            torch.all(length0 == max_len) and torch.all(length1 == max_len)
+        )
+
+        # mask is 1 for padded steps, shape of (max_len, 1) per item
+        if self.fixed_length:
+            self.mask0 = None
+            self.mask1 = None
+        else:
+            self.mask0 = (steps[None, :] >= length0[:, None]).float().unsqueeze(-1)
+            self.mask1 = (steps[None, :] >= length1[:, None]).float().unsqueeze(-1)
 
     def __len__(self):
-        return len(self.processed_data)
+        return len(self.mu)
 
-    def __getitem__(self, idx):
-        s0 = self.processed_data[idx]["s0"]
-        s1 = self.processed_data[idx]["s1"]
-        mu = self.processed_data[idx]["mu"]
-        mask0 = self.processed_data[idx]["mask0"]
-        mask1 = self.processed_data[idx]["mask1"]
+    def get_batch(self, indices):
+        """
+        return (s0_obs, s0_act, s1_obs, s1_act, mu, mask0, mask1) for indices
+        """
+        return self[indices]
 
+    def __getitem__(self, idx):
         return (
-            s0["observations"],
-            s0["actions"],
-            s1["observations"],
-            s1["actions"],
-            mu,
-            mask0,
-            mask1,
+            self.s0_observations[idx],
+            self.s0_actions[idx],
+            self.s1_observations[idx],
+            self.s1_actions[idx],
+            self.mu[idx],
+            self.mask0[idx] if self.mask0 is not None else None,
+            self.mask1[idx] if self.mask1 is not None else None,
         )
 
     def get_dimensions(self):
-        s0 = self.processed_data[0]["s0"]
-        obs_dim = s0["observations"].shape[-1]
-        act_dim = s0["actions"].shape[-1]
+        obs_dim = self.s0_observations.shape[-1]
+        act_dim = self.s0_actions.shape[-1]
         return obs_dim, act_dim
 
 
+class PreferenceBatchLoader:
+    """
+    Yields whole batches of a preference dataset via its get_batch(indices)
+    same 7-tuple layout as DataLoader, without per-sample __getitem__ and collate
+    """
+
+    def __init__(
+        self,
+        dataset,
+        batch_size=32,
+        shuffle=True,
+        drop_last=True,
+        seed=None,
+    ):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+        # without seed, every epoch draws its seed from the global torch RNG as
+        # RandomSampler does, so torch.manual_seed controls the shuffling
+        self.generator = torch.Generator()
+        self.seed = seed
+        if seed is not None:
+            self.generator.manual_seed(seed)
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.dataset) // self.batch_size
+        return -(-len(self.dataset) // self.batch_size)
+
+    def __iter__(self):
+        num_samples = len(self.dataset)
+        if self.shuffle:
+            if self.seed is None:
+                self.generator.manual_seed(
+                    int(torch.empty((), dtype=torch.int64).random_().item())
+                )
+            order = torch.randperm(num_samples, generator=self.generator)
+        else:
+            order = torch.arange(num_samples)
+
+        for batch_index in range(len(self)):
+            start = batch_index * self.batch_size
+            yield self.dataset.get_batch(order[start : start + self.batch_size])
+
+
 def get_dataloader_from_processed_data(
     processed_data,
     batch_size=32,
     shuffle=True,
     drop_last=True,
+    seed=None,
 ):
     """
-    Returns a DataLoader object for the given processed data
+    Returns a PreferenceBatchLoader for the given processed data
     """
     dataset = PreferenceDataset(processed_data)
 
-    dataloader = DataLoader(
+    dataloader = PreferenceBatchLoader(
         dataset,
         batch_size=batch_size,
         shuffle=shuffle,
         drop_last=drop_last,
+        seed=seed,
     )
 
     print(f"Processed data with {len(dataset)} samples")
@@ -109,6 +291,32 @@ def get_dataloader_from_processed_data(
     return dataloader
 
 
+def get_dataloader_from_pairs(
+    dataset,
+    pairs,
+    batch_size=32,
+    shuffle=True,
+    drop_last=True,
+    seed=None,
+):
+    """
+    Returns a PreferenceBatchLoader gathering segments of pairs from dataset per batch
+    """
+    preference_dataset = IndexedPreferenceDataset(dataset, pairs)
+
+    dataloader = PreferenceBatchLoader(
+        preference_dataset,
+        batch_size=batch_size,
+        shuffle=shuffle,
+        drop_last=drop_last,
+        seed=seed,
+    )
+
+    print(f"Indexed data with {len(preference_dataset)} samples")
+
+    return dataloader
+
+
 def get_dataloader(
     env_name,
     exp_name,
@@ -117,9 +325,10 @@ def get_dataloader(
     batch_size=32,
     shuffle=True,
     drop_last=True,
+    seed=None,
 ):
     """
-    Returns a DataLoader object for the given pair data
+    Returns a PreferenceBatchLoader for the given pair data
     """
 
     pair_path = get_pair_path(
@@ -127,10 +336,16 @@ def get_dataloader(
     )
     print(f"Loaded {pair_path} dataset")
 
-    processed_data = get_processed_data(env_name, exp_name, pair_type, pair_algo)
+    dataset = load_dataset(env_name)
+    pairs = load_pair(env_name, exp_name, pair_type, pair_algo)
 
-    dataloader = get_dataloader_from_processed_data(
-        processed_data, batch_size=batch_size, shuffle=shuffle, drop_last=drop_last
+    dataloader = get_dataloader_from_pairs(
+        dataset,
+        pairs,
+        batch_size=batch_size,
+        shuffle=shuffle,
+        drop_last=drop_last,
+        seed=seed,
     )
 
     return dataloader
@@ -2,6 +2,12 @@ from .analyze_dataset import analyze_env_dataset, save_reward_graph
 from .evaluate_score_model import evaluate_score_model
 from .evaluate_reward_model import evaluate_and_log_reward_models
 from .evaluate_policy_model import evaluate_best_and_last_policy
+from .metrics import (
+    AccuracyAccumulator,
+    MeanVarAccumulator,
+    MSEAccumulator,
+    PearsonAccumulator,
+)
 from .plot_pair import plot_pair, evaluate_pair
 from .plot_policy_model import plot_policy_models
 
@@ -11,6 +17,10 @@ __all__ = [
     "evaluate_score_model",
     "evaluate_and_log_reward_models",
     "evaluate_best_and_last_policy",
+    "AccuracyAccumulator",
+    "MeanVarAccumulator",
+    "MSEAccumulator",
+    "PearsonAccumulator",
     "plot_pair",
     "evaluate_pair",
     "plot_policy_models",
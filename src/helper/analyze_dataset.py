@@ -2,8 +2,8 @@ import json
 import numpy as np
 import matplotlib.pyplot as plt
 
-from data_loading import load_dataset
-from utils import get_new_dataset_path, get_new_dataset_log_path
+from data_loading import load_dataset, load_relabeled_dataset
+from utils import get_new_dataset_log_path
 
 
 def save_trajectory_lengths(dataset, env_name):
@@ -79,11 +79,7 @@ def save_reward_graph(
     """
     Save the reward graph of the given environment, experiment, pair algorithm, and reward model algorithm.
     """
-    dataset_path = get_new_dataset_path(
-        env_name, exp_name, pair_algo, reward_model_algo
-    )
-    dataset_npz = np.load(dataset_path)
-    dataset = {key: dataset_npz[key] for key in dataset_npz}
+    dataset = load_relabeled_dataset(env_name, exp_name, pair_algo, reward_model_algo)
 
     raw_dataset = load_dataset(env_name)
 
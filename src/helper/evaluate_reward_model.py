@@ -2,16 +2,39 @@ import csv
 import glob
 import os
 from typing import List
-import torch
 import matplotlib.pyplot as plt
-from scipy.stats import pearsonr
 import numpy as np
 
-from data_loading import load_dataset, get_dataloader, load_pair
-from reward_learning import RewardModelBase, MR
+from data_generation import RewardPrefixIndex
+from data_loading import load_dataset, load_pair
+from reward_learning import RewardModelBase, MR, predict_step_rewards
+from reward_learning.predict_rewards import DEFAULT_CHUNK_ROWS
 from utils import get_reward_model_path, get_reward_model_log_path
+from helper.metrics import AccuracyAccumulator, MSEAccumulator, PearsonAccumulator
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# points of the step reward scatter plot, the dataset is subsampled evenly
+SCATTER_MAX_POINTS = 200000
+
+
+class RewardTable:
+    """
+    Ensemble mean reward of every dataset step, predicted once in chunks
+    segment sums of any number of pairs are prefix-sum lookups
+    """
+
+    def __init__(self, rewards):
+        self.rewards = rewards
+        self.index = RewardPrefixIndex(rewards)
+
+    @classmethod
+    def from_models(cls, dataset, models: List[RewardModelBase], chunk_rows=None):
+        return cls(predict_step_rewards(dataset, models, chunk_rows=chunk_rows))
+
+    def pair_sums(self, s0, s1):
+        """
+        return predicted reward sums of (N, 2) s0 and s1 segments
+        """
+        return self.index.pair_sums(s0, s1)
 
 
 def compare_trajectory_rewards(
@@ -19,12 +42,9 @@ def compare_trajectory_rewards(
     exp_name,
     pair_algo,
     reward_model_algo,
-    models: List[RewardModelBase],
+    reward_table: RewardTable,
 ):
     dataset = load_dataset(env_name)
-    observations = dataset["observations"]
-    actions = dataset["actions"]
-    rewards = dataset["rewards"]
 
     pairs = load_pair(
         env_name=env_name, exp_name=exp_name, pair_type="train", pair_algo=pair_algo
@@ -38,43 +58,20 @@ def compare_trajectory_rewards(
         log_file="Trajectory.png",
     )
 
-    trajectories = []
-    for pair in pairs:
-        trajectories.append(pair[0])
-        trajectories.append(pair[1])
-
-    actual_reward_sum = []
-    predicted_reward_sum = []
-
-    for s, e in trajectories:
-        obs = observations[s:e]
-        act = actions[s:e]
-        reward = rewards[s:e]
-
-        actual_reward_sum.append(np.sum(reward))
-
-        obs_tensor = torch.tensor(obs, dtype=torch.float32).to(device)
-        act_tensor = torch.tensor(act, dtype=torch.float32).to(device)
+    # s0, s1 of every pair in order
+    trajectories = np.stack((pairs["s0"], pairs["s1"]), axis=1).reshape(-1, 2)
+    starts, ends = trajectories[:, 0], trajectories[:, 1]
 
-        with torch.no_grad():
-            predicted_rewards_list = []
-            for model in models:
-                predicted_rewards = model.batched_forward_trajectory(
-                    obs_batch=obs_tensor, act_batch=act_tensor
-                )
-                predicted_rewards_list.append(predicted_rewards)
-
-            mean_predicted_rewards = torch.mean(
-                torch.stack(predicted_rewards_list), dim=0
-            )
-
-        predicted_reward_sum.append(
-            torch.sum(mean_predicted_rewards, dim=0).squeeze().cpu().numpy()
-        )
+    actual_reward_sum = RewardPrefixIndex.from_dataset(dataset).segment_sums(
+        starts, ends
+    )
+    predicted_reward_sum = reward_table.index.segment_sums(starts, ends)
 
-        output_name = output_path.split(".png")[0]
+    output_name = output_path.split(".png")[0]
 
-    pearson_corr, _ = pearsonr(actual_reward_sum, predicted_reward_sum)
+    pearson_corr = (
+        PearsonAccumulator().update(actual_reward_sum, predicted_reward_sum).result()
+    )
 
     plt.figure(figsize=(8, 6))
     plt.scatter(actual_reward_sum, predicted_reward_sum, alpha=0.3, label=output_name)
@@ -93,40 +90,45 @@ def compare_trajectory_rewards(
 
 
 def calculate_pearson_correlation_from_dataset(
-    env_name, models: List[RewardModelBase], output_path
+    env_name, reward_table: RewardTable, output_path, chunk_rows=DEFAULT_CHUNK_ROWS
 ):
+    """
+    pcc of predicted and actual rewards of non terminal steps, streamed by chunks
+    the scatter plot shows every k-th step, at most SCATTER_MAX_POINTS
+    """
     dataset = load_dataset(env_name)
 
-    observations = dataset["observations"]
-    actions = dataset["actions"]
-    rewards = dataset["rewards"]
-    termainals = dataset["terminals"] | dataset["timeouts"]
+    num_steps = len(dataset["rewards"])
+    stride = max(1, -(-num_steps // SCATTER_MAX_POINTS))
 
-    obs_tensor = torch.tensor(observations, dtype=torch.float32).to(device)
-    act_tensor = torch.tensor(actions, dtype=torch.float32).to(device)
+    pearson = PearsonAccumulator()
+    plot_actual, plot_predicted = [], []
 
-    with torch.no_grad():
-        predicted_rewards_list = []
-        for model in models:
-            predicted_rewards = model.batched_forward_trajectory(
-                obs_batch=obs_tensor, act_batch=act_tensor
-            )
-            predicted_rewards_list.append(predicted_rewards)
+    for start in range(0, num_steps, chunk_rows):
+        end = min(start + chunk_rows, num_steps)
+        termainals = dataset["terminals"][start:end] | dataset["timeouts"][start:end]
+        actual_rewards = dataset["rewards"][start:end][~termainals]
+        predicted_rewards = reward_table.rewards[start:end][~termainals]
 
-        mean_predicted_rewards = torch.mean(torch.stack(predicted_rewards_list), dim=0)
+        pearson.update(predicted_rewards, actual_rewards)
 
-    actual_rewards_np = rewards[~termainals]
-    mean_predicted_rewards_np = mean_predicted_rewards.cpu().numpy()[~termainals]
+        # same global every k-th step regardless of chunk boundaries
+        sampled = slice((-start) % stride, None, stride)
+        plot_actual.append(dataset["rewards"][start:end][sampled][~termainals[sampled]])
+        plot_predicted.append(
+            reward_table.rewards[start:end][sampled][~termainals[sampled]]
+        )
 
-    pearson_corr, _ = pearsonr(
-        mean_predicted_rewards_np.flatten(), actual_rewards_np.flatten()
-    )
+    pearson_corr = pearson.result()
 
     output_name = output_path.split(".png")[0]
 
     plt.figure(figsize=(8, 6))
     plt.scatter(
-        actual_rewards_np, mean_predicted_rewards_np, alpha=0.005, label=output_name
+        np.concatenate(plot_actual),
+        np.concatenate(plot_predicted),
+        alpha=0.005,
+        label=output_name,
     )
     plt.xlabel("Actual Rewards")
     plt.ylabel("Predicted Rewards")
@@ -141,65 +143,38 @@ def calculate_pearson_correlation_from_dataset(
 
 
 def evaluate_reward_model(
-    env_name, models: List[RewardModelBase], data_loader, output_path
+    env_name,
+    reward_table: RewardTable,
+    pairs,
+    output_path,
+    chunk_rows=DEFAULT_CHUNK_ROWS,
 ):
+    """
+    accuracy and MSE of predicted preferences of pairs, pcc of step rewards
+    preference of s1 is sigmoid of predicted reward sum difference
+    """
+    accuracy_metric = AccuracyAccumulator()
+    mse_metric = MSEAccumulator()
+
+    for start in range(0, len(pairs), chunk_rows):
+        chunk = pairs[start : start + chunk_rows]
+        sum_rewards_s0, sum_rewards_s1 = reward_table.pair_sums(
+            chunk["s0"], chunk["s1"]
+        )
+        mu = np.asarray(chunk["mu"], dtype=np.float64)
 
-    correct_predictions = 0
-    total_samples = 0
-    mse_loss = torch.nn.MSELoss()
-    cumulative_mse = 0
-
-    with torch.no_grad():
-        for batch in data_loader:
-            (
-                s0_obs_batch,
-                s0_act_batch,
-                s1_obs_batch,
-                s1_act_batch,
-                mu_batch,
-                mask0_batch,
-                mask1_batch,
-            ) = [x.to(device) for x in batch]
-
-            rewards_s0_list = []
-            rewards_s1_list = []
-
-            for model in models:
-
-                rewards_s0 = model.batched_forward_trajectory(
-                    s0_obs_batch, s0_act_batch
-                )
-                rewards_s1 = model.batched_forward_trajectory(
-                    s1_obs_batch, s1_act_batch
-                )
-
-                rewards_s0_list.append(rewards_s0 * (1 - mask0_batch))
-                rewards_s1_list.append(rewards_s1 * (1 - mask1_batch))
-
-            mean_rewards_s0 = torch.mean(torch.stack(rewards_s0_list), dim=0)
-            mean_rewards_s1 = torch.mean(torch.stack(rewards_s1_list), dim=0)
-
-            sum_rewards_s0 = torch.sum(mean_rewards_s0, dim=1)
-            sum_rewards_s1 = torch.sum(mean_rewards_s1, dim=1)
-
-            pred_probs_s1 = 1 / (1 + torch.exp(sum_rewards_s0 - sum_rewards_s1))
-
-            mu_batch = mu_batch.unsqueeze(1)
-
-            correct_predictions += torch.sum(
-                ((pred_probs_s1 < 0.5) & (mu_batch < 0.5))
-                | ((pred_probs_s1 >= 0.5) & (mu_batch >= 0.5))
-            ).item()
+        pred_probs_s1 = 1 / (1 + np.exp(sum_rewards_s0 - sum_rewards_s1))
 
-            mse_batch = mse_loss(pred_probs_s1, mu_batch)
-            cumulative_mse += mse_batch.item() * mu_batch.size(0)
+        accuracy_metric.update((pred_probs_s1 >= 0.5) == (mu >= 0.5))
+        mse_metric.update(pred_probs_s1, mu)
 
-            total_samples += mu_batch.size(0)
+    correct_predictions = accuracy_metric.correct
+    total_samples = accuracy_metric.count
 
-    accuracy = correct_predictions / total_samples if total_samples > 0 else 0
-    avg_mse = cumulative_mse / total_samples if total_samples > 0 else 0
+    accuracy = accuracy_metric.result()
+    avg_mse = mse_metric.result()
     pearson_corr = calculate_pearson_correlation_from_dataset(
-        env_name, models, output_path=output_path
+        env_name, reward_table, output_path=output_path, chunk_rows=chunk_rows
     )
 
     print(f"Correct predictions: {correct_predictions}")
@@ -233,16 +208,13 @@ def evaluate_and_log_reward_models(
     )
     model_files = glob.glob(model_path_pattern)
 
-    data_loader = get_dataloader(
-        env_name=env_name,
-        exp_name=exp_name,
-        pair_type="test",
-        pair_algo="full-binary",
-        drop_last=False,
-        shuffle=False,
+    test_pairs = load_pair(
+        env_name=env_name, exp_name=exp_name, pair_type="test", pair_algo="full-binary"
     )
 
-    obs_dim, act_dim = data_loader.dataset.get_dimensions()
+    dataset = load_dataset(env_name)
+    obs_dim = dataset["observations"].shape[1]
+    act_dim = dataset["actions"].shape[1]
 
     models = []
 
@@ -272,18 +244,21 @@ def evaluate_and_log_reward_models(
         log_file="PCC.png",
     )
 
+    # one pass over the dataset answers every segment sum below
+    reward_table = RewardTable.from_models(dataset, models)
+
     compare_trajectory_rewards(
         env_name=env_name,
         exp_name=exp_name,
         pair_algo=pair_algo,
         reward_model_algo=reward_model_algo,
-        models=models,
+        reward_table=reward_table,
     )
 
     accuracy, mse, pcc = evaluate_reward_model(
         env_name=env_name,
-        models=models,
-        data_loader=data_loader,
+        reward_table=reward_table,
+        pairs=test_pairs,
         output_path=output_path,
     )
 
@@ -3,9 +3,16 @@ import os
 from matplotlib import pyplot as plt
 import numpy as np
 import torch
-from data_generation import RNNModel, LSTMModel
-from data_loading import get_dataloader, load_pair, load_dataset
+from data_generation import RNNModel, LSTMModel, EnsembleScorer, RewardPrefixIndex
+from data_loading import (
+    batch_to_device,
+    mask_to_lengths,
+    get_dataloader,
+    load_pair,
+    load_dataset,
+)
 from utils import get_score_model_path, get_score_model_log_path
+from helper.metrics import AccuracyAccumulator, PearsonAccumulator
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -15,6 +22,7 @@ def evaluate_score_model(env_name, exp_name, pair_algo, test_pair_type, test_pai
         exp_name=exp_name,
         pair_type=test_pair_type,
         pair_algo=test_pair_algo,
+        batch_size=1024,
         shuffle=False,
         drop_last=False,
     )
@@ -59,10 +67,26 @@ def evaluate_score_model(env_name, exp_name, pair_algo, test_pair_type, test_pai
         
         model.eval()
         models.append(model)
-    
 
+    scorer = EnsembleScorer(models)
+
+    dataset = load_dataset(env_name)
+    pairs = load_pair(
+        env_name=env_name,
+        exp_name=exp_name,
+        pair_type=test_pair_type,
+        pair_algo=test_pair_algo,
+    )
+    reward_sum_0, reward_sum_1 = RewardPrefixIndex.from_dataset(dataset).pair_sums(
+        pairs["s0"], pairs["s1"]
+    )
+    # interleave as (s0, s1) per pair, same order as scores of each batch
+    reward_sum_list = np.stack((reward_sum_0, reward_sum_1), axis=1).reshape(-1)
+
+    accuracy = AccuracyAccumulator()
+    pearson = PearsonAccumulator()
     score_list = []
-    answer_count = 0
+    score_offset = 0
 
     filtered_s0_scores = []
     filtered_s1_scores = []
@@ -77,41 +101,40 @@ def evaluate_score_model(env_name, exp_name, pair_algo, test_pair_type, test_pai
                 mu_batch,
                 mask0_batch,
                 mask1_batch,
-            ) = [x.to(device) for x in batch]
+            ) = batch_to_device(batch, device)
 
             s0_batch = torch.cat((s0_obs_batch, s0_act_batch), dim=-1)
             s1_batch = torch.cat((s1_obs_batch, s1_act_batch), dim=-1)
 
-            lengths_s0 = (1 - mask0_batch.squeeze()).sum(dim=1)
-            lengths_s1 = (1 - mask1_batch.squeeze()).sum(dim=1)
-
-            condition = (lengths_s0 > 0) & (lengths_s1 > 0)
+            lengths_s0 = mask_to_lengths(mask0_batch)
+            lengths_s1 = mask_to_lengths(mask1_batch)
 
-            s0_score_list = []
-            s1_score_list = []
+            if lengths_s0 is None:
+                condition = torch.ones(len(mu_batch), dtype=torch.bool, device=device)
+            else:
+                condition = (lengths_s0 > 0) & (lengths_s1 > 0)
 
-            for model in models:
-                s0_score = model(s0_batch, lengths_s0)
-                s1_score = model(s1_batch, lengths_s1)
-
-                s0_score_list.append(s0_score)
-                s1_score_list.append(s1_score)
-            
-            s0_score = torch.stack(s0_score_list, dim=1).mean(dim=1)
-            s1_score = torch.stack(s1_score_list, dim=1).mean(dim=1)
+            # ensemble mean of (E, B) scores, shape of (B, 1)
+            s0_score = scorer(s0_batch, lengths_s0).mean(dim=0).unsqueeze(1)
+            s1_score = scorer(s1_batch, lengths_s1).mean(dim=0).unsqueeze(1)
 
             filtered_s0_scores.extend(s0_score[condition].detach().cpu().numpy())
             filtered_s1_scores.extend(s1_score[condition].detach().cpu().numpy())
 
-            scores = torch.cat((s0_score, s1_score), dim=1)
-            score_list.append(scores.detach().cpu().numpy())
+            # (B, 2) -> (2B,) scores, pairs are loaded in order
+            scores = torch.cat((s0_score, s1_score), dim=1).cpu().numpy().reshape(-1)
+            pearson.update(
+                reward_sum_list[score_offset : score_offset + len(scores)], scores
+            )
+            score_offset += len(scores)
+            score_list.append(scores)
 
             mu_batch = mu_batch.unsqueeze(1)
 
             condition = ((s0_score <= s1_score) & (0.5 <= mu_batch)) | (
                 (s0_score >= s1_score) & (0.5 >= mu_batch)
             )
-            answer_count += torch.sum(condition).item()
+            accuracy.update(condition)
 
     # Plotting the relationship between s0_score and s1_score
     plt.figure(figsize=(8, 6))
@@ -135,23 +158,8 @@ def evaluate_score_model(env_name, exp_name, pair_algo, test_pair_type, test_pai
 
     # Plotting the relationship between score and sum of rewards
     score_list = np.concatenate(score_list, axis=0)
-    score_list = np.concatenate(score_list, axis=0)
-
-    dataset = load_dataset(env_name)
-    pairs = load_pair(
-        env_name=env_name,
-        exp_name=exp_name,
-        pair_type=test_pair_type,
-        pair_algo=test_pair_algo,
-    )
-    reward_sum_list = []
-    for s0, s1, _ in pairs:
-        reward_sum_0 = np.sum(dataset["rewards"][s0[0] : s0[1]])
-        reward_sum_1 = np.sum(dataset["rewards"][s1[0] : s1[1]])
-        reward_sum_list.append(reward_sum_0)
-        reward_sum_list.append(reward_sum_1)
 
-    pearson_corr = np.corrcoef(reward_sum_list, score_list)[0, 1]
+    pearson_corr = pearson.result()
 
     label = f"{env_name}: {exp_name}, {pair_algo}"
     plt.figure(figsize=(8, 6))
@@ -194,7 +202,7 @@ def evaluate_score_model(env_name, exp_name, pair_algo, test_pair_type, test_pai
                 ]
             )
 
-        formatted_accuracy = f"{answer_count/len(data_loader.dataset):.4f}"
+        formatted_accuracy = f"{accuracy.result():.4f}"
         formatted_pcc = f"{pearson_corr:.4f}"
 
         writer.writerow(
@@ -0,0 +1,156 @@
+import math
+import numpy as np
+
+
+def as_flat_array(values):
+    """
+    return values as 1-D float64 array, torch tensors are moved to cpu
+    """
+    if hasattr(values, "detach"):
+        values = values.detach().cpu().numpy()
+    return np.asarray(values, dtype=np.float64).reshape(-1)
+
+
+class MeanVarAccumulator:
+    """
+    Welford running mean and variance of a stream of values
+    batches and partial accumulators are combined with the parallel update of
+    Chan et al., so the result does not depend on how values are chunked
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        values = as_flat_array(values)
+        if len(values) == 0:
+            return self
+
+        batch = MeanVarAccumulator()
+        batch.count = len(values)
+        batch.mean = float(values.mean())
+        batch.m2 = float(np.sum((values - batch.mean) ** 2))
+        return self.merge(batch)
+
+    def merge(self, other):
+        count = self.count + other.count
+        if count == 0:
+            return self
+
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        return self
+
+    def result(self, ddof=0):
+        """
+        return (mean, variance), nan if there are not enough values
+        """
+        if self.count - ddof <= 0:
+            return math.nan, math.nan
+        return self.mean, self.m2 / (self.count - ddof)
+
+
+class PearsonAccumulator:
+    """
+    Pearson correlation of paired streams from running means and co-moments
+    """
+
+    def __init__(self):
+        self.x = MeanVarAccumulator()
+        self.y = MeanVarAccumulator()
+        self.co_moment = 0.0
+
+    @property
+    def count(self):
+        return self.x.count
+
+    def update(self, x, y):
+        x, y = as_flat_array(x), as_flat_array(y)
+        if len(x) != len(y):
+            raise ValueError(f"Length mismatch: {len(x)} != {len(y)}")
+        if len(x) == 0:
+            return self
+
+        batch = PearsonAccumulator()
+        batch.x.update(x)
+        batch.y.update(y)
+        batch.co_moment = float(np.sum((x - batch.x.mean) * (y - batch.y.mean)))
+        return self.merge(batch)
+
+    def merge(self, other):
+        count = self.count + other.count
+        if count == 0:
+            return self
+
+        delta_x = other.x.mean - self.x.mean
+        delta_y = other.y.mean - self.y.mean
+        self.co_moment += (
+            other.co_moment + delta_x * delta_y * self.count * other.count / count
+        )
+        self.x.merge(other.x)
+        self.y.merge(other.y)
+        return self
+
+    def result(self):
+        """
+        return correlation coefficient, nan if either stream is constant
+        """
+        denominator = math.sqrt(self.x.m2 * self.y.m2)
+        if denominator == 0:
+            return math.nan
+        return self.co_moment / denominator
+
+
+class AccuracyAccumulator:
+    """
+    Fraction of correct predictions, updated with boolean batches
+    """
+
+    def __init__(self):
+        self.correct = 0
+        self.count = 0
+
+    def update(self, correct):
+        correct = as_flat_array(correct)
+        self.correct += int(np.count_nonzero(correct))
+        self.count += len(correct)
+        return self
+
+    def merge(self, other):
+        self.correct += other.correct
+        self.count += other.count
+        return self
+
+    def result(self):
+        return self.correct / self.count if self.count > 0 else 0
+
+
+class MSEAccumulator:
+    """
+    Mean squared error between predictions and targets
+    """
+
+    def __init__(self):
+        self.squared_error = 0.0
+        self.count = 0
+
+    def update(self, predictions, targets):
+        predictions, targets = as_flat_array(predictions), as_flat_array(targets)
+        if len(predictions) != len(targets):
+            raise ValueError(f"Length mismatch: {len(predictions)} != {len(targets)}")
+
+        self.squared_error += float(np.sum((predictions - targets) ** 2))
+        self.count += len(predictions)
+        return self
+
+    def merge(self, other):
+        self.squared_error += other.squared_error
+        self.count += other.count
+        return self
+
+    def result(self):
+        return self.squared_error / self.count if self.count > 0 else 0
@@ -2,6 +2,7 @@ import csv
 import os
 from matplotlib import pyplot as plt
 import numpy as np
+from data_generation import RewardPrefixIndex
 from data_loading import load_dataset, load_pair
 from utils import get_pair_log_path
 
@@ -48,24 +49,8 @@ def evaluate_pair(env_name, exp_name, pair_type, pair_algo):
     answer_count = 0
     total_count = 0
 
-    cumulative_rewards = np.cumsum(dataset["rewards"], dtype=np.float64)
-
-    def segment_sum(start, end):
-        return cumulative_rewards[end - 1] - (
-            cumulative_rewards[start - 1] if start > 0 else 0
-        )
-
-    s0_starts = np.array([s0[0] for s0, _, _ in data])
-    s0_ends = np.array([s0[1] for s0, _, _ in data])
-    s1_starts = np.array([s1[0] for _, s1, _ in data])
-    s1_ends = np.array([s1[1] for _, s1, _ in data])
-
-    rewards_sum_0 = np.array(
-        [segment_sum(start, end) for start, end in zip(s0_starts, s0_ends)]
-    )
-    rewards_sum_1 = np.array(
-        [segment_sum(start, end) for start, end in zip(s1_starts, s1_ends)]
-    )
+    reward_index = RewardPrefixIndex.from_dataset(dataset)
+    rewards_sum_0, rewards_sum_1 = reward_index.pair_sums(data["s0"], data["s1"])
 
     mu_values = np.where(rewards_sum_0 < rewards_sum_1, 1.0, 0.0)
 
@@ -1,77 +1,79 @@
 import glob
 from typing import List
-import torch
 import numpy as np
 
-from data_loading import load_dataset
-from reward_learning import MR, RewardModelBase
-from utils import get_reward_model_path, get_new_dataset_path
-
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
+from data_loading import load_dataset, save_reward_sidecar
+from data_loading.load_data import get_dataset_paths
+from reward_learning import MR, RewardModelBase, predict_step_rewards
+from utils import (
+    Stage,
+    get_reward_model_path,
+    get_new_dataset_path,
+    get_new_rewards_path,
+    report_dry_run,
+)
+
+
+def relabel_rewards(
+    dataset,
+    model_list: List[RewardModelBase],
+    rewards_path,
+    chunk_rows=None,
+    chunk_bytes=None,
+):
+    """
+    Write mean reward of model_list for every step into a float32 .npy memmap.
 
-def change_reward(env_name, model_list: List[RewardModelBase], dataset_path):
+    Returns:
+        np.memmap of shape (num_samples,): rewards
+    """
+    rewards = np.lib.format.open_memmap(
+        rewards_path,
+        mode="w+",
+        dtype=np.float32,
+        shape=(len(dataset["observations"]),),
+    )
+    predict_step_rewards(
+        dataset, model_list, out=rewards, chunk_rows=chunk_rows, chunk_bytes=chunk_bytes
+    )
+    rewards.flush()
+    return rewards
+
+
+def change_reward(
+    env_name,
+    model_list: List[RewardModelBase],
+    dataset_path,
+    rewards_path,
+    chunk_rows=None,
+    chunk_bytes=None,
+):
+    """
+    relabel rewards of the dataset of env_name into rewards_path
+    and save a reward sidecar pointing to the base dataset to dataset_path
+    """
     dataset = load_dataset(env_name)
 
-    num_samples = len(dataset["observations"])
-    batch_size = num_samples // 20
-    model_outputs = []
-
-    for start_idx in range(0, num_samples, batch_size):
-        end_idx = min(start_idx + batch_size, num_samples)
-
-        obs_batch = torch.tensor(
-            dataset["observations"][start_idx:end_idx], dtype=torch.float32
-        ).to(device)
-        act_batch = torch.tensor(
-            dataset["actions"][start_idx:end_idx], dtype=torch.float32
-        ).to(device)
-
-        batch_model_outputs = []
-        for model in model_list:
-            rewards = model.batched_forward_trajectory(
-                obs_batch=obs_batch, act_batch=act_batch
-            )
-            batch_model_outputs.append(rewards.detach().cpu().numpy())
-
-        batch_predicted_rewards = np.mean(batch_model_outputs, axis=0)
-        model_outputs.append(batch_predicted_rewards)
-
-    predicted_rewards = np.concatenate(model_outputs, axis=0).squeeze()
-
-    terminals = dataset["terminals"] | dataset["timeouts"]
-    observations = dataset["observations"]
-    actions = dataset["actions"]
-    rewards = predicted_rewards
-
-    print(
-        observations.shape,
-        actions.shape,
-        rewards.shape,
-        terminals.shape,
+    relabel_rewards(
+        dataset,
+        model_list,
+        rewards_path,
+        chunk_rows=chunk_rows,
+        chunk_bytes=chunk_bytes,
     )
 
-    save_data = {
-        "observations": observations,
-        "actions": actions,
-        "rewards": rewards,
-        "terminals": terminals,
-    }
+    save_reward_sidecar(dataset_path, env_name, rewards_path)
 
-    np.savez(dataset_path, **save_data)
 
-
-def change_reward_from_all_datasets(env_name, exp_name, pair_algo, reward_model_algo):
+def change_reward_from_all_datasets(
+    env_name, exp_name, pair_algo, reward_model_algo, chunk_rows=None, chunk_bytes=None
+):
     """
-    change reward and save it to new_dataset_path
+    change reward and save its sidecar to new_dataset_path
     use all reward models in model/{env_name}/reward/{dataset_name}_*.pth
+    skipped if the dataset was made from the current models and dataset
+    chunk_rows or chunk_bytes sets the number of steps relabeled at once
     """
-
-    dataset = load_dataset(env_name)
-    obs_dim = dataset["observations"].shape[1]
-    act_dim = dataset["actions"].shape[1]
-
-    print("obs_dim:", obs_dim, "act_dim:", act_dim)
     model_path_pattern = get_reward_model_path(
         env_name=env_name,
         exp_name=exp_name,
@@ -79,7 +81,30 @@ def change_reward_from_all_datasets(env_name, exp_name, pair_algo, reward_model_
         reward_model_algo=reward_model_algo,
         reward_model_tag="*",
     )
-    model_files = glob.glob(model_path_pattern)
+    model_files = sorted(glob.glob(model_path_pattern))
+    new_dataset_path = get_new_dataset_path(
+        env_name, exp_name, pair_algo, reward_model_algo
+    )
+    new_rewards_path = get_new_rewards_path(
+        env_name, exp_name, pair_algo, reward_model_algo
+    )
+
+    stage = Stage(
+        f"changed dataset {reward_model_algo}",
+        outputs=[new_dataset_path, new_rewards_path],
+        files=[get_dataset_paths(env_name)[0]] + model_files,
+        params={"reward_model_algo": reward_model_algo},
+        code=["policy_learning/change_reward.py", "reward_learning"],
+    )
+
+    if report_dry_run([stage]) or not stage.needs_run():
+        return
+
+    dataset = load_dataset(env_name)
+    obs_dim = dataset["observations"].shape[1]
+    act_dim = dataset["actions"].shape[1]
+
+    print("obs_dim:", obs_dim, "act_dim:", act_dim)
     model_list = []
 
     if reward_model_algo == "MR":
@@ -98,10 +123,12 @@ def change_reward_from_all_datasets(env_name, exp_name, pair_algo, reward_model_
             )
             model_list.append(model)
 
-    new_dataset_path = get_new_dataset_path(
-        env_name, exp_name, pair_algo, reward_model_algo
-    )
-
     change_reward(
-        env_name=env_name, model_list=model_list, dataset_path=new_dataset_path
+        env_name=env_name,
+        model_list=model_list,
+        dataset_path=new_dataset_path,
+        rewards_path=new_rewards_path,
+        chunk_rows=chunk_rows,
+        chunk_bytes=chunk_bytes,
     )
+    stage.record()
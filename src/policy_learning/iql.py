@@ -10,8 +10,14 @@ from offlinerlkit.utils.load_dataset import qlearning_dataset
 from offlinerlkit.buffer import ReplayBuffer
 from offlinerlkit.utils.logger import Logger
 
-from data_loading import get_env
-from utils import get_new_dataset_path, get_policy_model_path
+from data_loading import get_env, load_relabeled_dataset
+from utils import (
+    Stage,
+    get_new_dataset_path,
+    get_new_rewards_path,
+    get_policy_model_path,
+    report_dry_run,
+)
 
 
 def get_configs():
@@ -120,21 +126,35 @@ def train(
 ):
     """
     Train IQL policy on the given dataset
+    skipped if the policy was trained on the current dataset with the same configs
     """
     policy_dir = get_policy_model_path(env_name, exp_name, pair_algo, reward_model_algo)
+    dataset_path = get_new_dataset_path(
+        env_name, exp_name, pair_algo, reward_model_algo
+    )
+    rewards_path = get_new_rewards_path(
+        env_name, exp_name, pair_algo, reward_model_algo
+    )
+
+    configs = get_configs()
+    stage = Stage(
+        f"policy {reward_model_algo}",
+        outputs=[policy_dir],
+        files=[dataset_path, rewards_path],
+        params={key: value for key, value in configs.items() if key != "device"},
+        code=["policy_learning/iql.py"],
+    )
+
+    if report_dry_run([stage]) or not stage.needs_run():
+        return
 
     # import gym lazyly to reduce the overhead
     from offlinerlkit.policy_trainer import MFPolicyTrainer  # pylint: disable=C0415
     from offlinerlkit.policy import IQLPolicy  # pylint: disable=C0415
 
-    configs = get_configs()
     # create env and dataset
     env = get_env(env_name, is_hidden=False)
-    dataset_path = get_new_dataset_path(
-        env_name, exp_name, pair_algo, reward_model_algo
-    )
-    dataset_npz = np.load(dataset_path)
-    dataset = {key: dataset_npz[key] for key in dataset_npz}
+    dataset = load_relabeled_dataset(env_name, exp_name, pair_algo, reward_model_algo)
     dataset = qlearning_dataset(env, dataset=dataset)
     if "antmaze" in env_name:
         dataset["rewards"] -= 1.0
@@ -275,3 +295,4 @@ def train(
 
     # train
     policy_trainer.train()
+    stage.record()
@@ -6,6 +6,7 @@ import torch.nn.functional as F
 import torch.optim as optim
 from tqdm import tqdm
 
+from data_loading import apply_mask, batch_to_device
 from reward_learning.reward_model_base import RewardModelBase
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -79,7 +80,7 @@ class MR(RewardModelBase):
                     mu_batch,
                     mask0_batch,
                     mask1_batch,
-                ) = [x.to(device) for x in batch]
+                ) = batch_to_device(batch, device)
 
                 rewards_s0 = self(s0_obs_batch, s0_act_batch)
                 rewards_s1 = self(s1_obs_batch, s1_act_batch)
@@ -127,7 +128,7 @@ class MR(RewardModelBase):
                     mu_batch,
                     mask0_batch,
                     mask1_batch,
-                ) = [x.to(device) for x in batch]
+                ) = batch_to_device(batch, device)
 
                 rewards_s0 = self(s0_obs_batch, s0_act_batch)
                 rewards_s1 = self(s1_obs_batch, s1_act_batch)
@@ -186,8 +187,8 @@ class BradleyTerryLoss(nn.Module):
         self.cross_entropy_loss = nn.BCELoss()
 
     def forward(self, rewards_s0, rewards_s1, mu, mask0, mask1):
-        reward_s0_sum = torch.sum(rewards_s0 * (1 - mask0), dim=1)
-        reward_s1_sum = torch.sum(rewards_s1 * (1 - mask1), dim=1)
+        reward_s0_sum = torch.sum(apply_mask(rewards_s0, mask0), dim=1)
+        reward_s1_sum = torch.sum(apply_mask(rewards_s1, mask1), dim=1)
 
         prob_s1_wins = torch.sigmoid(reward_s1_sum - reward_s0_sum)
         prob_s1_wins = prob_s1_wins.squeeze()
@@ -203,8 +204,8 @@ class LinearLoss(nn.Module):
 
     def forward(self, rewards_s0, rewards_s1, mu, mask0, mask1):
         # Apply mask0 and mask1 to compute masked reward sums
-        reward_s0_sum = torch.sum(rewards_s0 * (1 - mask0), dim=1)
-        reward_s1_sum = torch.sum(rewards_s1 * (1 - mask1), dim=1)
+        reward_s0_sum = torch.sum(apply_mask(rewards_s0, mask0), dim=1)
+        reward_s1_sum = torch.sum(apply_mask(rewards_s1, mask1), dim=1)
 
         linear_ratio = (reward_s1_sum) / (reward_s1_sum + reward_s0_sum + 1e-6)
         linear_ratio = linear_ratio.squeeze()
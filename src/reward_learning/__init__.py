@@ -1,9 +1,13 @@
 from .MR import MR
+from .ensemble_mr import EnsembleMR
 from .reward_model_base import RewardModelBase
+from .predict_rewards import predict_step_rewards
 from .train_model import train_reward_model
 
 __all__ = [
     "MR",
+    "EnsembleMR",
     "RewardModelBase",
+    "predict_step_rewards",
     "train_reward_model",
 ]
@@ -0,0 +1,201 @@
+import csv
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.optim as optim
+from tqdm import tqdm
+
+from data_loading import apply_mask, batch_to_device
+from reward_learning.MR import MR
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+class EnsembleLinear(nn.Module):
+    """
+    E independent linear layers with weight (E, in, out) and bias (E, 1, out)
+    (N, in) inputs are shared by every member, (E, N, in) inputs are per member
+    """
+
+    def __init__(self, linears):
+        super(EnsembleLinear, self).__init__()
+
+        with torch.no_grad():
+            self.weight = nn.Parameter(
+                torch.stack([linear.weight.t() for linear in linears])
+            )
+            self.bias = nn.Parameter(
+                torch.stack([linear.bias for linear in linears]).unsqueeze(1)
+            )
+
+    def forward(self, x):
+        if x.dim() == 2:
+            return torch.matmul(x, self.weight) + self.bias
+        return torch.baddbmm(self.bias, x, self.weight)
+
+    def member_state_dict(self, member_num):
+        """
+        return state dict of one member, loadable by nn.Linear
+        """
+        return {
+            "weight": self.weight[member_num].detach().t().clone(),
+            "bias": self.bias[member_num, 0].detach().clone(),
+        }
+
+
+class EnsembleMR(nn.Module):
+    """
+    MR members with layers stacked on the ensemble dim, trained together on
+    shared batches, every member is saved to its own path as an MR state dict
+    """
+
+    @staticmethod
+    def initialize(config, paths, linear_loss=False):
+        lr = config.get("lr", 0.001)
+
+        members = [
+            MR(
+                config={
+                    "obs_dim": config.get("obs_dim"),
+                    "act_dim": config.get("act_dim"),
+                    "hidden_size": config.get("hidden_size", 256),
+                },
+                path=path,
+                linear_loss=linear_loss,
+            )
+            for path in paths
+        ]
+
+        model = EnsembleMR(members).to(device)
+        optimizer = optim.Adam(model.parameters(), lr=lr)
+        return model, optimizer
+
+    def __init__(self, members):
+        super(EnsembleMR, self).__init__()
+
+        self.linear_loss = members[0].linear_loss
+        self.paths = [member.path for member in members]
+        self.log_paths = [member.log_path for member in members]
+
+        # initialized as MR does, each member from its own draw
+        self.hidden_layer_1 = EnsembleLinear(
+            [member.hidden_layer_1 for member in members]
+        )
+        self.hidden_layer_2 = EnsembleLinear(
+            [member.hidden_layer_2 for member in members]
+        )
+        self.fc = EnsembleLinear([member.fc for member in members])
+
+    def forward(self, obs_t, act_t):
+        """
+        return (E, *batch_shape, 1) rewards of every member
+        """
+        combined = torch.cat([obs_t, act_t], dim=-1)
+        batch_shape = combined.shape[:-1]
+
+        combined = F.relu(self.hidden_layer_1(combined.reshape(-1, combined.shape[-1])))
+        combined = F.relu(self.hidden_layer_2(combined))
+
+        reward_t = self.fc(combined)
+        if self.linear_loss:
+            reward_t = 1 + torch.tanh(reward_t)
+        else:
+            reward_t = torch.tanh(reward_t)
+        return reward_t.view(len(self.paths), *batch_shape, 1)
+
+    def member_state_dict(self, member_num):
+        """
+        return state dict of one member, loadable by MR
+        """
+        state_dict = {}
+        for name in ["hidden_layer_1", "hidden_layer_2", "fc"]:
+            layer = getattr(self, name)
+            for key, value in layer.member_state_dict(member_num).items():
+                state_dict[f"{name}.{key}"] = value
+        return state_dict
+
+    def member_losses(self, batch):
+        """
+        return (E,) loss of every member on batch, the loss of MR.train_model
+        """
+        (
+            s0_obs_batch,
+            s0_act_batch,
+            s1_obs_batch,
+            s1_act_batch,
+            mu_batch,
+            mask0_batch,
+            mask1_batch,
+        ) = batch_to_device(batch, device)
+
+        # (E, B, T, 1) rewards summed over steps of each segment
+        reward_s0_sum = torch.sum(
+            apply_mask(self(s0_obs_batch, s0_act_batch), mask0_batch), dim=2
+        ).squeeze(-1)
+        reward_s1_sum = torch.sum(
+            apply_mask(self(s1_obs_batch, s1_act_batch), mask1_batch), dim=2
+        ).squeeze(-1)
+
+        if self.linear_loss:
+            prob_s1_wins = reward_s1_sum / (reward_s1_sum + reward_s0_sum + 1e-6)
+        else:
+            prob_s1_wins = torch.sigmoid(reward_s1_sum - reward_s0_sum)
+
+        return F.binary_cross_entropy(
+            prob_s1_wins, mu_batch.expand_as(prob_s1_wins), reduction="none"
+        ).mean(dim=1)
+
+    def evaluate(self, data_loader):
+        """
+        return (E,) mean batch loss of each member
+        """
+        self.eval()
+        epoch_loss = torch.zeros(len(self.paths), device=device)
+        num_batches = 0
+
+        with torch.no_grad():
+            for batch in data_loader:
+                epoch_loss += self.member_losses(batch)
+                num_batches += 1
+
+        return epoch_loss / num_batches
+
+    def train_model(self, optimizer, train_loader, val_loader, num_epochs):
+        """
+        Train every member on the same batches, members share no parameters so
+        the summed loss trains each on its own loss as MR.train_model does
+        last member states are saved, as MR does
+        """
+        for path, log_path in zip(self.paths, self.log_paths):
+            print("[Train started] reward_model_path:", path)
+            with open(log_path, mode="w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(["Epoch", "Train Loss", "Validation Loss"])
+
+        for epoch in tqdm(range(num_epochs), desc="learning MR reward ensemble"):
+            self.train()
+            epoch_loss = torch.zeros(len(self.paths), device=device)
+
+            for batch in train_loader:
+                member_loss = self.member_losses(batch)
+
+                optimizer.zero_grad()
+                member_loss.sum().backward()
+                optimizer.step()
+
+                epoch_loss += member_loss.detach()
+
+            avg_epoch_loss = (epoch_loss / len(train_loader)).tolist()
+            val_loss = self.evaluate(data_loader=val_loader).tolist()
+
+            for member_num, log_path in enumerate(self.log_paths):
+                with open(log_path, mode="a", newline="") as file:
+                    writer = csv.writer(file)
+                    writer.writerow(
+                        [epoch + 1, avg_epoch_loss[member_num], val_loss[member_num]]
+                    )
+
+        for member_num, path in enumerate(self.paths):
+            torch.save(self.member_state_dict(member_num), path)
+
+        print("Training completed")
@@ -0,0 +1,84 @@
+import time
+from typing import List
+import numpy as np
+import torch
+
+from reward_learning.reward_model_base import RewardModelBase
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+# rows predicted at once if no chunk size is given
+DEFAULT_CHUNK_ROWS = 65536
+
+
+def get_chunk_rows(dataset, chunk_rows=None, chunk_bytes=None):
+    """
+    return rows per chunk, chunk_bytes bounds float32 observations and actions
+    of one chunk
+    """
+    if chunk_bytes is not None:
+        row_bytes = 4 * (dataset["observations"].shape[1] + dataset["actions"].shape[1])
+        return max(1, chunk_bytes // row_bytes)
+    return chunk_rows or DEFAULT_CHUNK_ROWS
+
+
+def predict_step_rewards(
+    dataset,
+    models: List[RewardModelBase],
+    out=None,
+    chunk_rows=None,
+    chunk_bytes=None,
+):
+    """
+    Mean reward of models for every step of dataset, rewards depend on (obs, act)
+    only. Steps are read and scored chunk by chunk, memory does not grow with dataset.
+
+    Args:
+        out: float32 array of shape (num_samples,) to write into, e.g. a memmap
+
+    Returns:
+        np array of float32 with shape (num_samples,): rewards
+    """
+    if not models:
+        raise ValueError("No reward model to predict rewards with")
+
+    num_samples = len(dataset["observations"])
+    chunk_rows = get_chunk_rows(dataset, chunk_rows, chunk_bytes)
+
+    if out is None:
+        out = np.empty(num_samples, dtype=np.float32)
+
+    for model in models:
+        model.eval()
+
+    start_time = time.perf_counter()
+
+    with torch.inference_mode():
+        for start_idx in range(0, num_samples, chunk_rows):
+            end_idx = min(start_idx + chunk_rows, num_samples)
+
+            obs_batch = torch.tensor(
+                dataset["observations"][start_idx:end_idx],
+                dtype=torch.float32,
+                device=device,
+            )
+            act_batch = torch.tensor(
+                dataset["actions"][start_idx:end_idx],
+                dtype=torch.float32,
+                device=device,
+            )
+
+            reward_sum = 0
+            for model in models:
+                reward_sum = reward_sum + model.batched_forward_trajectory(
+                    obs_batch=obs_batch, act_batch=act_batch
+                ).reshape(-1)
+
+            out[start_idx:end_idx] = (reward_sum / len(models)).cpu().numpy()
+
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"Predicted rewards of {num_samples} rows with {len(models)} models "
+        f"in {elapsed:.1f}s, {num_samples / max(elapsed, 1e-9):.0f} rows/s"
+    )
+    return out
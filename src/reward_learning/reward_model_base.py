@@ -4,6 +4,8 @@ import torch
 import torch.nn as nn
 from tqdm import tqdm
 
+from data_loading import batch_to_device
+
 
 class RewardModelBase(nn.Module):
     def __init__(self, config, path):
@@ -26,7 +28,7 @@ class RewardModelBase(nn.Module):
 
         with torch.no_grad():
             for batch in data_loader:
-                batch = [x.to(next(self.parameters()).device) for x in batch]
+                batch = batch_to_device(batch, next(self.parameters()).device)
                 outputs = self(*batch)
 
                 loss = loss_fn(*outputs)
@@ -59,7 +61,7 @@ class RewardModelBase(nn.Module):
             epoch_loss = 0.0
 
             for batch in train_data_loader:
-                batch = [x.to(next(self.parameters()).device) for x in batch]
+                batch = batch_to_device(batch, next(self.parameters()).device)
                 optimizer.zero_grad()
 
                 # Forward and loss computation
@@ -1,14 +1,73 @@
 from data_loading import get_dataloader
-from reward_learning.MR import MR
-from utils import get_reward_model_path
+from data_loading.load_data import get_dataset_paths
+from reward_learning.ensemble_mr import EnsembleMR
+from utils import Stage, get_pair_path, get_reward_model_path, report_dry_run
+
+
+def get_reward_model_tags(reward_model_tag):
+    """
+    return list of tags from a tag, a comma separated string of tags or a list
+    """
+    if isinstance(reward_model_tag, str):
+        reward_model_tag = reward_model_tag.split(",")
+    tags = [tag.strip() for tag in reward_model_tag if tag.strip()]
+    if len(tags) == 0:
+        raise ValueError(f"Invalid reward model tag: {reward_model_tag}")
+    return tags
 
 
 def train_reward_model(
     env_name, exp_name, pair_algo, reward_model_algo, reward_model_tag, num_epoch
 ):
     """
-    train reward model
+    train reward model of every tag of reward_model_tag, e.g. "00,01,02"
+    members are stacked into one model sharing dataloaders and batches,
+    and each is saved to its own reward model path
+    members trained on the current pairs with the same settings are skipped
     """
+    if reward_model_algo not in ["MR", "MR-linear"]:
+        return
+
+    stages = []
+    for tag in get_reward_model_tags(reward_model_tag):
+        reward_model_path = get_reward_model_path(
+            env_name=env_name,
+            exp_name=exp_name,
+            pair_algo=pair_algo,
+            reward_model_algo=reward_model_algo,
+            reward_model_tag=tag,
+        )
+
+        stages.append(
+            Stage(
+                f"reward model {reward_model_algo}_{tag}",
+                outputs=[reward_model_path],
+                files=[get_dataset_paths(env_name)[0]]
+                + [
+                    get_pair_path(env_name, exp_name, pair_type, pair_algo)
+                    for pair_type in ["train", "val"]
+                ],
+                params={
+                    "reward_model_algo": reward_model_algo,
+                    "reward_model_tag": tag,
+                    "num_epoch": num_epoch,
+                },
+                code=["reward_learning", "data_loading"],
+                adopt_existing=True,
+            )
+        )
+
+    if report_dry_run(stages):
+        return
+
+    stages = [stage for stage in stages if stage.needs_run()]
+    if len(stages) == 0:
+        return
+
+    # a model trained on older inputs would be loaded and trained further
+    for stage in stages:
+        stage.remove_outputs()
+
     train_data_loader = get_dataloader(
         env_name=env_name,
         exp_name=exp_name,
@@ -27,35 +86,18 @@ def train_reward_model(
 
     print("obs_dim:", obs_dim, "act_dim:", act_dim)
 
-    reward_model_path = get_reward_model_path(
-        env_name=env_name,
-        exp_name=exp_name,
-        pair_algo=pair_algo,
-        reward_model_algo=reward_model_algo,
-        reward_model_tag=reward_model_tag,
+    model, optimizer = EnsembleMR.initialize(
+        config={"obs_dim": obs_dim, "act_dim": act_dim},
+        paths=[stage.outputs[0] for stage in stages],
+        linear_loss=reward_model_algo == "MR-linear",
     )
 
-    if reward_model_algo == "MR":
-        model, optimizer = MR.initialize(
-            config={"obs_dim": obs_dim, "act_dim": act_dim},
-            path=reward_model_path,
-            skip_if_exists=True,
-        )
-    elif reward_model_algo == "MR-linear":
-        model, optimizer = MR.initialize(
-            config={"obs_dim": obs_dim, "act_dim": act_dim},
-            path=reward_model_path,
-            linear_loss=True,
-            skip_if_exists=True,
-        )
-    else:
-        model = None
-        optimizer = None
-
-    if model is not None:
-        model.train_model(
-            train_loader=train_data_loader,
-            val_loader=val_data_loader,
-            optimizer=optimizer,
-            num_epochs=num_epoch,
-        )
+    model.train_model(
+        train_loader=train_data_loader,
+        val_loader=val_data_loader,
+        optimizer=optimizer,
+        num_epochs=num_epoch,
+    )
+
+    for stage in stages:
+        stage.record()
@@ -6,10 +6,12 @@ from .path import (
     get_reward_model_path,
     get_reward_model_log_path,
     get_new_dataset_path,
+    get_new_rewards_path,
     get_new_dataset_log_path,
     get_policy_model_path,
     get_policy_model_log_path,
 )
+from .manifest import Stage, is_dry_run, report_dry_run, set_dry_run
 
 __all__ = [
     "get_pair_path",
@@ -19,7 +21,12 @@ __all__ = [
     "get_reward_model_path",
     "get_reward_model_log_path",
     "get_new_dataset_path",
+    "get_new_rewards_path",
     "get_new_dataset_log_path",
     "get_policy_model_path",
     "get_policy_model_log_path",
+    "Stage",
+    "is_dry_run",
+    "report_dry_run",
+    "set_dry_run",
 ]
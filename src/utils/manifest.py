@@ -0,0 +1,248 @@
+import glob
+import hashlib
+import json
+import os
+
+
+MANIFEST_SUFFIX = ".manifest.json"
+# result of Stage.get_changes for outputs without manifest that are adopted
+ADOPT_EXISTING = "adopt existing outputs"
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+dry_run_state = {"enabled": False, "pending_outputs": set()}
+
+# sha256 of files keyed by (absolute path, (mtime, size)), computed once per process
+file_hashes = {}
+code_versions = {}
+
+
+def get_file_signature(path):
+    """
+    return (mtime, size) of path, None if path does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def hash_file(path, signature=None):
+    """
+    return sha256 of file content, None if path does not exist
+    """
+    signature = signature or get_file_signature(path)
+    if signature is None:
+        return None
+
+    key = (os.path.abspath(path), tuple(signature))
+    if key not in file_hashes:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        file_hashes[key] = digest.hexdigest()
+
+    return file_hashes[key]
+
+
+def hash_value(value):
+    """
+    return sha256 of json encoded value, dict keys are sorted
+    """
+    encoded = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def get_code_version(sources):
+    """
+    return sha256 of .py files of sources, packages or files relative to src/
+    """
+    sources = tuple(sorted(sources))
+    if sources not in code_versions:
+        paths = []
+        for source in sources:
+            path = os.path.join(SOURCE_ROOT, source)
+            if os.path.isdir(path):
+                pattern = os.path.join(path, "**", "*.py")
+                paths.extend(glob.glob(pattern, recursive=True))
+            else:
+                paths.append(path)
+
+        digest = hashlib.sha256()
+        for path in sorted(paths):
+            digest.update(os.path.relpath(path, SOURCE_ROOT).encode("utf-8"))
+            digest.update((hash_file(path) or "").encode("utf-8"))
+        code_versions[sources] = digest.hexdigest()
+
+    return code_versions[sources]
+
+
+def set_dry_run(enabled):
+    """
+    In dry run, stages only report whether they would be recomputed
+    """
+    dry_run_state["enabled"] = enabled
+    dry_run_state["pending_outputs"].clear()
+
+
+def is_dry_run():
+    return dry_run_state["enabled"]
+
+
+class Stage:
+    """
+    Step of the pipeline producing output files from input files and params
+    a manifest next to the first output records hashes of the inputs it was built
+    from (files, params, code version), the stage runs only when they change
+
+    adopt_existing records a manifest for outputs built before manifests existed
+    instead of recomputing them, for sampled pairs and trained models
+    """
+
+    def __init__(
+        self, name, outputs, files=(), params=None, code=(), adopt_existing=False
+    ):
+        self.name = name
+        self.outputs = list(outputs)
+        self.files = list(files)
+        self.params = params or {}
+        self.code = list(code)
+        self.adopt_existing = adopt_existing
+        self.inputs = None
+
+    @property
+    def manifest_path(self):
+        return self.outputs[0].rstrip("/") + MANIFEST_SUFFIX
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def get_inputs(self, recorded_files=None):
+        """
+        return current signature and hash of every input
+        files with the recorded signature are not hashed again
+        """
+        recorded_files = recorded_files or {}
+        files = {}
+        for path in self.files:
+            signature = get_file_signature(path)
+            recorded = recorded_files.get(path)
+            if recorded is not None and recorded["signature"] == signature:
+                file_hash = recorded["hash"]
+            else:
+                file_hash = hash_file(path, signature)
+            files[path] = {"signature": signature, "hash": file_hash}
+
+        return {
+            "files": files,
+            "params": hash_value(self.params),
+            "code": get_code_version(self.code),
+        }
+
+    def get_changes(self):
+        """
+        return reasons to recompute the stage, empty if outputs are up to date,
+        ADOPT_EXISTING if outputs without manifest are adopted, nothing is written
+        """
+        manifest = self.load_manifest()
+        recorded = manifest["inputs"] if manifest is not None else None
+        self.inputs = self.get_inputs(recorded["files"] if recorded else None)
+
+        changes = [
+            f"missing output {path}"
+            for path in self.outputs
+            if not os.path.exists(path)
+        ]
+        for path, current in self.inputs["files"].items():
+            if current["hash"] is None:
+                changes.append(f"missing input {path}")
+            elif os.path.abspath(path) in dry_run_state["pending_outputs"]:
+                changes.append(f"input {path} is recomputed")
+
+        if changes:
+            return changes
+
+        if recorded is None:
+            return ADOPT_EXISTING if self.adopt_existing else ["no manifest"]
+
+        for path, current in self.inputs["files"].items():
+            if recorded["files"].get(path, {}).get("hash") != current["hash"]:
+                changes.append(f"changed input {path}")
+        if recorded["params"] != self.inputs["params"]:
+            changes.append("changed params")
+        if recorded["code"] != self.inputs["code"]:
+            changes.append("changed code")
+
+        return changes
+
+    def needs_run(self):
+        """
+        return True and print reasons if the stage has to be recomputed
+        adopted outputs get a manifest recorded, except in dry run
+        in dry run, pending outputs are remembered so later stages see the change
+        """
+        changes = self.get_changes()
+        if changes == ADOPT_EXISTING:
+            print(f"{self.name}: adopting existing outputs")
+            if not is_dry_run():
+                self.record()
+            return False
+
+        if not changes:
+            print(f"{self.name}: up to date")
+            return False
+
+        if is_dry_run():
+            print(f"{self.name}: would recompute ({'; '.join(changes)})")
+            dry_run_state["pending_outputs"].update(
+                os.path.abspath(path) for path in self.outputs
+            )
+            return False
+
+        print(f"{self.name}: recomputing ({'; '.join(changes)})")
+        return True
+
+    def remove_outputs(self):
+        """
+        remove stale output files, so steps that skip existing files rebuild them
+        """
+        for path in self.outputs:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def record(self):
+        """
+        write manifest of the inputs read by get_changes, call after outputs are saved
+        """
+        if self.inputs is None:
+            self.inputs = self.get_inputs()
+
+        manifest = {
+            "stage": self.name,
+            "outputs": self.outputs,
+            "inputs": self.inputs,
+            "params": self.params,
+            "code_sources": self.code,
+        }
+
+        temp_path = f"{self.manifest_path}.tmp-{os.getpid()}"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=2, sort_keys=True, default=str)
+        os.replace(temp_path, self.manifest_path)
+
+
+def report_dry_run(stages):
+    """
+    In dry run, print which stages would be recomputed and return True
+    """
+    if not is_dry_run():
+        return False
+
+    for stage in stages:
+        stage.needs_run()
+    return True
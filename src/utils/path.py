@@ -99,9 +99,18 @@ def get_reward_model_log_path(
 
 def get_new_dataset_path(env_name, exp_name, pair_algo, reward_model_algo):
     """
-    Return path of new dataset file
+    Return path of new dataset file, a reward sidecar of the base dataset
     """
-    path = f"dataset/{env_name}/{exp_name}/{pair_algo}/{reward_model_algo}.npz"
+    path = f"dataset/{env_name}/{exp_name}/{pair_algo}/{reward_model_algo}.json"
+    make_dir_from_path(path)
+    return path
+
+
+def get_new_rewards_path(env_name, exp_name, pair_algo, reward_model_algo):
+    """
+    Return path of relabeled rewards .npy file of new dataset
+    """
+    path = f"dataset/{env_name}/{exp_name}/{pair_algo}/{reward_model_algo}.rewards.npy"
     make_dir_from_path(path)
     return path
 